@@ -0,0 +1,529 @@
+#  Copyright 2022 Lorenzo Pichetti lori.pichi@gmail.com
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from LatexGraph import *
+
+from array import array
+from collections.abc import Mapping
+import numpy as np
+
+
+class CompactLatexGraph(LatexGraph):
+    """
+    A CompactLatexGraph is a LatexGraph that stores its vertices and edges in contiguous arrays instead of a dictionary
+    of LatexVertex objects. It is meant for very big figures, where the dict-of-objects layout costs hundreds of bytes
+    per edge. The methods 'addVertex', 'addEdge', 'getVertex' and the iteration over the graph keep working: they
+    return lightweight CompactVertex views on the arrays.
+    Beside the LatexGraph's parameters, it is composed by:
+        -----------
+        > ids and index : [str, ...] and {str: int}
+            The i-th vertex of the graph has id 'ids[i]'; 'index' is the inverse map from the id to i.
+
+        > positions : numpy.ndarray (numVertices x 2)
+            The i-th row contains the position of the i-th vertex.
+
+        > names and vertex_styles : {int: str} and array of int
+            The names are stored only for the vertices which have one; the styles are ids of the graph's
+            StyleRegistry 'styles' (-1 means that the vertex uses the graph's 'node_style').
+
+        > indptr, indices, weights, and edge_styles : numpy.ndarray
+            The adjacency in CSR form: the out-edges of the i-th vertex are the slots indptr[i]:indptr[i+1] of the other
+            three arrays, ordered as they were inserted. Edge styles are ids of 'styles' (-1 means that the edge
+            uses 'edges_style'). The new edges are appended to a buffer and merged in the CSR arrays only when
+            they are read, so that 'addEdge' costs O(1).
+        -----------
+    """
+
+    def __init__(self, fp= None):
+        LatexGraph.__init__(self, fp)
+        self.clear()
+
+    def clear(self):
+        LatexGraph.clear(self)
+        self.ids = []
+        self.index = {}
+        self.names = {}
+        self.vertex_styles = array('i')
+
+        self._positions = np.zeros((16, 2))
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._indices = np.zeros(0, dtype=np.int32)
+        self._weights = np.zeros(0)
+        self._edge_styles = np.zeros(0, dtype=np.int32)
+        self._pending_src = array('i')
+        self._pending_dst = array('i')
+        self._pending_w = array('d')
+        self._pending_sty = array('i')
+        self._nkit_src = array('i')
+        self._nkit_dst = array('i')
+
+        self.vertices = CompactVertexMap(self)
+
+    # ---------------- Internal storage ---------------------
+    def styleIndex(self, style):
+        """ It returns the id of 'style' in the graph's StyleRegistry; 'None' is mapped to -1 """
+        return self.styles.intern(style)
+
+    def styleName(self, i):
+        """ It is the inverse of 'styleIndex' """
+        return self.styles.name(i)
+
+    @property
+    def positions(self):
+        return self._positions[:self.numVertices]
+
+    def _flush(self):
+        """ This function merges the buffered edges in the CSR arrays, keeping only the last version of repeated edges """
+        n = self.numVertices
+        if len(self._pending_dst) == 0:
+            if len(self._indptr) != n + 1:
+                self._indptr = np.concatenate((self._indptr, np.full(n + 1 - len(self._indptr), self._indptr[-1])))
+            return
+
+        old_src = np.repeat(np.arange(len(self._indptr) - 1, dtype=np.int64), np.diff(self._indptr))
+        src = np.concatenate((old_src, np.frombuffer(self._pending_src, dtype=np.int32)))
+        dst = np.concatenate((self._indices, np.frombuffer(self._pending_dst, dtype=np.int32)))
+        w   = np.concatenate((self._weights, np.frombuffer(self._pending_w, dtype=np.float64)))
+        sty = np.concatenate((self._edge_styles, np.frombuffer(self._pending_sty, dtype=np.int32)))
+
+        # An edge added twice behaves like a dict update: it keeps its first position and its last values
+        key = src * max(n, 1) + dst
+        order = np.argsort(key, kind='stable')
+        sorted_key = key[order]
+        starts = np.flatnonzero(np.concatenate(([True], sorted_key[1:] != sorted_key[:-1])))
+        ends = np.concatenate((starts[1:], [len(order)])) - 1
+        first = order[starts]
+        last = order[ends]
+        keep = np.lexsort((first, src[first]))
+
+        self._indices = dst[last[keep]].astype(np.int32)
+        self._weights = w[last[keep]]
+        self._edge_styles = sty[last[keep]].astype(np.int32)
+        self._indptr = np.concatenate(([0], np.cumsum(np.bincount(src[first[keep]], minlength=n)))).astype(np.int64)
+
+        self._pending_src = array('i')
+        self._pending_dst = array('i')
+        self._pending_w = array('d')
+        self._pending_sty = array('i')
+
+    def csr(self):
+        """ It returns the arrays (indptr, indices, weights, edge_styles) of the graph's adjacency """
+        self._flush()
+        return self._indptr, self._indices, self._weights, self._edge_styles
+
+    def numEdges(self):
+        self._flush()
+        return len(self._indices)
+
+    def edgeSlot(self, i, j):
+        """ It returns the CSR slot of the edge from the i-th to the j-th vertex (or None if it does not exist) """
+        self._flush()
+        row = self._indices[self._indptr[i]:self._indptr[i+1]]
+        found = np.flatnonzero(row == j)
+        if len(found) == 0:
+            return None
+        return int(self._indptr[i] + found[0])
+
+    # ---------------- Graph function ---------------------
+    def addVertex(self, key, position, name=None, color=None):
+        """
+        It works as LatexGraph.addVertex; adding an already existing key updates the position, name, and color of
+        the vertex keeping its edges.
+        """
+        key = vertexKey(key)
+        self.trackVertex(key)
+        i = self.index.get(key)
+        if i == None:
+            i = self.numVertices
+            if i == len(self._positions):
+                self._positions = np.concatenate((self._positions, np.zeros_like(self._positions)))
+            self.ids.append(key)
+            self.index[key] = i
+            self.vertex_styles.append(-1)
+            self.numVertices = i + 1
+
+        self._positions[i] = position
+        self.vertex_styles[i] = self.styleIndex(color)
+        if name != None:
+            self.names[i] = name
+        else:
+            self.names.pop(i, None)
+        return CompactVertex(self, i)
+
+    def addEdge(self, f, t, w=0, c=None):
+        """ It works as LatexGraph.addEdge, but the weight must be a number """
+        i = self.index[vertexKey(f)]
+        j = self.index[vertexKey(t)]
+        self._pending_src.append(i)
+        self._pending_dst.append(j)
+        self._pending_w.append(w)
+        self._pending_sty.append(self.styleIndex(c))
+        self.version += 1
+        if self.nkitGraph is not None:
+            self._nkit_src.append(i)
+            self._nkit_dst.append(j)
+
+    def indexArray(self, keys):
+        return np.fromiter((self.index[vertexKey(k)] for k in keys), dtype=np.int64)
+
+    def positionArray(self, keys= None):
+        if keys is None:
+            return self.positions.copy()
+        return self._positions[self.indexArray(keys)]
+
+    def setPositionArray(self, positions, keys= None):
+        if keys is None:
+            self._positions[:self.numVertices] = positions
+        else:
+            self._positions[self.indexArray(keys)] = positions
+
+    def addVerticesFromArrays(self, keys, positions, names= None):
+        """
+        It works as LatexGraph.addVerticesFromArrays, copying the positions in one block; as in 'addVertex', an
+        existing key keeps its edges.
+        """
+        keys = [vertexKey(k) for k in keys]
+        if len(set(keys)) != len(keys) or any(k in self.index for k in keys):
+            # the repeated and the existing keys are updated one at a time, as by 'addVertex'
+            if names is None:
+                names = [None] * len(keys)
+            for k, p, name in zip(keys, np.asarray(positions, dtype=float).tolist(), names):
+                self.addVertex(k, p, name)
+            return
+
+        n = self.numVertices
+        k = len(keys)
+        capacity = len(self._positions)
+        while capacity < n + k:
+            capacity *= 2
+        if capacity != len(self._positions):
+            self._positions = np.concatenate((self._positions, np.zeros((capacity - len(self._positions), 2))))
+        self._positions[n:n+k] = positions
+        self.ids.extend(keys)
+        self.index.update(zip(keys, range(n, n+k)))
+        self.vertex_styles.frombytes(np.full(k, -1, dtype=np.int32).tobytes())
+        if names is not None:
+            self.names.update((n + i, name) for i, name in enumerate(names) if name != None)
+        self.numVertices = n + k
+        self.version += 1
+
+    def addEdgesFromArrays(self, src, dst, weights= None):
+        """ It works as LatexGraph.addEdgesFromArrays, appending the edges to the buffer in one block """
+        src = np.asarray(src, dtype=np.int32)
+        dst = np.asarray(dst, dtype=np.int32)
+        if weights is None:
+            weights = np.zeros(len(src))
+        self._pending_src.frombytes(src.tobytes())
+        self._pending_dst.frombytes(dst.tobytes())
+        self._pending_w.frombytes(np.asarray(weights, dtype=np.float64).tobytes())
+        self._pending_sty.frombytes(np.full(len(src), -1, dtype=np.int32).tobytes())
+        self.version += 1
+        if self.nkitGraph is not None:
+            self._nkit_src.frombytes(src.tobytes())
+            self._nkit_dst.frombytes(dst.tobytes())
+
+    def getVertices(self):
+        return list(self.ids)
+
+    def __iter__(self):
+        return (CompactVertex(self, i) for i in range(self.numVertices))
+
+    def __contains__(self, n):
+        return vertexKey(n) in self.index
+
+    def changeId(self, old_name, new_name):
+        i = self.index.pop(old_name)
+        self.ids[i] = new_name
+        self.index[new_name] = i
+        self.version += 1
+
+    # ---------------- Networkit ---------------------
+    # The node i of 'nkitGraph' is always the i-th vertex, so 'nkitIds' and 'nkitIndex' are 'ids' and 'index'.
+
+    def trackVertex(self, key):
+        self.version += 1
+
+    def edgeArrays(self):
+        indptr, indices, weights, edge_styles = self.csr()
+        src = np.repeat(np.arange(self.numVertices, dtype=np.int64), np.diff(indptr))
+        return src, indices.astype(np.int64), weights.copy()
+
+    def edgeStyleArray(self):
+        edge_styles = self.csr()[3].astype(np.int64)
+        edge_styles[edge_styles < 0] = self.styles.intern(self.edges_style)
+        return edge_styles
+
+    def vertexContent(self):
+        vertex_styles = np.frombuffer(self.vertex_styles, dtype=np.int32)[:self.numVertices]
+        return sorted(self.names.items()), styleNamesArray(self.styles, vertex_styles)
+
+    def nkitPendingEdges(self):
+        return np.frombuffer(self._nkit_src, dtype=np.int32).astype(np.int64), np.frombuffer(self._nkit_dst, dtype=np.int32).astype(np.int64)
+
+    def updateNetworkitGraph(self, rebuild= False):
+        if self.nkitGraph is None or rebuild or self.nkitGraph.isDirected() != self.isDirected():
+            self.nkitGraph = networkitFromArrays(self.numVertices, *self.edgeArrays()[0:2], self.isDirected())
+        else:
+            new = self.numVertices - self.nkitGraph.upperNodeIdBound()
+            if new > 0:
+                self.nkitGraph.addNodes(new)
+            src, dst = self.nkitPendingEdges()
+            if len(src) > 0:
+                self.nkitGraph.addEdges((src, dst), checkMultiEdge=True)
+        self.nkitIds = self.ids
+        self.nkitIndex = self.index
+        self.nkitDirtyVertices = []
+        self._nkit_src = array('i')
+        self._nkit_dst = array('i')
+
+    # --------------------- Tikz functions -------------------------
+    # These functions yield the same code of the LatexGraph's ones, but they read the arrays in blocks of 'block' items
+    # instead of walking on the vertices' views.
+
+    def styleTable(self, default, used):
+        """
+        It returns the list of the styles' names with 'default' as last element (so that the id -1 selects it),
+        checking once the styles whose ids are in 'used'.
+        """
+        table = self.styles.names + [default]
+        for i in np.unique(used).tolist():
+            self.styles.check(table[i])
+        return table
+
+    def iter_nodes(self, prefix= "", visible= None, block= 1 << 14):
+        line = prefix + "\t\t\\node [style=%s] (%s) at (%1.3f,%1.3f) {%s};\n"
+        table = self.styleTable(self.node_style, np.frombuffer(self.vertex_styles, dtype=np.int32))
+        selected = np.arange(self.numVertices) if visible is None else np.nonzero(visible)[0]
+        for start in range(0, len(selected), block):
+            chunk = selected[start:start + block]
+            for i, (x, y) in zip(chunk.tolist(), self._positions[chunk].tolist()):
+                vertex_style = table[self.vertex_styles[i]]
+                name = self.names.get(i)
+                if name == None:
+                    vertex_string = ""
+                elif vertex_style != "black":
+                    vertex_string = "%s" % name
+                else:
+                    vertex_string = "\\color{white} %s" % name
+                yield line % (vertex_style, self.ids[i], x, y, vertex_string)
+
+    def iter_edges(self, prefix= "", visible= None, block= 1 << 16):
+        line = prefix + "\t\t\\draw [style=%s] (%s.center) %s (%s.center);\n"
+        visible = self.visibleEdges(visible)
+        if self.coalesce:
+            yield from self.iter_coalesced_edges(prefix, visible)
+            return
+        indptr, indices, weights, edge_styles = self.csr()
+        table = self.styleTable(self.edges_style, edge_styles)
+        custom_middle = type(self).edge_middle_string is not LatexGraph.edge_middle_string
+        src = np.repeat(np.arange(self.numVertices), np.diff(indptr))
+        if visible is not None:
+            src = src[visible]
+            indices = indices[visible]
+            edge_styles = edge_styles[visible]
+        ids = self.ids
+        for start in range(0, len(indices), block):
+            for f, t, s in zip(src[start:start + block].tolist(), indices[start:start + block].tolist(), edge_styles[start:start + block].tolist()):
+                if custom_middle:
+                    middle = self.edge_middle_string(CompactVertex(self, f), CompactVertex(self, t))
+                else:
+                    middle = "to"
+                yield line % (table[s], ids[f], middle, ids[t])
+
+    def setNodesStyles(self, styles, keys= None):
+        """ It works as LatexGraph.setNodesStyles, interning every distinct style once """
+        names, inverse = np.unique(np.asarray(styles, dtype=object), return_inverse=True)
+        ids = np.array([self.styleIndex(name) for name in names], dtype=np.int32)[inverse]
+        vertex_styles = np.frombuffer(self.vertex_styles, dtype=np.int32)
+        if keys is None:
+            vertex_styles[:len(ids)] = ids
+        else:
+            vertex_styles[self.indexArray(keys)] = ids
+
+    def memoryUsage(self):
+        """ It returns the number of bytes used by the arrays of the graph (the id strings are not counted) """
+        self._flush()
+        return (self._positions.nbytes + self._indptr.nbytes + self._indices.nbytes + self._weights.nbytes
+                + self._edge_styles.nbytes + self.vertex_styles.itemsize * len(self.vertex_styles))
+
+
+class CompactVertexMap(Mapping):
+    """ It is the read-only view used as 'vertices' dictionary by a CompactLatexGraph """
+    __slots__ = ('graph',)
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __getitem__(self, key):
+        return CompactVertex(self.graph, self.graph.index[key])
+
+    def __iter__(self):
+        return iter(self.graph.ids)
+
+    def __len__(self):
+        return self.graph.numVertices
+
+    def __contains__(self, key):
+        return key in self.graph.index
+
+
+class CompactVertex:
+    """
+    A CompactVertex is a view on the i-th vertex of a CompactLatexGraph with the same methods of a LatexVertex.
+    The field 'position' is a row of the graph's position array, so 'v.position[0] = x' moves the vertex.
+    """
+    __slots__ = ('graph', 'index')
+
+    def __init__(self, graph, index):
+        self.graph = graph
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, CompactVertex) and self.graph is other.graph and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.graph), self.index))
+
+    @property
+    def id(self):
+        return self.graph.ids[self.index]
+
+    @property
+    def position(self):
+        return self.graph._positions[self.index]
+
+    @position.setter
+    def position(self, position):
+        self.graph._positions[self.index] = position
+
+    @property
+    def name(self):
+        return self.graph.names.get(self.index)
+
+    @name.setter
+    def name(self, name):
+        if name != None:
+            self.graph.names[self.index] = name
+        else:
+            self.graph.names.pop(self.index, None)
+
+    @property
+    def style(self):
+        return self.graph.styleName(self.graph.vertex_styles[self.index])
+
+    @style.setter
+    def style(self, style):
+        self.graph.vertex_styles[self.index] = self.graph.styleIndex(style)
+
+    # Some functions (as 'vertexHighlight' and 'vertex_expansion') set the node style through 'color'
+    color = style
+
+    @property
+    def connectedTo(self):
+        return CompactAdjacency(self)
+
+    def addNeighbor(self, nbr, w=0, c=None):
+        self.graph.addEdge(self.id, nbr.id, w, c)
+
+    def setPosition(self, position):
+        self.position = position
+
+    def getPosition(self):
+        return self.position
+
+    def getConnections(self):
+        return self.connectedTo.keys()
+
+    def getWeight(self, nbr):
+        return self.connectedTo[nbr][0]
+
+    def getColor(self, nbr):
+        return self.connectedTo[nbr][1]
+
+    def __str__(self):
+        return str(self.id) + ":position " + str(list(self.position)) + "]\n"
+
+    def getId(self):
+        return self.id
+
+
+class CompactAdjacency(Mapping):
+    """ It is the view used as 'connectedTo' dictionary by a CompactVertex """
+    __slots__ = ('vertex',)
+
+    def __init__(self, vertex):
+        self.vertex = vertex
+
+    def _row(self):
+        G = self.vertex.graph
+        indptr, indices, weights, styles = G.csr()
+        return indices[indptr[self.vertex.index]:indptr[self.vertex.index + 1]]
+
+    def __getitem__(self, nbr):
+        slot = self.vertex.graph.edgeSlot(self.vertex.index, nbr.index)
+        if slot == None:
+            raise KeyError(nbr)
+        return CompactEdge(self.vertex.graph, slot)
+
+    def __setitem__(self, nbr, value):
+        self.vertex.graph.addEdge(self.vertex.id, nbr.id, value[0], value[1])
+
+    def __iter__(self):
+        G = self.vertex.graph
+        return (CompactVertex(G, int(j)) for j in self._row())
+
+    def items(self):
+        G = self.vertex.graph
+        indptr, indices, weights, styles = G.csr()
+        start = int(indptr[self.vertex.index])
+        return [(CompactVertex(G, int(j)), CompactEdge(G, start + k)) for k, j in enumerate(self._row())]
+
+    def __len__(self):
+        return len(self._row())
+
+
+class CompactEdge:
+    """ It is the [weight, color] couple of a CompactLatexGraph's edge; it writes back into the graph's arrays """
+    __slots__ = ('graph', 'slot')
+
+    def __init__(self, graph, slot):
+        self.graph = graph
+        self.slot = slot
+
+    def __getitem__(self, k):
+        if k == 0:
+            return float(self.graph._weights[self.slot])
+        if k == 1:
+            return self.graph.styleName(self.graph._edge_styles[self.slot])
+        raise IndexError(k)
+
+    def __setitem__(self, k, value):
+        if k == 0:
+            self.graph._weights[self.slot] = value
+        elif k == 1:
+            self.graph._edge_styles[self.slot] = self.graph.styleIndex(value)
+        else:
+            raise IndexError(k)
+
+    def __len__(self):
+        return 2
+
+    def __iter__(self):
+        return iter([self[0], self[1]])
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
@@ -14,6 +14,8 @@
 
 from LatexGraph import *
 
+import scipy.sparse
+
 def vertex_expansion(G, U, WU_col=None, out= True):
     V = set(G.getVertices())
     if U.issubset(V):
@@ -49,26 +51,390 @@ def vertex_expansion(G, U, WU_col=None, out= True):
         print ("U is not a subset of V")
         return
 
+# ------------------------------------------ Batched vertex expansion ---------------------------------------------
+# The k subsets U_0, ..., U_{k-1} are the columns of a (n x k) 0/1 membership matrix X (the rows are the vertices in
+#  the order of 'getVertices'); with the adjacency matrix A (A[i, j] = 1 if there is the edge i -> j) the boundaries
+#  are the columns of (A^T X > 0) and not X, so all the expansions are a sparse product and a column count.
+
+def membershipMatrix(G, subsets):
+    """ It returns the sparse (n x k) membership matrix of the k sets of ids 'subsets' """
+    index = {k: i for i, k in enumerate(G.getVertices())}
+    rows = [index[vertexKey(u)] for U in subsets for u in U]
+    cols = [c for c, U in enumerate(subsets) for u in U]
+    X = scipy.sparse.csc_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(len(index), len(subsets)))
+    X.sum_duplicates()
+    X.data[:] = 1
+    return X
+
+def transposedAdjacency(G):
+    """ It returns A^T as a sparse matrix, where A is the adjacency matrix of G in the order of 'getVertices' """
+    n = len(G.getVertices())
+    src, dst, weights = G.edgeArrays()
+    return scipy.sparse.csr_matrix((np.ones(len(src), dtype=np.int32), (dst, src)), shape=(n, n))
+
+def vertex_expansion_batch(G, X, chunk= 1024):
+    """
+    It returns the array of the vertex expansions |N(U) \ U| of the k subsets which are the columns of the membership
+    matrix X (a dense or sparse (n x k) 0/1 matrix, see 'membershipMatrix'), computing at most 'chunk' of them at a
+    time so that the memory stays bounded. Unlike 'vertex_expansion', it does not print anything.
+    """
+    AT = transposedAdjacency(G)
+    n, k = X.shape
+    if n != AT.shape[0]:
+        print("ERROR: X must have one row for every vertex of G")
+        raise ValueError()
+    sparse = scipy.sparse.issparse(X)
+    if sparse:
+        X = scipy.sparse.csc_matrix(X)
+    expansions = np.zeros(k, dtype=np.int64)
+    for start in range(0, k, chunk):
+        Xc = X[:, start:start + chunk]
+        if sparse:
+            Xc = (Xc != 0).astype(np.int32)
+            B = (AT @ Xc).tocsc()
+            B.eliminate_zeros()
+            inside = B.multiply(Xc).tocsc()
+            inside.eliminate_zeros()
+            expansions[start:start + Xc.shape[1]] = np.diff(B.indptr) - np.diff(inside.indptr)
+        else:
+            Xc = np.asarray(Xc) != 0
+            B = AT @ Xc.astype(np.int32)
+            expansions[start:start + Xc.shape[1]] = ((B > 0) & ~Xc).sum(axis=0)
+    return expansions
+
 import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 
 def findsubsets(s, n):
     return set(itertools.combinations(s, n))
 
-def vex(G, WU_col=None):
-    V = set(G.getVertices())
-    Ulist = set([])
-    for i in range(1, math.floor(len(V)/2)):
-        Ulist = Ulist.union(findsubsets(V, i))
+# ------------------------------------------ Exact vertex expansion -----------------------------------------------
+# 'vex' looks for the set U with 1 <= |U| < floor(n/2) which minimizes the (positive) vertex expansion |N(U) \ U|.
+#  The vertices are the bits of Python integers, so a set and its neighborhood are two ints and the expansion is a
+#  popcount. The subsets are visited depth-first, in the order of the combinations, and a branch is cut when the
+#  vertices of the boundary that can not be added any more (those before the last added one, plus those which exceed
+#  the remaining size) are already at least the best expansion found so far.
+
+def neighborMasks(G):
+    """ It returns the ids of the vertices of G and, for every vertex, the bitmask of its out-neighbors """
+    ids = G.getVertices()
+    index = {k: i for i, k in enumerate(ids)}
+    masks = []
+    for k in ids:
+        mask = 0
+        for u in G.getVertex(k).getConnections():
+            mask |= 1 << index[u.getId()]
+        masks.append(mask)
+    return ids, masks
+
+def greedyExpansion(masks, max_size):
+    """
+    It returns an upper bound (value, U) of the minimum positive expansion: from every vertex, the set grows by adding
+    the vertex which minimizes the expansion, and the best set met is kept.
+    """
+    n = len(masks)
+    best, best_U = n, 0
+    for first in range(0, n):
+        U, N = 1 << first, masks[first]
+        for size in range(1, max_size + 1):
+            t = (N & ~U).bit_count()
+            if 0 < t < best:
+                best, best_U = t, U
+            if size == max_size:
+                break
+            candidates = [(((N | masks[j]) & ~(U | 1 << j)).bit_count(), j) for j in range(0, n) if not U >> j & 1]
+            if len(candidates) == 0:
+                break
+            j = min(candidates)[1]
+            U, N = U | 1 << j, N | masks[j]
+    return best, best_U
 
+def vexSearch(masks, max_size, first, bound):
+    """
+    It returns the pair (value, U) of the set U (a bitmask) with smallest element 'first' and at most 'max_size'
+    vertices whose positive expansion is the minimum one below 'bound' (U is 0 if there is no such set).
+    """
+    n = len(masks)
+    best, best_U = bound, 0
+    stack = [(1 << first, masks[first], first, 1)]
+    while stack:
+        U, N, last, size = stack.pop()
+        B = N & ~U
+        t = B.bit_count()
+        if 0 < t < best:
+            best, best_U = t, U
+        free = max_size - size
+        if free == 0:
+            continue
+        absorbable = (B >> (last + 1)).bit_count()
+        if t - absorbable + max(0, absorbable - free) >= best:
+            continue
+        for j in range(n - 1, last, -1):
+            stack.append((U | 1 << j, N | masks[j], j, size + 1))
+    return best, best_U
+
+def vex(G, WU_col=None, workers=None):
+    """
+    It returns the set U of ids (with 1 <= |U| < floor(n/2)) with the minimum positive vertex expansion of G (see
+    'vertex_expansion'), printing its value; if WU_col = [W color, U color] is given, U and its boundary W are
+    colored. The search is split by the first vertex of U among 'workers' processes (by default one per CPU; the
+    small graphs are always solved in the calling process).
+    """
+    ids, masks = neighborMasks(G)
+    n = len(ids)
+    max_size = math.floor(n/2) - 1
+
+    vex = n
     Umin = None
-    vex = len(V)
-    for U in Ulist:
-        t = vertex_expansion( G, set(U), out=False )
-        if (t < vex) and (t > 0):
-            vex = t
-            Umin = set(U)
+    if max_size >= 1:
+        vex, U = greedyExpansion(masks, max_size)
+        if workers == None:
+            workers = os.cpu_count() or 1
+        results = []
+        if workers <= 1 or n < 24:
+            for first in range(0, n):
+                results.append((vexSearch(masks, max_size, first, vex + 1), first))
+                vex = min(vex, results[-1][0][0])
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = {}
+                first = 0
+                while first < n or pending:
+                    while first < n and len(pending) < 2 * workers:
+                        # the ties are searched too (bound vex + 1), so the result does not depend on the scheduling
+                        pending[pool.submit(vexSearch, masks, max_size, first, vex + 1)] = first
+                        first += 1
+                    done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+                    for f in done:
+                        results.append((f.result(), pending.pop(f)))
+                        vex = min(vex, results[-1][0][0])
+        found = [(value, first, U) for (value, U), first in results if U != 0 and value == vex]
+        if len(found) > 0:
+            U = min(found)[2]
+        if U != 0:
+            Umin = set(ids[i] for i in range(0, n) if U >> i & 1)
 
     print("vex = %d" % vex)
-    if WU_col != None:
+    if WU_col != None and Umin != None:
         vertex_expansion( G, Umin, WU_col, out=True )
     return(Umin)
+
+# ------------------------------------------ Expansion estimators -------------------------------------------------
+# For the graphs too big for 'vex', 'expansion_estimate' returns a set U (with 1 <= |U| < floor(n/2)) and two bounds
+#  lower <= vex <= upper, where upper is the expansion of U. U is the best one among the sweep cuts of the Fiedler
+#  vector, improved by a randomized local search. If the graph is symmetric (every edge has its reverse) the lower
+#  bound comes from the spectral gap lambda2 of the Laplacian L = D - A: every set U has at least
+#  lambda2 |U| (n - |U|) / n boundary edges, and so at least lambda2 |U| (n - |U|) / (n Delta) boundary vertices,
+#  where Delta is the maximum degree.
+
+import time
+import scipy.sparse.linalg
+from scipy.sparse.csgraph import connected_components
+
+def outAdjacency(G):
+    """ It returns the out-adjacency of G in CSR form (indptr, indices), in the order of 'getVertices' """
+    n = len(G.getVertices())
+    src, dst, weights = G.edgeArrays()
+    order = np.argsort(src, kind="stable")
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(src, minlength=n))))
+    return indptr, dst[order]
+
+def spectral_gap(G, tol= 1e-4, maxiter= 300, seed= 0):
+    """
+    It returns the triple (lambda2, residual, fiedler) of the Laplacian of the undirected graph underlying G (computed
+    with the Lanczos method on c I - L): lambda2 is 0 if the graph is disconnected, the residual bounds the error of
+    lambda2 (if Lanczos converged), and the Fiedler vector is the one of the largest connected component (0 on the
+    other vertices).
+    """
+    n = len(G.getVertices())
+    src, dst, weights = G.edgeArrays()
+    loops = src != dst
+    A = scipy.sparse.csr_matrix((np.ones(loops.sum()), (src[loops], dst[loops])), shape=(n, n))
+    A = ((A + A.T) > 0).astype(float)
+    count, labels = connected_components(A, directed=False)
+    fiedler = np.zeros(n)
+    if n < 3:
+        return 0.0, 0.0, fiedler
+    keep = np.flatnonzero(labels == np.argmax(np.bincount(labels)))
+    if len(keep) < 3:
+        return 0.0, 0.0, fiedler
+    A = A[keep][:, keep]
+    degree = np.asarray(A.sum(axis=1)).ravel()
+    c = 2 * degree.max()
+    M = (scipy.sparse.identity(len(keep)) * c - (scipy.sparse.diags(degree) - A)).tocsr()
+    v0 = 1 + 0.01 * np.random.default_rng(seed).standard_normal(len(keep))
+    try:
+        values, vectors = scipy.sparse.linalg.eigsh(M, k=2, which="LA", tol=tol, maxiter=maxiter, v0=v0)
+    except scipy.sparse.linalg.ArpackNoConvergence as e:
+        values, vectors = e.eigenvalues, e.eigenvectors
+        if len(values) < 2:
+            return 0.0, math.inf, fiedler
+    k = np.argmin(values)
+    residual = np.linalg.norm(M @ vectors[:, k] - values[k] * vectors[:, k])
+    fiedler[keep] = vectors[:, k]
+    lambda2 = c - values[k] if count == 1 else 0.0
+    return max(lambda2, 0.0), residual, fiedler
+
+def fiedler_sweep(G, fiedler, max_size= None):
+    """
+    It returns the pair (value, U) of the sweep cut with minimum positive expansion, as a boolean array U: the cuts are
+    the first k vertices (1 <= k <= max_size, by default floor(n/2) - 1) in the order of 'fiedler' and of '-fiedler'.
+    A vertex v is in the boundary of the first k vertices if it is not one of them and one of its in-neighbors is, so
+    the expansions of all the cuts are the prefix sums of a difference array.
+    """
+    n = len(fiedler)
+    if max_size == None:
+        max_size = math.floor(n/2) - 1
+    src, dst, weights = G.edgeArrays()
+    best, best_U = math.inf, None
+    for key in [fiedler, -fiedler]:
+        order = np.argsort(key, kind="stable")
+        position = np.empty(n, dtype=np.int64)
+        position[order] = np.arange(n)
+        first_in = np.full(n, n, dtype=np.int64)
+        np.minimum.at(first_in, dst, position[src])
+        # v is in the boundary of the first k vertices for first_in[v] < k <= position[v]
+        counted = first_in < position
+        delta = np.zeros(n + 2, dtype=np.int64)
+        np.add.at(delta, first_in[counted] + 1, 1)
+        np.add.at(delta, position[counted] + 1, -1)
+        expansion = np.cumsum(delta)[1:max_size + 1]
+        expansion[expansion == 0] = n + 1
+        if len(expansion) > 0 and expansion.min() < best:
+            k = int(np.argmin(expansion))
+            best = int(expansion[k])
+            best_U = np.zeros(n, dtype=bool)
+            best_U[order[:k + 1]] = True
+    return best, best_U
+
+def expansion_local_search(G, U, max_size= None, time_limit= 1.0, seed= 0):
+    """
+    It improves the set U (a boolean array) by moving single vertices in or out of it while the positive expansion
+    decreases, with random kicks when no move improves it, until 'time_limit' seconds have passed; it returns the pair
+    (value, U) of the best set found.
+    """
+    deadline = time.time() + time_limit
+    n = len(U)
+    if max_size == None:
+        max_size = math.floor(n/2) - 1
+    indptr, indices = outAdjacency(G)
+    rng = np.random.default_rng(seed)
+    out = [None] * n
+
+    def neighbors(x):
+        if out[x] == None:
+            out[x] = [v for v in indices[indptr[x]:indptr[x + 1]].tolist() if v != x]
+        return out[x]
+
+    members = set(np.flatnonzero(U).tolist())
+    src = np.repeat(np.arange(n), np.diff(indptr))
+    counted = U[src] & (src != indices)
+    count = np.bincount(indices[counted], minlength=n).tolist()
+    boundary = set(v for v in range(0, n) if count[v] > 0 and v not in members)
+
+    def gain(x):
+        """ the change of the expansion if x is moved in (or out of) U """
+        if x in members:
+            if len(members) == 1:
+                return None
+            return (count[x] > 0) - sum(1 for v in neighbors(x) if v not in members and count[v] == 1)
+        if len(members) >= max_size:
+            return None
+        return -(count[x] > 0) + sum(1 for v in neighbors(x) if v not in members and count[v] == 0)
+
+    def move(x):
+        if x in members:
+            members.remove(x)
+            for v in neighbors(x):
+                count[v] -= 1
+                if count[v] == 0 and v not in members:
+                    boundary.discard(v)
+            if count[x] > 0:
+                boundary.add(x)
+        else:
+            members.add(x)
+            boundary.discard(x)
+            for v in neighbors(x):
+                count[v] += 1
+                if count[v] == 1 and v not in members:
+                    boundary.add(v)
+
+    best, best_members = len(boundary) if len(boundary) > 0 else math.inf, set(members)
+    steps = 0
+    while time.time() < deadline:
+        improved = False
+        candidates = list(boundary) + list(members)
+        rng.shuffle(candidates)
+        for x in candidates:
+            steps += 1
+            if steps % 256 == 0 and time.time() >= deadline:
+                break
+            g = gain(x)
+            if g != None and g < 0 and len(boundary) + g > 0:
+                move(x)
+                improved = True
+        if 0 < len(boundary) < best:
+            best, best_members = len(boundary), set(members)
+        if not improved:
+            # kick: move a few random vertices of the boundary (or of U) and search again
+            for r in range(0, int(rng.integers(1, 4))):
+                pool = list(boundary) if len(members) < max_size and len(boundary) > 0 else list(members)
+                x = pool[int(rng.integers(0, len(pool)))]
+                if (x in members and len(members) > 1) or (x not in members and len(members) < max_size):
+                    move(x)
+            if len(members) == 0 or len(boundary) == 0:
+                for x in list(members):
+                    move(x)
+                move(next(iter(best_members)))
+    U = np.zeros(n, dtype=bool)
+    U[list(best_members)] = True
+    return best, U
+
+def expansion_estimate(G, WU_col=None, time_limit= 2.0, seed= 0):
+    """
+    It returns the triple (U, lower, upper) where U is the set of ids of the best set found (see the comment above),
+    upper is its expansion, and lower is a lower bound of 'vex(G)' (certified as long as the Lanczos method converged);
+    if WU_col = [W color, U color] is given, U and its boundary W are colored as in 'vex'. It spends about
+    'time_limit' seconds in the local search.
+    """
+    start = time.time()
+    ids = G.getVertices()
+    n = len(ids)
+    max_size = math.floor(n/2) - 1
+    if max_size < 1:
+        return None, n, n
+
+    lambda2, residual, fiedler = spectral_gap(G, seed= seed)
+    upper, U = fiedler_sweep(G, fiedler, max_size)
+
+    # the best single vertex
+    indptr, indices = outAdjacency(G)
+    src = np.repeat(np.arange(n), np.diff(indptr))
+    degree = np.bincount(src[src != indices], minlength=n)
+    degree[degree == 0] = n + 1
+    if degree.min() < upper:
+        upper = int(degree.min())
+        U = np.zeros(n, dtype=bool)
+        U[np.argmin(degree)] = True
+
+    if U is None:
+        return None, n, n
+    remaining = time_limit - (time.time() - start)
+    if remaining > 0:
+        value, V = expansion_local_search(G, U, max_size, remaining, seed)
+        if value < upper:
+            upper, U = value, V
+
+    lower = 1
+    AT = transposedAdjacency(G)
+    if (AT != AT.T).nnz == 0:
+        max_degree = np.diff(indptr).max()
+        certified = max(lambda2 - residual, 0) * (n - 1) / (n * max_degree)
+        lower = max(lower, math.ceil(certified - 1e-9))
+    lower = min(lower, upper)
+
+    Umin = set(ids[i] for i in np.flatnonzero(U).tolist())
+    if WU_col != None:
+        vertex_expansion( G, Umin, WU_col, out=False )
+    return Umin, lower, upper
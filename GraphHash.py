@@ -0,0 +1,274 @@
+#  Copyright 2022 Lorenzo Pichetti lori.pichi@gmail.com
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+Structural fingerprints of graphs, used by 'LatexGraph.structural_hash'. The hash depends only on the topology of the
+graph (not on the ids, the positions, or the styles), so isomorphic graphs have the same hash; it is computed with the
+Weisfeiler-Lehman color refinement: at every round the color of a vertex is replaced by a hash of its color and of the
+multiset of the colors of its neighbors, until the partition of the vertices in color classes stops changing.
+As in GraphLayout, the graph is given by the number of vertices n and the arrays (src, dst) of the edges.
+
+Different graphs may have the same hash (e.g. two regular graphs with the same degree and size), so 'isomorphism'
+checks exactly whether two graphs are isomorphic, by backtracking on the vertices with the same WL color.
+"""
+
+import numpy as np
+
+
+def splitmix64(x):
+    """ The SplitMix64 finalizer applied to every item of the uint64 array 'x' """
+    with np.errstate(over="ignore"):
+        x = np.asarray(x, dtype=np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+
+def multisetHash(values, salt= 0):
+    """ It returns an order-independent hash (an uint64) of the multiset of the items of 'values' """
+    with np.errstate(over="ignore"):
+        return splitmix64(splitmix64(values ^ np.uint64(salt)).sum(dtype=np.uint64))
+
+
+def simpleEdges(n, src, dst, directed):
+    """
+    It returns the arrays (src, dst) without the repeated edges; if the graph is undirected, every edge {u, v} is given
+    once as (min, max).
+    """
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    if not directed:
+        src, dst = np.minimum(src, dst), np.maximum(src, dst)
+    keys = np.unique(src * n + dst)
+    return keys // n, keys % n
+
+
+class NeighborSums:
+    """
+    It sums, for every vertex 'g[k]', the values of the vertices 'other[k]' (the neighbors along the edges grouped by
+    'g'); the edges are sorted once, so that every sum is one 'np.add.reduceat'.
+    """
+    def __init__(self, n, g, other):
+        order = np.argsort(g, kind="stable")
+        self.n = n
+        self.other = other[order]
+        indptr = np.searchsorted(g[order], np.arange(n + 1))
+        self.nonempty = indptr[1:] > indptr[:-1]
+        self.starts = indptr[:-1][self.nonempty]
+
+    def __call__(self, values):
+        sums = np.zeros(self.n, dtype=np.uint64)
+        if len(self.other) > 0:
+            with np.errstate(over="ignore"):
+                sums[self.nonempty] = np.add.reduceat(values[self.other], self.starts)
+        return sums
+
+
+def wlColors(n, src, dst, directed= False, iterations= None):
+    """
+    It runs the Weisfeiler-Lehman refinement on the simple graph with edges (src, dst) for at most 'iterations' rounds
+    (by default until the partition is stable) and returns the pair (colors, signature): the uint64 color of every
+    vertex, and an uint64 hash of the multisets of the colors of every round (which is the same for isomorphic graphs).
+    """
+    src, dst = simpleEdges(n, src, dst, directed)
+    if directed:
+        out_sums = NeighborSums(n, src, dst)
+        in_sums = NeighborSums(n, dst, src)
+        out_degree = np.bincount(src, minlength=n).astype(np.uint64)
+        in_degree = np.bincount(dst, minlength=n).astype(np.uint64)
+        colors = splitmix64((out_degree << np.uint64(32)) ^ in_degree)
+    else:
+        out_sums = NeighborSums(n, np.concatenate((src, dst)), np.concatenate((dst, src)))
+        in_sums = None
+        colors = splitmix64(np.bincount(np.concatenate((src, dst)), minlength=n).astype(np.uint64))
+
+    signature = splitmix64(np.array([n, len(src), directed], dtype=np.uint64)).sum(dtype=np.uint64)
+    signature = splitmix64(signature ^ multisetHash(colors))
+    classes = len(np.unique(colors))
+    rounds = n if iterations == None else iterations
+    for r in range(0, rounds):
+        hashed = splitmix64(colors ^ np.uint64(r + 1))
+        new_colors = splitmix64(colors ^ splitmix64(out_sums(hashed)))
+        if in_sums != None:
+            new_colors = splitmix64(new_colors ^ splitmix64(in_sums(hashed) ^ np.uint64(0x5bd1e995)))
+        new_classes = len(np.unique(new_colors))
+        if new_classes == classes:
+            break
+        colors = new_colors
+        classes = new_classes
+        signature = splitmix64(signature ^ multisetHash(colors, r + 1))
+    return colors, signature
+
+
+def structuralHash(n, src, dst, directed= False):
+    """ It returns the WL hash of the graph as a string of 16 hexadecimal digits """
+    return "%016x" % int(wlColors(n, src, dst, directed)[1])
+
+
+def adjacencySets(n, src, dst):
+    adjacency = [set() for i in range(0, n)]
+    for f, t in zip(src.tolist(), dst.tolist()):
+        adjacency[f].add(t)
+    return adjacency
+
+
+def searchOrder(n, adjacency, colors, class_size):
+    """
+    It returns the order in which the vertices are mapped: every connected component is visited in BFS order starting
+    from its vertex with the rarest color, so that every vertex (but the roots) has an already mapped neighbor.
+    """
+    order = []
+    seen = np.zeros(n, dtype=bool)
+    for root in sorted(range(0, n), key=lambda v: (class_size[colors[v]], colors[v])):
+        if seen[root]:
+            continue
+        seen[root] = True
+        queue = [root]
+        for v in queue:
+            order.append(v)
+            for u in sorted(adjacency[v], key=lambda u: class_size[colors[u]]):
+                if not seen[u]:
+                    seen[u] = True
+                    queue.append(u)
+    return order
+
+
+def isomorphism(n1, src1, dst1, n2, src2, dst2, directed= False, max_steps= None):
+    """
+    It returns an isomorphism between the graphs G1 = (n1, src1, dst1) and G2 = (n2, src2, dst2), as the array
+    'mapping' such that the vertex v of G1 is the vertex mapping[v] of G2, or None if they are not isomorphic (or if
+    the backtracking tried more than 'max_steps' assignments).
+    The colors of the WL refinement of the disjoint union of G1 and G2 restrict the candidates of every vertex.
+    """
+    src1, dst1 = simpleEdges(n1, src1, dst1, directed)
+    src2, dst2 = simpleEdges(n2, src2, dst2, directed)
+    if n1 != n2 or len(src1) != len(src2):
+        return None
+    colors = wlColors(n1 + n2, np.concatenate((src1, src2 + n1)), np.concatenate((dst1, dst2 + n1)), directed)[0]
+    colors1 = colors[:n1].tolist()
+    colors2 = colors[n1:].tolist()
+    if sorted(colors1) != sorted(colors2):
+        return None
+
+    if directed:
+        out1, in1 = adjacencySets(n1, src1, dst1), adjacencySets(n1, dst1, src1)
+        out2, in2 = adjacencySets(n2, src2, dst2), adjacencySets(n2, dst2, src2)
+        relations = [(out1, out2), (in1, in2)]
+    else:
+        sym1 = adjacencySets(n1, np.concatenate((src1, dst1)), np.concatenate((dst1, src1)))
+        sym2 = adjacencySets(n2, np.concatenate((src2, dst2)), np.concatenate((dst2, src2)))
+        relations = [(sym1, sym2)]
+
+    candidates = {}
+    for w, c in enumerate(colors2):
+        candidates.setdefault(c, []).append(w)
+    class_size = {c: len(ws) for c, ws in candidates.items()}
+    neighbors = [out1[v] | in1[v] for v in range(0, n1)] if directed else sym1
+    order = searchOrder(n1, neighbors, colors1, class_size)
+
+    mapping = [-1] * n1
+    used = [False] * n2
+
+    def feasible(v, w):
+        for adj1, adj2 in relations:
+            if (v in adj1[v]) != (w in adj2[w]):
+                return False
+            mapped = 0
+            for u in adj1[v]:
+                if mapping[u] >= 0:
+                    if mapping[u] not in adj2[w]:
+                        return False
+                    mapped += 1
+            if mapped != sum(1 for x in adj2[w] if used[x] and x != w):
+                return False
+        return True
+
+    steps = 0
+    depth = 0
+    iterators = [iter(candidates[colors1[order[0]]])] if n1 > 0 else []
+    while 0 <= depth < n1:
+        v = order[depth]
+        if mapping[v] >= 0:
+            used[mapping[v]] = False
+            mapping[v] = -1
+        for w in iterators[depth]:
+            if not used[w] and feasible(v, w):
+                break
+        else:
+            iterators.pop()
+            depth -= 1
+            continue
+        steps += 1
+        if max_steps != None and steps > max_steps:
+            return None
+        mapping[v] = w
+        used[w] = True
+        depth += 1
+        if depth < n1:
+            iterators.append(iter(candidates[colors1[order[depth]]]))
+    if depth < 0:
+        return None
+    return np.array(mapping, dtype=np.int64)
+
+
+class StructuralIndex:
+    """
+    A StructuralIndex groups the graphs added to it by structural hash, e.g. to find the duplicated figures in many
+    generated examples and reuse their layouts. It is composed by:
+        -----------
+        > exact : bool
+            If True, the graphs with the same hash are also compared with 'isomorphism', so that two graphs are in the
+            same group only if they are isomorphic.
+
+        > buckets : {str: [[LatexGraph, [key, ...]], ...]}
+            For every hash, the groups of the graphs with that hash: a representative graph and the keys of the graphs
+            equivalent to it (the first one is the representative's key).
+        -----------
+    """
+    def __init__(self, exact= False):
+        self.exact = exact
+        self.buckets = {}
+
+    def match(self, G):
+        """ It returns the pair (group, mapping) of the group of G (or (None, None)); see 'find' """
+        for group in self.buckets.get(G.structural_hash(), []):
+            if not self.exact:
+                return group, None
+            mapping = G.isomorphism(group[0])
+            if mapping != None:
+                return group, mapping
+        return None, None
+
+    def add(self, key, G):
+        """ It adds the graph G with the name 'key' and returns the key of the first equivalent graph added """
+        group, mapping = self.match(G)
+        if group == None:
+            group = [G, []]
+            self.buckets.setdefault(G.structural_hash(), []).append(group)
+        group[1].append(key)
+        return group[1][0]
+
+    def find(self, G):
+        """
+        It returns the pair (key, mapping) of the first added graph equivalent to G, where (if 'exact' is True)
+        'mapping' maps the ids of G to the ids of that graph, or None if there is no such graph.
+        """
+        group, mapping = self.match(G)
+        if group == None:
+            return None
+        return group[1][0], mapping
+
+    def duplicates(self):
+        """ It returns the lists of the keys of the groups with more than one graph """
+        return [group[1] for bucket in self.buckets.values() for group in bucket if len(group[1]) > 1]
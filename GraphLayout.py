@@ -0,0 +1,393 @@
+#  Copyright 2022 Lorenzo Pichetti lori.pichi@gmail.com
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+Automatic placement of the vertices of a graph, used by 'LatexGraph.layout'. The functions work on NumPy arrays: the
+graph is given by the number of vertices n and the arrays (src, dst) of the edges, and the result is a (n x 2) array
+of positions. The available methods are:
+
+    > "circle": the vertices are equally spaced on the 1-circle;
+    > "spectral": the coordinates are the 2nd and the 3rd eigenvectors of the normalized adjacency matrix;
+    > "fr": Fruchterman-Reingold force-directed layout, starting from the spectral one; the repulsive forces are
+      approximated with a Barnes-Hut quadtree, so every iteration costs O(n log n);
+    > "multilevel": the graph is coarsened by matching its edges until it has a few vertices, the coarsest graph is
+      placed with "fr" and the positions are refined level by level (it is the best choice for big graphs).
+
+In the force-directed layouts the ideal edge length is 'k' (so a graph with n vertices spans about k*sqrt(n) units).
+"""
+
+import math
+import time
+
+import numpy as np
+import scipy.sparse
+import scipy.sparse.linalg
+
+
+# ---------------------------------------------- Graph's arrays ----------------------------------------------------
+
+def undirectedEdges(n, src, dst):
+    """ It returns the arrays (a, b) of the unordered pairs {src[k], dst[k]} without loops and repetitions """
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    a = np.minimum(src, dst)
+    b = np.maximum(src, dst)
+    key = np.unique((a * max(n, 1) + b)[a != b])
+    return key // max(n, 1), key % max(n, 1)
+
+def adjacencyMatrix(n, a, b):
+    """ The symmetric (n x n) scipy CSR adjacency matrix of the undirected edges (a, b) """
+    data = np.ones(2 * len(a))
+    return scipy.sparse.csr_matrix((data, (np.concatenate((a, b)), np.concatenate((b, a)))), shape=(n, n))
+
+
+# -------------------------------------------- Initial layouts -----------------------------------------------------
+
+def circleLayout(n):
+    """ It returns the positions of n vertices equally spaced on the 1-circle """
+    alpha = (2*math.pi / max(n, 1)) * np.arange(0, n)
+    return np.column_stack((np.cos(alpha), np.sin(alpha)))
+
+def spectralLayout(n, a, b, seed= 0):
+    """
+    It returns the degree-normalized spectral layout: the coordinates are D^-1/2 x, where x are the eigenvectors of
+    the 2nd and 3rd largest eigenvalues of D^-1/2 A D^-1/2. The positions are scaled in the square [-1, 1]^2; if the
+    eigenvectors cannot be computed (e.g. on very small graphs) the vertices are placed at random.
+    """
+    rng = np.random.default_rng(seed)
+    if n < 4 or len(a) == 0:
+        return rng.uniform(-1, 1, (n, 2))
+
+    A = adjacencyMatrix(n, a, b)
+    degree = np.asarray(A.sum(axis=1)).ravel()
+    inv_sqrt = 1 / np.sqrt(np.maximum(degree, 1))
+    M = scipy.sparse.diags(inv_sqrt) @ A @ scipy.sparse.diags(inv_sqrt)
+    try:
+        values, vectors = scipy.sparse.linalg.eigsh(M, k=3, which="LA", tol=1e-3, maxiter=max(1000, n // 10), v0=rng.uniform(0.5, 1, n))
+        P = vectors[:, np.argsort(values)[::-1][1:3]] * inv_sqrt[:, None]
+    except (scipy.sparse.linalg.ArpackNoConvergence, scipy.sparse.linalg.ArpackError):
+        return rng.uniform(-1, 1, (n, 2))
+
+    P = P - P.mean(axis=0)
+    P = P / np.maximum(np.abs(P).max(axis=0), 1e-12)
+    # isolated vertices (and vertices of the same small component) would collapse on the same point
+    return P + rng.uniform(-1e-3, 1e-3, (n, 2))
+
+
+# ---------------------------------------------- Barnes-Hut forces ---------------------------------------------------
+# The quadtree is stored level by level as the arrays of its occupied cells: at the level l the bounding square is
+# divided in 2^l x 2^l cells, and every occupied cell stores its coordinates, the total mass and the center of mass
+# of its vertices, and the index of its parent cell. A cell c receives the force of the cells of its "interaction
+# list" (the children of the neighbours of c's parent which are not neighbours of c) as a linear expansion around its
+# center of mass, which is pushed down to the children; the vertices evaluate the expansion of their cell at the
+# finest level and add the exact forces of the vertices in the 3x3 cells around it. The cells of an interaction list
+# are separated by at least one cell, so the opening angle is about 1. Only the occupied cells are stored, so a few
+# far away vertices (which make the finest grid much bigger than n) do not slow down the far field; all the
+# operations are NumPy operations on the arrays of a whole level.
+
+EXACT_FORCES_SIZE = 300
+
+def quadtreeDepth(P, pairs_per_vertex= 24, max_depth= 10):
+    """
+    It returns the depth of the quadtree for the positions P: the smallest one (at least log4(n/2)) such that the
+    near field costs at most 'pairs_per_vertex' interactions per vertex on average.
+    """
+    n = len(P)
+    lo = P.min(axis=0)
+    span = max(float((P.max(axis=0) - lo).max()), 1e-9) * (1 + 1e-9)
+    depth = int(min(max(math.ceil(math.log(max(n / 2, 1), 4)), 2), max_depth))
+    while depth < max_depth:
+        side = 1 << depth
+        cells = np.minimum(((P - lo) * (side / span)).astype(np.int64), side - 1)
+        count = np.pad(np.bincount(cells[:, 0] * side + cells[:, 1], minlength=side*side).reshape(side, side), 1)
+        box = sum(count[1 + ox : 1 + ox + side, 1 + oy : 1 + oy + side] for ox in range(-1, 2) for oy in range(-1, 2))
+        if (count[1:-1, 1:-1] * box).sum() <= pairs_per_vertex * n:
+            break
+        depth += 1
+    return depth
+
+def cellMoments(cx, cy, side, mass, X, Y):
+    """
+    It groups the masses 'mass' with centers (X, Y) by their cells (cx, cy) of a (side x side) grid, and returns the
+    arrays (cx, cy, M, X, Y) of the occupied cells (sorted by cx * side + cy) and the cell of every input.
+    """
+    key, inverse = np.unique(cx * side + cy, return_inverse=True)
+    inverse = inverse.ravel()
+    M = np.bincount(inverse, mass)
+    X = np.bincount(inverse, mass * X) / np.maximum(M, 1e-300)
+    Y = np.bincount(inverse, mass * Y) / np.maximum(M, 1e-300)
+    return key // side, key % side, M, X, Y, inverse
+
+def farFieldExpansions(cx, cy, side, M, X, Y):
+    """
+    It returns the arrays (Fx, Fy, Jxx, Jxy, Jyy) of the force (without the factor k^2) and of its Jacobian at the
+    centers of mass (X, Y) of the occupied cells (cx, cy) of a (side x side) grid due to the cells of the
+    interaction lists.
+    """
+    # the cells of the interaction lists are at most 2 cells away from the parent's children: the index of every
+    # occupied cell is stored in a grid with a border of 2 empty cells, to avoid the bounds' checks
+    width = side + 4
+    slot = np.full(width * width, -1, dtype=np.int64)
+    slot[(cx + 2) * width + (cy + 2)] = np.arange(0, len(cx))
+    px = cx & 1
+    py = cy & 1
+    base = (cx - px + 2) * width + (cy - py + 2)
+    E = [np.zeros(len(cx)) for t in range(0, 5)]
+    for ox in range(-2, 4):
+        for oy in range(-2, 4):
+            source = slot[base + (ox * width + oy)]
+            target = np.nonzero((source >= 0) & (np.maximum(np.abs(ox - px), np.abs(oy - py)) > 1))[0]
+            source = source[target]
+            dx = X[target] - X[source]
+            dy = Y[target] - Y[source]
+            inv = 1 / np.maximum(dx*dx + dy*dy, 1e-300)
+            f = M[source] * inv
+            g = 2 * f * inv
+            E[0][target] += f * dx
+            E[1][target] += f * dy
+            E[2][target] += f - g * dx * dx
+            E[3][target] -= g * dx * dy
+            E[4][target] += f - g * dy * dy
+    return E
+
+def exactRepulsiveForces(P, mass, k):
+    """ It computes the repulsive forces of 'repulsiveForces' with all the O(n^2) pairs (faster on small graphs) """
+    delta = P[:, None, :] - P[None, :, :]
+    d2 = (delta * delta).sum(axis=2)
+    np.fill_diagonal(d2, np.inf)
+    return (k * k) * np.einsum("ijc,ij->ic", delta, mass[None, :] / np.maximum(d2, 1e-12))
+
+def repulsiveForces(P, mass, k, depth= None, leaf_limit= 32):
+    """ It returns the (n x 2) array of the Fruchterman-Reingold repulsive forces k^2 * mass / d """
+    n = len(P)
+    if n <= EXACT_FORCES_SIZE and depth == None:
+        return exactRepulsiveForces(P, mass, k)
+    depth = quadtreeDepth(P) if depth == None else depth
+    lo = P.min(axis=0)
+    span = max(float((P.max(axis=0) - lo).max()), 1e-9) * (1 + 1e-9)
+    cells = np.minimum(((P - lo) * ((1 << depth) / span)).astype(np.int64), (1 << depth) - 1)
+
+    # upward pass: the occupied cells of every level, from the finest one to the level 2
+    levels = []
+    cx, cy, M, X, Y, vertex_cell = cellMoments(cells[:, 0], cells[:, 1], 1 << depth, mass, P[:, 0], P[:, 1])
+    for level in range(depth, 2, -1):
+        parent = cellMoments(cx >> 1, cy >> 1, 1 << (level - 1), M, X, Y)
+        levels.append((cx, cy, M, X, Y, parent[5]))
+        cx, cy, M, X, Y = parent[0:5]
+    levels.append((cx, cy, M, X, Y, None))
+
+    # far field: downward pass of the linear expansions from the level 2 to the finest one
+    E = None
+    for level, (cx, cy, M, X, Y, up) in zip(range(2, depth + 1), reversed(levels)):
+        local = farFieldExpansions(cx, cy, 1 << level, M, X, Y)
+        if E != None:
+            dx = X - Xp[up]
+            dy = Y - Yp[up]
+            local[0] += E[0][up] + E[2][up] * dx + E[3][up] * dy
+            local[1] += E[1][up] + E[3][up] * dx + E[4][up] * dy
+            for t in range(2, 5):
+                local[t] += E[t][up]
+        E, Xp, Yp = local, X, Y
+
+    c = vertex_cell
+    dx = P[:, 0] - X[c]
+    dy = P[:, 1] - Y[c]
+    F = np.column_stack((E[0][c] + E[2][c] * dx + E[3][c] * dy, E[1][c] + E[3][c] * dx + E[4][c] * dy))
+
+    # near field: exact interactions with the vertices of the 3x3 neighbour cells; the cells with more than
+    # 'leaf_limit' vertices (as the clusters of almost coincident vertices) act with their center of mass. The
+    # vertices are sorted by cell, and the grid is padded with empty cells to avoid the bounds' checks.
+    side = 1 << depth
+    cx = cells[:, 0]
+    cy = cells[:, 1]
+    cid = (cx + 1) * (side + 2) + (cy + 1)
+    order = np.argsort(cid, kind="stable")
+    cid = cid[order]
+    Qx = P[order, 0]
+    Qy = P[order, 1]
+    qmass = mass[order]
+    count = np.bincount(cid, minlength=(side + 2)**2)
+    start = np.cumsum(count) - count
+    occupied = (levels[0][0] + 1) * (side + 2) + (levels[0][1] + 1)
+    cell_mass = np.zeros((side + 2)**2)
+    cell_mass[occupied] = M
+    moment = np.zeros(((side + 2)**2, 2))
+    moment[occupied] = np.column_stack((X * M, Y * M))
+
+    tid = (cid[:, None] + (NEAR_OFFSETS[:, 0] * (side + 2) + NEAR_OFFSETS[:, 1])[None, :]).ravel()
+    rows = np.repeat(np.arange(0, n), len(NEAR_OFFSETS))
+    c = count[tid]
+    heavy = c > leaf_limit
+    G = np.zeros_like(P)
+
+    r = rows[heavy]
+    t = tid[heavy]
+    own = np.where(t == cid[r], qmass[r], 0)
+    m = cell_mass[t] - own
+    dx = Qx[r] - (moment[t, 0] - own * Qx[r]) / np.maximum(m, 1e-300)
+    dy = Qy[r] - (moment[t, 1] - own * Qy[r]) / np.maximum(m, 1e-300)
+    f = m / np.maximum(dx*dx + dy*dy, 1e-12)
+    G[:, 0] += np.bincount(r, f * dx, minlength=n)
+    G[:, 1] += np.bincount(r, f * dy, minlength=n)
+
+    light = ~heavy & (c > 0)
+    rows = rows[light]
+    tid = tid[light]
+    c = c[light]
+    i = np.repeat(rows, c)
+    j = np.repeat(start[tid] - (np.cumsum(c) - c), c) + np.arange(0, len(i))
+    keep = i != j
+    i = i[keep]
+    j = j[keep]
+    dx = Qx[i] - Qx[j]
+    dy = Qy[i] - Qy[j]
+    f = qmass[j] / np.maximum(dx*dx + dy*dy, 1e-12)
+    G[:, 0] += np.bincount(i, f * dx, minlength=n)
+    G[:, 1] += np.bincount(i, f * dy, minlength=n)
+    F[order] += G
+    return (k * k) * F
+
+NEAR_OFFSETS = np.array([[ox, oy] for ox in range(-1, 2) for oy in range(-1, 2)], dtype=np.int64)
+
+def attractiveForces(P, a, b, k):
+    """ It returns the (n x 2) array of the Fruchterman-Reingold attractive forces d^2 / k along the edges """
+    delta = P[a] - P[b]
+    d = np.sqrt((delta * delta).sum(axis=1))
+    f = (d / k)[:, None] * delta
+    n = len(P)
+    F = np.zeros_like(P)
+    F[:, 0] = np.bincount(b, f[:, 0], minlength=n) - np.bincount(a, f[:, 0], minlength=n)
+    F[:, 1] = np.bincount(b, f[:, 1], minlength=n) - np.bincount(a, f[:, 1], minlength=n)
+    return F
+
+
+# ----------------------------------------------- Force-directed ---------------------------------------------------
+
+def forceDirected(P, a, b, k= 1, mass= None, iterations= 50, step= None, deadline= None, tol= 0.01):
+    """
+    It runs at most 'iterations' steps of Fruchterman-Reingold starting from the positions P and returns the new
+    positions; it stops earlier at the time 'deadline' (if given) or when the average displacement is less than
+    tol*k. The maximum displacement 'step' starts from k*sqrt(n)/10 (if not given) and is changed with an adaptive
+    cooling schedule.
+    """
+    P = np.array(P, dtype=np.float64)
+    n = len(P)
+    if n < 2:
+        return P
+    mass = np.ones(n) if mass is None else mass
+    step = k * math.sqrt(n) / 10 if step == None else step
+    energy = math.inf
+    progress = 0
+    for it in range(0, iterations):
+        if deadline != None and time.time() > deadline:
+            break
+        F = repulsiveForces(P, mass, k) + attractiveForces(P, a, b, k)
+        norm = np.sqrt((F * F).sum(axis=1))
+        move = np.minimum(norm, step)
+        P += F * (move / np.maximum(norm, 1e-12))[:, None]
+        if move.mean() < tol * k:
+            break
+
+        # adaptive cooling (Hu, 2005): the step grows after 5 consecutive improvements of the energy
+        new_energy = float((norm * norm).sum())
+        if new_energy < energy:
+            progress += 1
+            if progress >= 5:
+                progress = 0
+                step /= 0.9
+        else:
+            progress = 0
+            step *= 0.9
+        energy = new_energy
+    return P
+
+
+# ------------------------------------------------- Multilevel -----------------------------------------------------
+
+def matchEdges(n, a, b, seed= 0, rounds= 10):
+    """
+    It returns an array 'parent' which maps every vertex to its coarse vertex (0..n'-1), by merging the pairs of a
+    matching of the edges (a, b). The matching is built in 'rounds' vectorized handshakes: every free vertex points
+    to its free neighbour with the smallest random priority, and the pairs of vertices pointing to each other match.
+    """
+    rng = np.random.default_rng(seed)
+    mate = np.full(n, -1, dtype=np.int64)
+    src = np.concatenate((a, b))
+    dst = np.concatenate((b, a))
+    for r in range(0, rounds):
+        free = (mate[src] < 0) & (mate[dst] < 0)
+        s = src[free]
+        d = dst[free]
+        if len(s) == 0:
+            break
+        priority = rng.random(n)
+        order = np.lexsort((priority[d], s))
+        s = s[order]
+        d = d[order]
+        first = np.concatenate(([True], s[1:] != s[:-1]))
+        choice = np.full(n, -1, dtype=np.int64)
+        choice[s[first]] = d[first]
+        u = np.nonzero(choice >= 0)[0]
+        v = choice[u]
+        mutual = choice[v] == u
+        mate[u[mutual]] = v[mutual]
+
+    leader = np.where((mate < 0) | (np.arange(n) < mate), np.arange(n), mate)
+    leaders, parent = np.unique(leader, return_inverse=True)
+    return parent
+
+def multilevelLayout(n, a, b, k= 1, iterations= 50, deadline= None, seed= 0, min_size= 50):
+    """ It places the graph with the multilevel Fruchterman-Reingold layout (see the module's description) """
+    levels = []
+    mass = np.ones(n)
+    size = n
+    while size > min_size and len(levels) < 30:
+        parent = matchEdges(size, a, b, seed + len(levels))
+        coarse = int(parent.max()) + 1 if size > 0 else 0
+        if coarse > 0.9 * size:
+            break
+        levels.append((parent, a, b, mass))
+        a, b = undirectedEdges(coarse, parent[a], parent[b])
+        mass = np.bincount(parent, mass, minlength=coarse)
+        size = coarse
+
+    P = spectralLayout(size, a, b, seed) * (k * math.sqrt(max(mass.sum(), 1)))
+    P = forceDirected(P, a, b, k, mass, 2 * iterations, None, deadline)
+    rng = np.random.default_rng(seed)
+    for parent, a, b, mass in reversed(levels):
+        # the merged vertices start near their coarse vertex; the refinement starts from a good layout, so it uses
+        # a smaller step and half of the iterations
+        P = P[parent] + rng.uniform(-k / 10, k / 10, (len(parent), 2))
+        P = forceDirected(P, a, b, k, mass, max(iterations // 2, 10), k, deadline)
+    return P
+
+def computeLayout(n, src, dst, method= "multilevel", iterations= 50, time_limit= None, k= 1, seed= 0):
+    """
+    It returns the (n x 2) positions computed with 'method' ("circle", "spectral", "fr", or "multilevel") for the
+    graph with the edges (src[i], dst[i]) (the edges' direction is ignored). The force-directed methods do at most
+    'iterations' steps per level and stop after 'time_limit' seconds (if given).
+    """
+    deadline = None if time_limit == None else time.time() + time_limit
+    if method == "circle":
+        return circleLayout(n)
+    a, b = undirectedEdges(n, src, dst)
+    if method == "spectral":
+        return spectralLayout(n, a, b, seed)
+    if method == "fr":
+        P = spectralLayout(n, a, b, seed) * (k * math.sqrt(max(n, 1)))
+        return forceDirected(P, a, b, k, None, iterations, None, deadline)
+    if method == "multilevel":
+        return multilevelLayout(n, a, b, k, iterations, deadline, seed)
+    print("ERROR: unknown layout method '%s' (use 'circle', 'spectral', 'fr', or 'multilevel')" % method)
+    raise ValueError()
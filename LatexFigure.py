@@ -32,37 +32,44 @@ class LatexFigure:
         self.caption = "This is the caption"
         self.posttext = "This is the post-text"
         
-    """ This function prints the latex code relative to the LatexFigure """
-    def printLatexFigure(self, outfile= None, prefix= "\t"):
+    def iter_latex_figure(self, prefix= "\t", cache= None):
+        """
+        This function yields the latex code relative to the LatexFigure; the code of the element is taken from 'cache'
+        (a RenderCache) if it did not change (see 'iter_cached_tikz').
+        """
         if (self.style != "frame"):
-            print(prefix + "\\" + self.style + "{" + self.title + "}", file= outfile)
+            yield prefix + "\\" + self.style + "{" + self.title + "}\n"
         else:
-            print(prefix + "\\begin{frame}{" + self.title + "}", file= outfile)
+            yield prefix + "\\begin{frame}{" + self.title + "}\n"
         
         if (self.pretext != None):
-            print(prefix + self.pretext, file= outfile)
+            yield prefix + self.pretext + "\n"
         
         if (self.element == None):
-            print("element", file= outfile)
+            yield "element\n"
         else:
-            print(prefix + "\\begin{figure}[H]", file= outfile)
-            print(prefix + "\t\\begin{center}", file= outfile)
-            print(prefix + "\t\t\\resizebox{0.95\\textwidth}{!}{", file= outfile)
+            yield prefix + "\\begin{figure}[H]\n"
+            yield prefix + "\t\\begin{center}\n"
+            yield prefix + "\t\t\\resizebox{0.95\\textwidth}{!}{\n"
             
-            self.element.printTikz(outfile, "\t\t\t\t")
+            yield from iter_cached_tikz(self.element, "\t\t\t\t", cache)
             
-            print(prefix + "\t\t}", file= outfile)
-            print(prefix + "\t\\end{center}", file= outfile)
+            yield prefix + "\t\t}\n"
+            yield prefix + "\t\\end{center}\n"
             if (self.caption != None):
-                print(prefix + "\t\\caption{" + self.caption + "}", file= outfile)
-            print(prefix + "\t\\label{fig:lat1a}", file= outfile)
-            print(prefix + "\\end{figure}", file= outfile)
+                yield prefix + "\t\\caption{" + self.caption + "}\n"
+            yield prefix + "\t\\label{fig:lat1a}\n"
+            yield prefix + "\\end{figure}\n"
         
         if (self.posttext != None):
-            print(prefix + self.posttext, file= outfile)
+            yield prefix + self.posttext + "\n"
             
         if (self.style == "frame"):
-            print(prefix + "\\end{frame}", file= outfile)
+            yield prefix + "\\end{frame}\n"
+
+    def printLatexFigure(self, outfile= None, prefix= "\t"):
+        """ This function prints the latex code relative to the LatexFigure """
+        writeTikz(self.iter_latex_figure(prefix), outfile)
 
 
 """
@@ -145,20 +152,19 @@ class LatexFile:
         """ This function returns the output file """
         return(self.output)
     
-    def start_picture(self):
+    def iter_start_picture(self):
         """ Read the start_document's description """
-        print(
-    """
+        yield """
 \\title{%s}
 \\author{Lorenzo Pichetti}
 \\date{2021}
 
 \\documentclass{article}
-    """ % self.title, file= self.output)
     
-        print_preambles(self.output)
-        print(
-    """
+""" % self.title
+    
+        yield from iter_tikz_preambles()
+        yield """
 \\usepackage[graphics,tightpage,active]{preview}
 \\PreviewEnvironment{tikzpicture}
 \\newlength{\\imagewidth}
@@ -169,33 +175,33 @@ class LatexFile:
 
 \\maketitle
     
-    """, file= self.output)
+    
+"""
         
-    def start_article(self):
+    def iter_start_article(self):
         """ Read the start_document's description """
-        print(
-    """
+        yield """
 \\title{%s}
 \\author{Lorenzo Pichetti}
 \\date{2021}
 
 \\documentclass{article}
 \\usepackage{float}
-    """ % self.title, file= self.output)
     
-        print_preambles(self.output)
-        print(
-    """
+""" % self.title
+    
+        yield from iter_tikz_preambles()
+        yield """
 \\begin{document}
 
 \\maketitle
     
-    """, file= self.output)
+    
+"""
         
-    def start_beamer(self):
+    def iter_start_beamer(self):
         """ Read the start_document's description """
-        print(
-    """
+        yield """
 \\documentclass{beamer}
 \\usetheme{Berkeley}
 \\usecolortheme{spruce}
@@ -204,40 +210,53 @@ class LatexFile:
 \\institute{Universita\\` degli studi di Roma Tre}
 \\date{2021}
 \\usepackage{float}
-    """ % self.title, file= self.output)
     
-        print_preambles(self.output)
-        print(
-    """
+""" % self.title
+    
+        yield from iter_tikz_preambles()
+        yield """
 \\begin{document}
 
-\maketitle
+\\maketitle
+    
     
-    """, file= self.output)
+"""
         
-    def start_document(self):
+    def iter_start_document(self):
         """
-        start_document prints in the output file the preambles needed by the Tex document and start it. The particulare
-        commands are defined by the particular file's  documentclass by using one of 'start_article', 'start_beamer', 
-        and 'start_picture'.
+        iter_start_document yields the preambles needed by the Tex document and start it. The particulare commands are
+        defined by the particular file's documentclass by using one of 'iter_start_article', 'iter_start_beamer', and
+        'iter_start_picture'.
         """
         f = 0
         if (self.style == "article"):
-            self.start_article()
+            yield from self.iter_start_article()
             f=1
         if (self.style == "beamer"):
-            self.start_beamer()
+            yield from self.iter_start_beamer()
             f=1
         if (self.style == "picture"):
-            self.start_picture()
+            yield from self.iter_start_picture()
             f=1
         if (f == 0):
             print("ERROR: unrecognized document style\n")
-            
+
+    def start_picture(self):
+        writeTikz(self.iter_start_picture(), self.output)
+
+    def start_article(self):
+        writeTikz(self.iter_start_article(), self.output)
+
+    def start_beamer(self):
+        writeTikz(self.iter_start_beamer(), self.output)
+
+    def start_document(self):
+        """ start_document prints in the output file the code of 'iter_start_document' """
+        writeTikz(self.iter_start_document(), self.output)
         
     def end_document(self):
         """ It ends the latex document """
-        print("\end{document}", file= self.output)
+        writeTikz(["\\end{document}\n"], self.output)
 
     def insertFigure(self, fig: LatexFigure):
         """ This function appends a new LatexFigure to the LatexFile. """
@@ -253,22 +272,45 @@ class LatexFile:
         E.element = fig
         self.figures.append(E)
     
-    def printLatexFile(self):
+    def printLatexFile(self, cache= None):
         """
         In 'printLatexFile' we puts together all the prevous defined functions; we open the file, print the code, 
         and close the file.
+        If 'cache' (a RenderCache) is given, the code of the unchanged figures is taken from it; the numbers of cache
+        hits and misses are printed and returned.
         """
         self.open_file()
-        self.start_document()
-        i = 0
-        while (i < len(self.figures)):
+        if cache == None:
+            writeTikz(self.iter_latex_file(), self.output)
+            self.close_file()
+            return
+        hits, misses = cache.hits, cache.misses
+        writeTikz(self.iter_latex_file(cache), self.output)
+        self.close_file()
+        hits, misses = cache.hits - hits, cache.misses - misses
+        print("render cache: %d hits, %d misses" % (hits, misses))
+        return hits, misses
+
+    def compile(self, pool= None, engine= None, runs= 1, cache= None):
+        """
+        This function compiles the document (see TexCompile) writing the PDF next to the file 'output'; it returns the
+        CompileResult, or a Future of it if a TexCompilePool is given (to compile many files in parallel). If 'cache'
+        is given (or the pool has one), the PDF of an unchanged document is taken from it.
+        """
+        if pool != None:
+            return pool.submitLatexFile(self, runs)
+        with TexCompilePool(1, engine, cache= cache) as pool:
+            return pool.submitLatexFile(self, runs).result()
+
+    def iter_latex_file(self, cache= None):
+        """ This function yields the code of the whole document (taking the unchanged figures from 'cache') """
+        yield from self.iter_start_document()
+        for fig in self.figures:
             if (self.style != "picture"):
-                self.figures[i].printLatexFigure(self.output)
+                yield from fig.iter_latex_figure(cache= cache)
             else:
-                self.figures[i].element.printTikz(self.output, "\t")
-            i = i +1
-        self.end_document()
-        self.close_file()
+                yield from iter_cached_tikz(fig.element, "\t", cache)
+        yield "\\end{document}\n"
         
         
 def readLatexFile():
@@ -16,12 +16,25 @@
 from random import *
 import math
 import ast
+import copy
+import gzip
+import io
+import itertools
 import time
 import os
+import sys
 import subprocess
+import warnings
+
+import numpy as np
 
 from networkit import *
 
+from GraphLayout import circleLayout, computeLayout
+from GraphHash import StructuralIndex, isomorphism, structuralHash
+from TexCompile import TexCompilePool, compileTex
+from RenderCache import RenderCache, hashParts
+
     
 class LatexGraph:
     """
@@ -48,6 +61,23 @@ class LatexGraph:
             These two couples of numbers are the bottom-left and upper-right corners for the grid and clip rectangles.
             If the parameters are set as 'None' then no grid or clib will be applied.
 
+        > directed : None or bool
+            If False, the graph is undirected: the edges (u, v) and (v, u) with the same style are printed once (see
+            'undirectedEdgeIndex') and the number of the edges not printed by the last printing is stored in
+            'duplicates'. If True, the networkit graph is directed (see 'isDirected'). If None (the default), every
+            edge is printed and the networkit graph is undirected.
+
+        > coalesce and coalesce_chunk : bool and int
+            If 'coalesce' is True, the edges with the same style are printed as a few paths
+            '\\draw [style=s] (a.center) -- (b.center) (c.center) -- (d.center) ...;' of at most 'coalesce_chunk'
+            segments, instead of one '\\draw' per edge; the styles with arrow tips or decorations (see
+            'StyleRegistry.isCoalescible') are still printed one edge at a time.
+
+        > culling and cull_margin : bool and float
+            If 'culling' is True and the clip rectangle is set, the nodes farther than 'cull_margin' from the clip
+            rectangle and the edges which do not cross it are not printed (see 'cullViewport'); the numbers of culled
+            nodes and edges of the last printing are stored in 'culled'.
+
         > decoration_shapes: [] or [DecorationShape0, ...]
             This vector is used for adding one or more 'DecorationShape' (see the class definition) to the LatexGraph.
             The process is done by the method 'self.addDecorationShape( ... )'
@@ -56,10 +86,24 @@ class LatexGraph:
             This vector is used for adding one or more custom 'TikzStyle' (see the class definition) to the LatexGraph.
             The process is done by the method 'self.addCustomTikzStyle( ... )'
 
+        > styles: StyleRegistry
+            It interns the names of the styles used by the graph and caches which of them are defined (see the class
+            definition); the graph combined with '+' gets a merged copy of the registries of its operands.
+
         > nkitGraph: None or networkit.Graph
             This elements are initialized as None and sobstituted by the networkit version of the LatexGraph by using
             the method 'updateNetworkitGraph'.
 
+        > nkitIds and nkitIndex: [str, ...] and {str: int}
+            The map between the vertices' ids and the nodes of 'nkitGraph' (the node i is the vertex nkitIds[i]).
+
+        > version: int
+            It is incremented by every change of the graph's vertices or edges; the vertices and edges added after the
+            last 'updateNetworkitGraph' are stored in 'nkitDirtyVertices' and 'nkitDirtyEdges'.
+
+        > analyticsCache: {key: (version, scores)}
+            The results of the networkit analytics ('betweenness', 'pagerank', ...) computed at a given version.
+
         -----------
     """
     
@@ -70,9 +114,23 @@ class LatexGraph:
         self.edges_style = "none"
         self.clip_params = None
         self.grid_params = None
+        self.directed = None
+        self.duplicates = 0
+        self.coalesce = False
+        self.coalesce_chunk = 200
+        self.culling = True
+        self.cull_margin = 0.5
+        self.culled = [0, 0]
         self.decoration_shapes = []
         self.custom_tikz_styles = []
+        self.styles = StyleRegistry()
         self.nkitGraph = None
+        self.nkitIds = []
+        self.nkitIndex = {}
+        self.nkitDirtyVertices = []
+        self.nkitDirtyEdges = []
+        self.version = 0
+        self.analyticsCache = {}
 
     # ---------------- Graph function ---------------------        
     def addVertex(self, key, position, name=None, color=None):
@@ -81,18 +139,21 @@ class LatexGraph:
         for refering the vertex and his position (this last one must be a couple of numbers as [-1,2]).
         The arguments 'name' and 'color' are optional; the first one could contain a string which will be printed inside
         the node, the second a color for the vertex (if it must be different from the default one definef in 'node_style').
+        The key can also be a tuple as ('panel', 3): it is stored as the string 'panel/3' (see 'vertexKey').
         """
+        key = vertexKey(key)
+        self.trackVertex(key)
         self.numVertices = self.numVertices + 1
         newVertex = LatexVertex(key, position, name, color)
-        self.vertices[str(key)] = newVertex
+        self.vertices[key] = newVertex
         return newVertex
     
     def getVertex(self, n):
         """ It returns the vertex with id n """
-        return self.vertices[str(n)]
+        return self.vertices[vertexKey(n)]
 
     def __contains__(self,n):
-        return n in self.vertices
+        return vertexKey(n) in self.vertices
     
     def addEdge(self, f, t, w=0, c=None):
         """ 
@@ -101,7 +162,24 @@ class LatexGraph:
         if c is different from 'None', it represents the edge's particular color (if it is 'None' then the edge will
         be printed with the default value stored in 'self.edges_style').
         """
-        self.vertices[str(f)].addNeighbor(self.vertices[str(t)], w, c)
+        f = vertexKey(f)
+        t = vertexKey(t)
+        self.vertices[f].addNeighbor(self.vertices[t], w, c)
+        self.version += 1
+        if self.nkitGraph is not None:
+            self.nkitDirtyEdges.append((f, t))
+
+    def clear(self):
+        """ It removes all the vertices and edges, keeping the styles, the decorations, and the other options """
+        self.vertices = {}
+        self.numVertices = 0
+        self.version += 1
+        self.nkitGraph = None
+        self.nkitIds = []
+        self.nkitIndex = {}
+        self.nkitDirtyVertices = []
+        self.nkitDirtyEdges = []
+        self.analyticsCache = {}
 
     def getVertices(self):
         """ It returns the list containing all the vertices of G """
@@ -112,9 +190,7 @@ class LatexGraph:
 
     def addDecorationShape (self, coords, style = 'blue', shape = 0, print_type = 0):
         """ This function add a VALID DecorationShape to the vector 'decoration_shapes' """
-        if not self.isStyleDefined(style):
-            print("ERROR: the style %s is not defined" % style)
-            raise ValueError()
+        self.styles.check(style)
 
         tmp_shape = DecorationShape(coords, style, shape, print_type)
         if tmp_shape.valid:
@@ -125,163 +201,405 @@ class LatexGraph:
         tmp_style = TikzStyle(name, type, draw, line_width, dash_pattern, fill, opacity)
         if tmp_style.valid:
             self.custom_tikz_styles.append( tmp_style )
+            self.styles.addCustomStyle( tmp_style )
 
-    def isStyleDefined (self, style):
-        if style in predefinedTikzStyles:
-            return True
-        else:
-            for custum_sty in self.custom_tikz_styles:
-                if style == custum_sty.name:
-                    return True
+    def syncCustomStyles (self):
+        """ It registers in 'styles' the TikzStyles appended directly to 'custom_tikz_styles' """
+        for sty in self.custom_tikz_styles:
+            if self.styles.custom.get(sty.name) is not sty:
+                self.styles.addCustomStyle(sty)
 
-            return False
+    def isStyleDefined (self, style):
+        if not self.styles.isDefined(style):
+            self.syncCustomStyles()
+        return self.styles.isDefined(style)
 
     # --------------------------- Overlapping operator -----------------------------------
     # These functions are used for overlapping two LatexGraph or transate/enlarge them
     
-    def translate (self, translate_vector):
+    def positionArray(self, keys= None):
+        """ It returns a (n x 2) numpy array with the positions of the vertices with id in 'keys' (by default all) """
+        if keys is None:
+            vs = self.vertices.values()
+        else:
+            vs = [self.vertices[vertexKey(k)] for k in keys]
+        return np.array([v.position for v in vs], dtype=float).reshape(-1, 2)
+
+    def setPositionArray(self, positions, keys= None):
+        """ It is the inverse of 'positionArray': the i-th vertex of 'keys' (by default all) is moved to positions[i] """
+        if keys is None:
+            vs = self.vertices.values()
+        else:
+            vs = [self.vertices[vertexKey(k)] for k in keys]
+        for v, p in zip(vs, positions.tolist()):
+            v.position = p
+
+    def layout(self, method= "multilevel", iterations= 50, time_limit= None, k= 1, seed= 0):
+        """
+        This function places automatically all the vertices (see GraphLayout for the description of the methods
+        "circle", "spectral", "fr", and "multilevel") and returns the (n x 2) array of the new positions. The
+        force-directed methods do at most 'iterations' steps and stop after 'time_limit' seconds; 'k' is the ideal
+        length of the edges.
+        """
+        src, dst, weights = self.edgeArrays()
+        positions = computeLayout(self.numVertices, src, dst, method, iterations, time_limit, k, seed)
+        self.setPositionArray(positions)
+        return positions
+
+    def transform (self, matrix, offset= None, vertices= None):
+        """
+        This function applies the affine map p -> matrix * p + offset to the vertices' position, as a single NumPy
+        operation. The matrix can be a 2x2 matrix (with an optional offset) or a 3x3 homogeneous matrix, as the ones
+        returned by 'affineRotation', 'affineScale', ... that can be composed with '@'.
+        If 'vertices' is a list of ids, only these vertices are moved; otherwise also the decoration shapes and the
+        clip and grid rectangles are mapped.
+        """
+        M, t = affineParts(matrix, offset)
+        keys = None if vertices is None else [vertexKey(k) for k in vertices]
+        self.setPositionArray(self.positionArray(keys) @ M.T + t, keys)
+
+        if vertices is None:
+            for shape in self.decoration_shapes:
+                shape.transform(M, t)
+            self.clip_params = transformRectangle(self.clip_params, M, t)
+            self.grid_params = transformRectangle(self.grid_params, M, t)
+
+    def translate (self, translate_vector, vertices= None):
         """ This function translates all the vertices' position by the translate_vector """
-        for v in list(self.vertices.values()):
-            v.position[0] = v.position[0] + translate_vector[0]
-            v.position[1] = v.position[1] + translate_vector[1]
+        self.transform(affineTranslation(translate_vector), vertices= vertices)
             
-    def scale (self, scale_factor):
+    def scale (self, scale_factor, vertices= None):
         """ This function multiply all the vertices' position by the scale_factor """
-        for v in list(self.vertices.values()):
-            v.position[0] = v.position[0] * scale_factor
-            v.position[1] = v.position[1] * scale_factor
+        self.transform(affineScale(scale_factor), vertices= vertices)
+
+    def rotate (self, angle, center= None, vertices= None):
+        """ This function rotates the graph counterclockwise by 'angle' radians around 'center' (by default [0,0]) """
+        self.transform(affineRotation(angle, center), vertices= vertices)
+
+    def shear (self, kx, ky= 0, vertices= None):
+        """ This function maps every position [x, y] in [x + kx*y, y + ky*x] """
+        self.transform(affineShear(kx, ky), vertices= vertices)
+
+    def reflect (self, angle= 0, vertices= None):
+        """ This function reflects the graph across the line through the origin with slope angle 'angle' """
+        self.transform(affineReflection(angle), vertices= vertices)
         
     
     def changeId(self, old_name, new_name):
         """ This function chang the id of a vertex; it is useful for overlapping graphs """
         self.getVertex(old_name).id = new_name
         self.vertices[new_name] = self.vertices.pop(old_name)
+        self.nkitGraph = None
+        self.version += 1
         
     def __add__ (self, other):
         """
-        This function generates a new LatexGraph by overlapping 'self' and 'other'.
-        Note that the two graphs can be modified:
-            1) If the two graphs have some vertices with the same id, then the one of 'other' are changed by appending
-                a 'X' character by using the 'changeId' function (otherwise we will print some unexistence edges between
-                the vertices of 'self' and the vertices of 'other').
-            2) If the default node style of 'self' is different by the one of 'other' then we update the color of all
-                the other's vertices. (in the same way we update the edges' style)
-        """
-        x = set(self.vertices.keys())
-        y = set(other.vertices.keys())
-        xy = x.intersection(y)
-        for k in xy:
-            other.changeId(k, str(k) + 'X')
-        
-        if (self.node_style != other.node_style):
-            for v in other.vertices.values():
-                if (v.color == None):
-                    v.color = other.node_style
-        
-        if (self.edges_style != other.edges_style):
-            for v in other.vertices.values():
-                for u in v.connectedTo:
-                    if (v.connectedTo[u][1] == None):
-                        v.connectedTo[u][1] = other.edges_style
-        
+        This function generates a new LatexGraph by overlapping 'self' and 'other'; the two graphs are not modified
+        (the result gets a new StyleRegistry, see 'StyleRegistry.merge').
+            1) If the two graphs have some vertices with the same id, then the ones of 'other' are renamed by appending
+                'X' characters until the id is unique (otherwise we will print some unexistence edges between the
+                vertices of 'self' and the vertices of 'other').
+            2) If the default node style of 'self' is different by the one of 'other' then the other's vertices without
+                a style get the 'other.node_style' (in the same way we update the edges' style).
+        To overlap many graphs use 'compose', which runs in linear time and does not rename the ids with suffixes.
+        """
         O = LatexGraph()
-        O.numVertices = self.numVertices + other.numVertices
         O.node_style = self.node_style
         O.edges_style = self.edges_style
-        
-        for k in list(self.vertices.keys()):
-            O.vertices[k] = self.vertices[k]
-        for k in list(other.vertices.keys()):
-            O.vertices[k] = other.vertices[k]
-
-        for ds in self.decoration_shapes:
-            O.decoration_shapes.append(ds)
-        for ds in other.decoration_shapes:
-            O.decoration_shapes.append(ds)
-
+        O.directed = combineDirected([self.directed, other.directed])
+        O.styles = self.styles.merge(other.styles)
+
+        def rename(k):
+            if k not in self.vertices:
+                return k
+            k = k + 'X'
+            while k in self.vertices or k in other.vertices:
+                k = k + 'X'
+            return k
+
+        composeInto(O, [self, other], [lambda k: k, rename])
         return (O)
     
     # ------------------------------- Networkit ---------------------------------------
         
-    def updateNetworkitGraph(self):
-        """ This function generates in 'self.nkitGraph' a networkit graph with the same charateristics of 'self' """
-        if self.nkitGraph == None:
-            self.nkitGraph = Graph()
+    def edgeArrays(self):
+        """
+        It returns the arrays (src, dst, weights) of all the edges: the k-th edge goes from the src[k]-th to the
+        dst[k]-th vertex (in the order of 'self.vertices') with weight weights[k].
+        """
+        index = {k: i for i, k in enumerate(self.vertices)}
+        src = []
+        dst = []
+        weights = []
+        for i, v in enumerate(self.vertices.values()):
+            for u, (w, c) in v.connectedTo.items():
+                src.append(i)
+                dst.append(index[u.getId()])
+                weights.append(w)
+        return np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64), np.array(weights, dtype=float)
+
+    def edgeStyleArray(self):
+        """ It returns the array of the edges' style ids (see StyleRegistry) in the order of 'edgeArrays' """
+        default = self.styles.intern(self.edges_style)
+        return np.array([self.styles.intern(c) if c != None else default for v in self.vertices.values() for w, c in v.connectedTo.values()], dtype=np.int64)
+
+    def undirectedEdgeIndex(self):
+        """
+        It returns the undirected edge index (keep, removed): 'keep' is a boolean array (in the order of 'edgeArrays')
+        which selects the first edge of every unordered pair of vertices, but the two directions are both kept if they
+        have different styles; 'removed' is the number of the other edges.
+        """
+        src, dst, weights = self.edgeArrays()
+        styles = self.edgeStyleArray()
+        n = max(self.numVertices, 1)
+        key = np.minimum(src, dst) * n + np.maximum(src, dst)
+        order = np.lexsort((styles, key))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (key[order][1:] != key[order][:-1]) | (styles[order][1:] != styles[order][:-1])
+        keep = np.zeros(len(order), dtype=bool)
+        keep[order[first]] = True
+        return keep, int(len(keep) - keep.sum())
+
+    def isDirected(self):
+        """ It returns True if the direction of the edges matters (only if 'directed' is set to True) """
+        return self.directed == True
+
+    def trackVertex(self, key):
+        """ It records that the vertex 'key' is being added (or replaced) for 'updateNetworkitGraph' """
+        self.version += 1
+        if self.nkitGraph is not None:
+            if key in self.nkitIndex:
+                self.nkitGraph = None
+            else:
+                self.nkitDirtyVertices.append(key)
 
-        for v in dict(sorted(self.vertices.items())).values():
-            self.nkitGraph.addNode()
+    def nkitPendingEdges(self):
+        """ It returns the nodes (src, dst) of the edges added after the last 'updateNetworkitGraph' """
+        src = np.array([self.nkitIndex[f] for f, t in self.nkitDirtyEdges], dtype=np.int64)
+        dst = np.array([self.nkitIndex[t] for f, t in self.nkitDirtyEdges], dtype=np.int64)
+        return src, dst
 
-        for v in self.vertices.values():
-            for w in v.connectedTo:
-                self.nkitGraph.addEdge(int(v.id), int(w.id))
+    def updateNetworkitGraph(self, rebuild= False):
+        """
+        This function generates in 'self.nkitGraph' a networkit graph with the same charateristics of 'self' (directed
+        if 'self.directed' is True, see 'isDirected').
+        The first call (or a call with rebuild=True) builds it in bulk from 'edgeArrays'; the next ones only push the
+        vertices and edges added in the meantime with 'addVertex' and 'addEdge'. If the graph is changed in other
+        ways (e.g. with 'v.addNeighbor' or 'v.connectedTo') the networkit graph must be rebuilt.
+        """
+        if self.nkitGraph is None or rebuild or self.nkitGraph.isDirected() != self.isDirected():
+            self.nkitIds = list(self.vertices.keys())
+            self.nkitIndex = {k: i for i, k in enumerate(self.nkitIds)}
+            src, dst, weights = self.edgeArrays()
+            self.nkitGraph = networkitFromArrays(len(self.nkitIds), src, dst, self.isDirected())
+        else:
+            # a vertex added twice since the last update is pending twice
+            new = [k for k in dict.fromkeys(self.nkitDirtyVertices) if k not in self.nkitIndex]
+            if len(new) > 0:
+                first = self.nkitGraph.upperNodeIdBound()
+                self.nkitGraph.addNodes(len(new))
+                for i, k in enumerate(new):
+                    self.nkitIds.append(k)
+                    self.nkitIndex[k] = first + i
+            src, dst = self.nkitPendingEdges()
+            if len(src) > 0:
+                self.nkitGraph.addEdges((src, dst), checkMultiEdge=True)
+
+        self.nkitDirtyVertices = []
+        self.nkitDirtyEdges = []
+
+    # The following analytics run on 'nkitGraph' and return a numpy array with a score for every node (the i-th score
+    # is the one of the vertex nkitIds[i]). The results are cached until the graph's 'version' changes; 'threads'
+    # sets the number of OpenMP threads used by networkit (by default the current one).
+
+    def nkitAnalytics(self, key, algorithm, threads= None):
+        """ It runs 'algorithm(self.nkitGraph)' (or returns its cached result) """
+        key = key + (self.isDirected(),)
+        cached = self.analyticsCache.get(key)
+        if cached != None and cached[0] == self.version:
+            return cached[1]
 
-    def nkitBc(self):
         self.updateNetworkitGraph()
-        bc = centrality.ApproxBetweenness(self.nkitGraph).run()
-        while(True):
-            if bc.hasFinished():
-                break
-        return bc.scores()
+        old_threads = getCurrentNumberOfThreads()
+        if threads != None:
+            setNumberOfThreads(threads)
+        try:
+            scores = np.asarray(algorithm(self.nkitGraph))
+        finally:
+            setNumberOfThreads(old_threads)
+
+        self.analyticsCache[key] = (self.version, scores)
+        return scores
+
+    def betweenness(self, exact= False, epsilon= 0.01, delta= 0.1, normalized= True, threads= None):
+        """ The betweenness centrality (exact, or approximated within 'epsilon' with probability 1 - 'delta') """
+        if exact:
+            return self.nkitAnalytics(("betweenness", normalized), lambda G: centrality.Betweenness(G, normalized).run().scores(), threads)
+        return self.nkitAnalytics(("approx_betweenness", epsilon, delta), lambda G: centrality.ApproxBetweenness(G, epsilon, delta).run().scores(), threads)
+
+    def closeness(self, normalized= True, threads= None):
+        """ The closeness centrality (generalized variant, so that it is defined also on disconnected graphs) """
+        return self.nkitAnalytics(("closeness", normalized), lambda G: centrality.Closeness(G, normalized, centrality.ClosenessVariant.GENERALIZED).run().scores(), threads)
+
+    def pagerank(self, damp= 0.85, tol= 1e-8, threads= None):
+        return self.nkitAnalytics(("pagerank", damp, tol), lambda G: centrality.PageRank(G, damp, tol).run().scores(), threads)
+
+    def coreDecomposition(self, threads= None):
+        """ The core number of every vertex """
+        return self.nkitAnalytics(("cores",), lambda G: centrality.CoreDecomposition(G).run().scores(), threads)
+
+    def communities(self, refine= True, threads= None):
+        """ The community of every vertex, found with the Louvain method (PLM) on the undirected graph """
+        return self.nkitAnalytics(("communities", refine), lambda G: community.PLM(graphtools.toUndirected(G) if G.isDirected() else G, refine).run().getPartition().getVector(), threads)
+
+    def structural_hash(self):
+        """
+        It returns the Weisfeiler-Lehman hash of the graph's topology (see GraphHash): it does not depend on the ids,
+        the positions, and the styles, so isomorphic graphs have the same hash. It is cached until the graph changes.
+        """
+        key = ("structural_hash", self.isDirected())
+        cached = self.analyticsCache.get(key)
+        if cached != None and cached[0] == self.version:
+            return cached[1]
+        src, dst, weights = self.edgeArrays()
+        h = structuralHash(len(self.vertices), src, dst, self.isDirected())
+        self.analyticsCache[key] = (self.version, h)
+        return h
+
+    def isomorphism(self, other, max_steps= None):
+        """
+        It returns a dictionary {id of self: id of other} which is an isomorphism between the two graphs, or None if
+        they are not isomorphic (see GraphHash.isomorphism). With it the layout of 'other' can be reused:
+            G.setPositionArray(H.positionArray(mapping.values()), mapping.keys())
+        """
+        if self.structural_hash() != other.structural_hash():
+            return None
+        src1, dst1, weights = self.edgeArrays()
+        src2, dst2, weights = other.edgeArrays()
+        mapping = isomorphism(len(self.vertices), src1, dst1, len(other.vertices), src2, dst2, self.isDirected(), max_steps)
+        if mapping is None:
+            return None
+        ids = list(other.vertices.keys())
+        return {k: ids[i] for k, i in zip(self.vertices.keys(), mapping.tolist())}
 
-    def addVertexByNkit(self, i):
-        """ This function is used by readFromNKitGraph """
-        new_id = self.numVertices
-        for v in self.vertices.values():
-            v.position = [math.cos((2*math.pi * int(v.id)) / (new_id+1)), math.sin((2*math.pi * int(v.id)) / (new_id+1))]
+    def nkitBc(self):
+        return self.betweenness().tolist()
 
-        position = [math.cos((2*math.pi * new_id) / (new_id+1)), math.sin((2*math.pi * new_id) / (new_id+1))]
-        self.addVertex(new_id, position, new_id)
+    def setNodesStyles(self, styles, keys= None):
+        """ It sets the style of the i-th vertex in 'keys' (by default all the vertices) to styles[i] """
+        if keys is None:
+            keys = self.vertices.keys()
+        for k, style in zip(keys, styles):
+            self.vertices[k].style = style
 
-    def addEdgeByNkit(self, f, t, w, edgeId):
-        """ This function is used by readFromNKitGraph """
-        self.addEdge(f, t, w)
+    def highlightByScore(self, scores, palette= ["little", "littlepink", "littlered"], bins= None, top= None):
+        """
+        This function colors the vertices by a score array as the ones returned by 'betweenness', 'pagerank', ... (the
+        i-th score is the one of the vertex nkitIds[i]).
+        The scores are split in len(palette) classes with the same number of vertices (or by the thresholds in 'bins')
+        and the vertices of the k-th class get the style palette[k]; if 'top' is given, only the 'top' vertices with
+        the highest score get palette[-1] and the others palette[0]. Integer labels, as the ones of 'communities',
+        can be passed with bins= 'labels' to give to the k-th label the style palette[k % len(palette)].
+        """
+        scores = np.asarray(scores)
+        if isinstance(bins, str) and bins == "labels":
+            classes = scores.astype(np.int64) % len(palette)
+        elif top != None:
+            classes = np.zeros(len(scores), dtype=np.int64)
+            classes[np.argsort(-scores, kind='stable')[:top]] = len(palette) - 1
+        else:
+            if bins is None:
+                bins = np.quantile(scores, np.linspace(0, 1, len(palette) + 1)[1:-1])
+            if len(bins) + 1 != len(palette):
+                print("ERROR: %d thresholds need %d styles, not %d" % (len(bins), len(bins) + 1, len(palette)))
+                raise ValueError()
+            classes = np.digitize(scores, bins)
+        self.setNodesStyles(np.asarray(palette, dtype=object)[classes], self.nkitIds[:len(scores)])
+        return classes
 
-    def readFromNKitGraph(self, NKitG):
-        """ This function generate a LatexGraph by a networkit Graph (positioning the vertices on the 1-circle) """
+    def readFromNKitGraph(self, NKitG, layout= None):
+        """
+        This function generate a LatexGraph by a networkit Graph: the nodes and the edges (with their weights) are read
+        in bulk, and the vertices are placed by 'layout(n)' (by default on the 1-circle). The i-th node of NKitG becomes
+        the vertex i, and the graph is directed if NKitG is; when the node ids of NKitG are 0..n-1 its copy is kept as
+        'self.nkitGraph'.
+        """
         if self.numVertices != 0:
             print("ERROR: G.readFromNKitGraph() must be used on a void LatexGraph")
-        else:
-            NKitG.forNodes(self.addVertexByNkit)
-            NKitG.forEdges(self.addEdgeByNkit)
-
-            self.node_style  = "wstyle"
-            self.edges_style = "thiny"
-
-    def writeEdgeList(self, file_name):
+            return
+        if layout == None:
+            layout = circleLayout
+
+        n = NKitG.numberOfNodes()
+        m = NKitG.numberOfEdges()
+        nodes = np.fromiter(NKitG.iterNodes(), dtype=np.int64, count=n)
+        table = np.fromiter(itertools.chain.from_iterable(NKitG.iterEdgesWeights()), dtype=np.float64, count=3*m).reshape(m, 3)
+        index = np.zeros(NKitG.upperNodeIdBound(), dtype=np.int64)
+        index[nodes] = np.arange(0, n)
+
+        self.addVerticesFromArrays(range(0, n), np.asarray(layout(n), dtype=np.float64), range(0, n))
+        self.addEdgesFromArrays(index[table[:, 0].astype(np.int64)], index[table[:, 1].astype(np.int64)], table[:, 2])
+        self.node_style  = "wstyle"
+        self.edges_style = "thiny"
+
+        self.directed = NKitG.isDirected()
+        if n == NKitG.upperNodeIdBound():
+            self.nkitGraph = graphtools.toUnweighted(NKitG) if NKitG.isWeighted() else Graph(NKitG)
+            self.nkitIds = list(self.vertices.keys())
+            self.nkitIndex = {k: i for i, k in enumerate(self.nkitIds)}
+            self.nkitDirtyVertices = []
+            self.nkitDirtyEdges = []
+
+    def writeEdgeList(self, file_name, folder= "EdgeLists"):
         self.updateNetworkitGraph()
-        writeGraph(self.nkitGraph, "./EdgeLists/" + file_name + ".el", graphio.Format(1))
+        writeGraph(self.nkitGraph, folder + "/" + file_name + ".el", graphio.Format(1))
 
-    def readEdgeList(self, file_name, latexpositonfile = False):
-        filepath = "EdgeLists/" + file_name + ".el"
-        reader = graphio.EdgeListReader(' ', 0)
-        NKitG  = reader.read(filepath)
+    def readEdgeList(self, file_name, latexpositonfile = False, folder= "EdgeLists"):
+        """
+        This function fills a void LatexGraph with the graph of the file '<folder>/<file_name>.el' (one 'src dst' or
+        'src dst weight' line per edge, with the vertices numbered from 0). The vertices are placed on the 1-circle, or
+        in the positions of '<folder>/<file_name>.lxp' if 'latexpositonfile' is True (the i-th row contains the position
+        of the vertex i). The files are parsed in chunks with NumPy and can be compressed with gzip ('.el.gz').
+        """
+        if self.numVertices != 0:
+            print("ERROR: G.readEdgeList() must be used on a void LatexGraph")
+            return
 
-        self.readFromNKitGraph(NKitG)
+        src, dst, weights = loadEdgeListArrays(findFile(folder + "/" + file_name + ".el"))
+        n = int(max(src.max(initial=-1), dst.max(initial=-1))) + 1
         if latexpositonfile:
-            fp = open("EdgeLists/" + file_name + ".lxp", "r")
-            count = 0
-            vnum = 0
-
-            while True:
-                count += 1
-
-                # Get next line from file
-                line = fp.readline()
-
-                # if line is empty
-                # end of file is reached
-                if not line:
-                    break
-                s = line.strip()
-                #print("Line %d: %s" % (count, s))
-                if s[0] != '#':
-                    #print("%d is not a comment" % count)
-                    tmp = [float(s.split()[0]), float(s.split()[1])]
-                    #print("float %f %f" % (tmp[0], tmp[1]))
-                    self.getVertex(vnum).position = tmp
-                    vnum += 1
-
-            fp.close()
+            positions = loadNumberArray(findFile(folder + "/" + file_name + ".lxp"), np.float64)[:, 0:2]
+            if len(positions) < n:
+                positions = np.concatenate((positions, circleLayout(n)[len(positions):]))
+            n = len(positions)
+        else:
+            positions = circleLayout(n)
+
+        self.addVerticesFromArrays(range(0, n), positions, range(0, n))
+        self.addEdgesFromArrays(src, dst, weights)
+        self.node_style  = "wstyle"
+        self.edges_style = "thiny"
+
+    def addVerticesFromArrays(self, keys, positions, names= None):
+        """ It adds the vertices with id keys[i], position positions[i], and name names[i] (if 'names' is given) """
+        if names is None:
+            names = [None] * len(keys)
+        for k, p, name in zip(keys, np.asarray(positions).tolist(), names):
+            k = vertexKey(k)
+            self.trackVertex(k)
+            self.vertices[k] = LatexVertex(k, p, name, None)
+        self.numVertices = len(self.vertices)
+
+    def addEdgesFromArrays(self, src, dst, weights= None):
+        """ It adds the edges from the src[i]-th to the dst[i]-th vertex (in the order of 'self.vertices') """
+        vertices = list(self.vertices.values())
+        if weights is None:
+            weights = np.zeros(len(src))
+        for f, t, w in zip(src.tolist(), dst.tolist(), np.asarray(weights).tolist()):
+            vertices[f].connectedTo[vertices[t]] = [w, None]
+        self.version += 1
+        if self.nkitGraph is not None:
+            self.nkitDirtyEdges.extend((vertices[f].id, vertices[t].id) for f, t in zip(src.tolist(), dst.tolist()))
 
     # --------------------------- Printing function -----------------------------------
     # The following functions are used to prepare the parameters for the Tikz functions
@@ -292,39 +610,70 @@ class LatexGraph:
     def set_edges_style(self, string):
         self.edges_style = string
 
-    def printAsEdgelistfile(self, file_name="G_edgelist"):
-        fpel  = open("EdgeLists/" + file_name + ".el", "w")
-        fplxp = open("EdgeLists/" + file_name + ".lxp", "w")
-        print("# edge list generated with LatexGraph", file= fpel)
-        print("# Nodes: %d Edges: %d" % (self.numVertices, -1), file= fpel)
-        print("# LatexGraph position file (the i-th rows represent the position of vertex i)", file= fplxp)
-        print("# Nodes: %d Edges: %d" % (self.numVertices, -1), file= fplxp)
-        for v in self.vertices.values():
-            print("%f %f" % (v.position[0], v.position[1]), file= fplxp)
-            for w in v.connectedTo.keys():
-                print("%s %s" % (v.id, w.id), file= fpel)
+    def printAsEdgelistfile(self, file_name="G_edgelist", folder= "EdgeLists", compress= False):
+        """
+        This function writes the graph in '<folder>/<file_name>.el' and its positions in '<folder>/<file_name>.lxp'
+        (gzip-compressed, with the extension '.gz', if 'compress' is True). The vertices are numbered in the order of
+        'self.vertices', so that the files can be read back with 'readEdgeList'.
+        """
+        ext = ".gz" if compress else ""
+        src, dst, weights = self.edgeArrays()
+        header = "# Nodes: %d Edges: %d\n" % (self.numVertices, len(src))
+        saveNumberArray(folder + "/" + file_name + ".el" + ext, np.column_stack((src, dst)), "%d %d\n",
+                        "# edge list generated with LatexGraph\n" + header)
+        saveNumberArray(folder + "/" + file_name + ".lxp" + ext, self.positionArray(), "%f %f\n",
+                        "# LatexGraph position file (the i-th rows represent the position of vertex i)\n" + header)
         
         
+    def spatialIndex(self):
+        """ It returns a SpatialIndex on the current positions of the vertices and on the edges """
+        src, dst, weights = self.edgeArrays()
+        return SpatialIndex(self.positionArray(), src, dst)
+
+    def cullViewport(self, rect, margin= None, index= None):
+        """
+        It returns two boolean arrays (visible_nodes, visible_edges) in the order of 'self.vertices' and 'edgeArrays':
+        an edge is visible if it crosses the rectangle 'rect' ([[x0, y0], [x1, y1]]) enlarged by 'margin' (by default
+        'self.cull_margin'), a node if it lies in the enlarged rectangle or if it is an end of a visible edge (the
+        edges refer to their ends' names). The numbers of invisible nodes and edges are stored in 'self.culled'.
+        A SpatialIndex built with 'spatialIndex' can be given to query many rectangles of the same graph.
+        """
+        margin = self.cull_margin if margin == None else margin
+        index = self.spatialIndex() if index == None else index
+        rect = [[min(rect[0][0], rect[1][0]) - margin, min(rect[0][1], rect[1][1]) - margin],
+                [max(rect[0][0], rect[1][0]) + margin, max(rect[0][1], rect[1][1]) + margin]]
+
+        visible_nodes = np.zeros(len(index.positions), dtype=bool)
+        visible_edges = np.zeros(len(index.src), dtype=bool)
+        visible_nodes[index.queryPoints(rect)] = True
+        edges = index.queryEdges(rect)
+        visible_edges[edges] = True
+        visible_nodes[index.src[edges]] = True
+        visible_nodes[index.dst[edges]] = True
+        self.culled = [int(len(visible_nodes) - visible_nodes.sum()), int(len(visible_edges) - visible_edges.sum())]
+        return visible_nodes, visible_edges
+
     # --------------------- Tikz functions -------------------------
-    # The following functions are used to print the LaTex/Tikz code
+    # The following functions are used to print the LaTex/Tikz code. Every 'iter_*' function is a generator which
+    # yields the code line by line; the printing functions pass it to a TikzWriter (see 'writeTikz').
     
-    def nodes(self, output, prefix= ""):
+    def iter_nodes(self, prefix= "", visible= None):
         """
-        This function prints the tikz lines relative to all the graph's vertices.
+        This function yields the tikz lines relative to all the graph's vertices.
         If a vertex has a 'None' value in the field 'color', it will be printed with color setted in the LatexGraph's
         'node_style', and, if the field 'name' is None, the node will be printed without text inside.
+        If 'visible' is a boolean array (see 'cullViewport'), only the k-th vertices with visible[k] True are printed.
         """
-        for i in list(self.vertices.keys()):
-            v = self.getVertex(i)
-            
+        line = prefix + "\t\t\\node [style=%s] (%s) at (%1.3f,%1.3f) {%s};\n"
+        for k, (i, v) in enumerate(self.vertices.items()):
+            if visible is not None and not visible[k]:
+                continue
             if v.style==None:
                 vertex_style = self.node_style
             else:
                 vertex_style = v.style
 
-            if not self.isStyleDefined(vertex_style):
-                print("ERROR: the style %s is not defined" % vertex_style)
-                raise ValueError()
+            self.styles.check(vertex_style)
             
             if v.name==None:
                 vertex_string = ""
@@ -332,61 +681,161 @@ class LatexGraph:
                 if vertex_style != "black":
                     vertex_string = "%s" % v.name
                 else:
-                    vertex_string = "\color{white} %s" % v.name
-            
+                    vertex_string = "\\color{white} %s" % v.name
 
-            print(prefix + "\t\t\\node [style=%s] (%s) at (%1.3f,%1.3f) {%s};" % (vertex_style, i, v.position[0], v.position[1], vertex_string), file= output)
-            
+            yield line % (vertex_style, i, v.position[0], v.position[1], vertex_string)
+
+    def nodes(self, output, prefix= ""):
+        """ This function prints the lines of 'iter_nodes' """
+        writeTikz(self.iter_nodes(prefix), output)
         
     def edge_middle_string(self, v, u, s=None):
         middle_string = "to"
         return middle_string
         
-    def edges(self, output, prefix= ""):
+    def visibleEdges(self, visible= None):
+        """ It removes from the mask 'visible' the duplicated edges of an undirected graph (and counts them) """
+        self.duplicates = 0
+        if self.directed != False:
+            return visible
+        keep, self.duplicates = self.undirectedEdgeIndex()
+        return keep if visible is None else keep & visible
+
+    def iter_edges(self, prefix= "", visible= None):
         """
-        This function prints the tikz lines relative to all the graph's edges.
+        This function yields the tikz lines relative to all the graph's edges.
+        If 'visible' is a boolean array (see 'cullViewport'), only the k-th edges (in the order of 'edgeArrays') with
+        visible[k] True are printed; if the graph is undirected, the duplicated edges are not printed.
         """
-        for i in self.vertices:
-            v = self.getVertex(i)
-            for u in v.connectedTo:
+        visible = self.visibleEdges(visible)
+        if self.coalesce:
+            yield from self.iter_coalesced_edges(prefix, visible)
+            return
+        line = prefix + "\t\t\\draw [style=%s] (%s.center) %s (%s.center);\n"
+        k = -1
+        for v in self.vertices.values():
+            for u, (w, c) in v.connectedTo.items():
+                k += 1
+                if visible is not None and not visible[k]:
+                    continue
                 
-                if (v.getColor(u) == None):
+                if (c == None):
                     style = self.edges_style
                 else:
-                    style = v.connectedTo[u][1]
+                    style = c
 
-                if not self.isStyleDefined(style):
-                    print("ERROR: the style %s is not defined" % style)
-                    raise ValueError()
+                self.styles.check(style)
                 
-                print(prefix + "\t\t\draw [style=%s] (%s.center) %s (%s.center);" % (style, v.getId(), self.edge_middle_string(v, u), u.getId()), file= output)
+                yield line % (style, v.getId(), self.edge_middle_string(v, u), u.getId())
 
-    def decoration_shapes_fn (self, output, prefix= ""):
+    def iter_coalesced_edges(self, prefix= "", visible= None):
+        """
+        This function yields the edges selected by 'visible' (by default all) grouped by style (in the order of their
+        first edges): for every style, one '\\draw' command every 'coalesce_chunk' edges (or one per edge if the style
+        has arrow tips or decorations).
+        """
+        line = prefix + "\t\t\\draw [style=%s] (%s.center) %s (%s.center);\n"
+        src, dst, weights = self.edgeArrays()
+        styles = self.edgeStyleArray()
+        selected = np.arange(len(src)) if visible is None else np.nonzero(visible)[0]
+        # the groups are in the order of the first edge of every style, which does not depend on the styles' ids
+        used, first, inverse = np.unique(styles[selected], return_index=True, return_inverse=True)
+        rank = np.argsort(np.argsort(first))
+        selected = selected[np.argsort(rank[inverse.ravel()], kind="stable")]
+        bounds = np.flatnonzero(np.diff(styles[selected])) + 1
+
+        ids = list(self.vertices.keys())
+        if type(self).edge_middle_string is not LatexGraph.edge_middle_string:
+            vertices = list(self.vertices.values())
+            middle = lambda f, t: self.edge_middle_string(vertices[f], vertices[t])
+        else:
+            middle = None
+
+        for group in np.split(selected, bounds):
+            if len(group) == 0:
+                continue
+            style = self.styles.name(int(styles[group[0]]))
+            self.styles.check(style)
+            pairs = zip(src[group].tolist(), dst[group].tolist())
+            if not self.styles.isCoalescible(style):
+                for f, t in pairs:
+                    yield line % (style, ids[f], middle(f, t) if middle else "to", ids[t])
+                continue
+            segments = ["(%s.center) %s (%s.center)" % (ids[f], middle(f, t) if middle else "--", ids[t]) for f, t in pairs]
+            for start in range(0, len(segments), self.coalesce_chunk):
+                yield prefix + "\t\t\\draw [style=%s] %s;\n" % (style, " ".join(segments[start:start + self.coalesce_chunk]))
+
+    def edges(self, output, prefix= ""):
+        """ This function prints the lines of 'iter_edges' """
+        writeTikz(self.iter_edges(prefix), output)
+
+    def iter_decoration_shapes (self, prefix= ""):
         for f in self.decoration_shapes:
-            print(prefix + "%s" % (f.print_shape_code_line()), file= output)
-        
-    def printTikz(self, output= None, prefix= ""):
+            yield prefix + f.print_shape_code_line() + "\n"
+
+    def decoration_shapes_fn (self, output, prefix= ""):
+        writeTikz(self.iter_decoration_shapes(prefix), output)
+
+    def iter_tikz(self, prefix= ""):
         """
-        This function prints the entire tikz code by using the functions 'nodes' and 'edges'.
+        This function yields the entire tikz code by using the functions 'iter_nodes' and 'iter_edges'.
         """
-        print(prefix + "\\begin{tikzpicture}", file= output)
+        self.syncCustomStyles()
+        visible_nodes = None
+        visible_edges = None
+        if self.clip_params != None and self.culling:
+            visible_nodes, visible_edges = self.cullViewport(self.clip_params)
+
+        yield prefix + "\\begin{tikzpicture}\n"
+        if self.clip_params != None and self.culling and sum(self.culled) > 0:
+            yield prefix + "\t%% culled %d nodes and %d edges outside the clip rectangle\n" % (self.culled[0], self.culled[1])
         
-        print(prefix + "\t\\begin{pgfonlayer}{nodelayer}", file= output)
+        yield prefix + "\t\\begin{pgfonlayer}{nodelayer}\n"
         if (self.clip_params != None):
-            print(prefix + "\t\\clip (%f,%f) rectangle (%f,%f);" % (self.clip_params[0][0], self.clip_params[0][1], self.clip_params[1][0], self.clip_params[1][1]), file= output)
-        self.nodes(output, prefix)
-        print(prefix + "\t\end{pgfonlayer}", file= output)
+            yield prefix + "\t\\clip (%f,%f) rectangle (%f,%f);\n" % (self.clip_params[0][0], self.clip_params[0][1], self.clip_params[1][0], self.clip_params[1][1])
+        yield from self.iter_nodes(prefix, visible_nodes)
+        yield prefix + "\t\\end{pgfonlayer}\n"
         
-        print(prefix + "\t\\begin{pgfonlayer}{edgelayer}", file= output)
+        yield prefix + "\t\\begin{pgfonlayer}{edgelayer}\n"
         if (self.clip_params != None):
-            print(prefix + "\t\\clip (%f,%f) rectangle (%f,%f);" % (self.clip_params[0][0], self.clip_params[0][1], self.clip_params[1][0], self.clip_params[1][1]), file= output)
+            yield prefix + "\t\\clip (%f,%f) rectangle (%f,%f);\n" % (self.clip_params[0][0], self.clip_params[0][1], self.clip_params[1][0], self.clip_params[1][1])
         if (self.grid_params != None):
-            print(prefix + "\t\\draw[thick,color=gray!25!white,step=1cm,dashed] (%f,%f) grid (%f,%f);" % (self.grid_params[0][0], self.grid_params[0][1], self.grid_params[1][0], self.grid_params[1][1]), file= output)
-        self.edges(output, "\t" + prefix)
-        self.decoration_shapes_fn(output, "\t" + prefix)
-        print(prefix + "\t\end{pgfonlayer}", file= output)
+            yield prefix + "\t\\draw[thick,color=gray!25!white,step=1cm,dashed] (%f,%f) grid (%f,%f);\n" % (self.grid_params[0][0], self.grid_params[0][1], self.grid_params[1][0], self.grid_params[1][1])
+        yield from self.iter_edges("\t" + prefix, visible_edges)
+        if self.directed == False and self.duplicates > 0:
+            yield prefix + "\t%% removed %d duplicated undirected edges\n" % self.duplicates
+        yield from self.iter_decoration_shapes("\t" + prefix)
+        yield prefix + "\t\\end{pgfonlayer}\n"
         
-        print(prefix + "\end{tikzpicture}", file= output)
+        yield prefix + "\\end{tikzpicture}\n"
+
+    def printTikz(self, output= None, prefix= ""):
+        """
+        This function prints the entire tikz code (see 'iter_tikz') in 'output' (by default the standard output).
+        """
+        writeTikz(self.iter_tikz(prefix), output)
+
+    def vertexContent(self):
+        """ It returns the names and the styles' names of the vertices, in the order of 'vertices' """
+        vertices = self.vertices.values()
+        return [v.name for v in vertices], [v.style for v in vertices]
+
+    def contentHash(self):
+        """
+        It returns a hash of everything that changes the tikz code of the graph: the ids, positions, names, and styles
+        of the vertices, the edges and their styles, the graph's options, the decoration shapes, the custom styles, and
+        the preambles ('PREAMBLE_VERSION'). It is the key of the graph's code in a RenderCache (see 'iter_cached_tikz').
+        """
+        src, dst, weights = self.edgeArrays()
+        edge_styles, edge_style_ids = styleNamesArray(self.styles, self.edgeStyleArray())
+        names, vertex_styles = self.vertexContent()
+        return hashParts(type(self).__name__, PREAMBLE_VERSION,
+                         list(self.vertices.keys()), self.positionArray(), names, vertex_styles,
+                         src.astype(np.int64), dst.astype(np.int64), edge_styles, edge_style_ids,
+                         self.node_style, self.edges_style, self.clip_params, self.grid_params, self.directed,
+                         self.coalesce, self.coalesce_chunk, self.culling, self.cull_margin,
+                         [f.print_shape_code_line() for f in self.decoration_shapes],
+                         [s.printStyleCodeLine() for s in self.custom_tikz_styles])
             
 
 
@@ -459,30 +908,385 @@ class LatexVertex:
         """ It returns the vertex id """
         return self.id
     
+# ================================================ Streaming output ===================================================
+# All the printing functions are built on generators which yield the LaTex/Tikz code in chunks (usually one line per
+#  chunk). A TikzWriter collects these chunks and passes them to the output in few big 'write' calls, so that also a
+#  picture with millions of edges can be streamed to a file (or a socket) with constant memory.
+
+class TikzWriter:
+    """
+    A TikzWriter buffers the chunks given by 'write' and writes them in 'output' every time that the buffer contains
+    at least 'buffer_size' characters. The output can be a text file (by default the standard output) or a socket.
+    """
+    def __init__ (self, output= None, buffer_size= 1 << 16):
+        self.output = output
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.buffered = 0
+
+    def write(self, chunk):
+        self.buffer.append(chunk)
+        self.buffered += len(chunk)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def writeChunks(self, chunks):
+        for chunk in chunks:
+            self.write(chunk)
+
+    def flush(self):
+        if self.buffered == 0:
+            return
+        text = "".join(self.buffer)
+        output = self.output if self.output != None else sys.stdout
+        if hasattr(output, "write"):
+            output.write(text)
+        else:
+            output.sendall(text.encode())
+        self.buffer = []
+        self.buffered = 0
+
+def writeTikz(chunks, output= None):
+    """ This function writes all the chunks yielded by a generator (as 'LatexGraph.iter_tikz()') in 'output' """
+    writer = TikzWriter(output)
+    writer.writeChunks(chunks)
+    writer.flush()
+
+# ==================================================== Networkit =====================================================
+
+def networkitFromArrays(n, src, dst, directed= False):
+    """
+    This function builds a networkit Graph with n nodes and the edges (src[k], dst[k]) inserted once; if the graph is
+    undirected also the edges given in both directions are inserted once.
+    """
+    if directed:
+        a = src
+        b = dst
+    else:
+        a = np.minimum(src, dst)
+        b = np.maximum(src, dst)
+    key = np.unique(a * max(n, 1) + b)
+    G = Graph(n, directed=directed)
+    if len(key) > 0:
+        G.addEdges((key // max(n, 1), key % max(n, 1)))
+    return G
+
+# =================================================== Edge lists ======================================================
+# Bulk readers and writers for the '.el' (edge list) and '.lxp' (positions) files. The files are plain text with '#'
+#  comments, optionally compressed with gzip when the name ends with '.gz'.
+
+def openText(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+def findFile(path):
+    """ It returns 'path', or 'path.gz' if only the compressed file exists """
+    if not os.path.exists(path) and os.path.exists(path + ".gz"):
+        return path + ".gz"
+    return path
+
+def parseNumbers(data, dtype):
+    """
+    It parses the numbers in the bytes 'data' (with 'np.loadtxt') skipping the empty and the comment lines; it
+    returns (numbers, columns), where 'columns' is the number of numbers of every line. A line with a different number
+    of numbers or with a token which is not a number raises a ValueError.
+    """
+    try:
+        with warnings.catch_warnings():
+            # the chunks with only comments are not an error
+            warnings.simplefilter("ignore", UserWarning)
+            table = np.loadtxt(io.BytesIO(data), dtype=dtype, comments="#", ndmin=2)
+    except (ValueError, OverflowError) as e:
+        print("ERROR: %s" % e)
+        raise ValueError()
+    if table.size == 0:
+        return np.zeros(0, dtype=dtype), 0
+    return table.ravel(), table.shape[1]
+
+def loadNumberArray(path, dtype, chunk_size= 1 << 24):
+    """
+    This function reads a table of numbers (one row per line) reading 'chunk_size' bytes at a time; it returns a 2D
+    array with the columns of the first row (all the rows must have the same number of columns, see 'parseNumbers').
+    """
+    blocks = []
+    columns = 0
+    rest = b""
+    lines = 0
+    with openText(path, "rb") as fp:
+        while True:
+            data = fp.read(chunk_size)
+            if not data:
+                break
+            data = rest + data
+            cut = data.rfind(b"\n") + 1
+            data, rest = data[:cut], data[cut:]
+            blocks.append(parseNumberChunk(path, data, dtype, lines))
+            lines += data.count(b"\n")
+        blocks.append(parseNumberChunk(path, rest, dtype, lines))
+
+    for numbers, cols in blocks:
+        if cols != 0 and columns != 0 and cols != columns:
+            print("ERROR: the rows of %s have %d and %d columns" % (path, columns, cols))
+            raise ValueError()
+        columns = columns or cols
+    return np.concatenate([numbers for numbers, cols in blocks]).reshape(-1, max(columns, 2))
+
+def parseNumberChunk(path, data, dtype, lines):
+    """ It runs 'parseNumbers' on the chunk of 'path' after the first 'lines' lines """
+    try:
+        return parseNumbers(data, dtype)
+    except ValueError:
+        print("ERROR: in %s, the rows are counted from the line %d" % (path, lines + 1))
+        raise
+
+def loadEdgeListArrays(path):
+    """ It returns the arrays (src, dst, weights) of an edge list file (weights is None if the file has 2 columns) """
+    with openText(path, "rb") as fp:
+        first = b"#"
+        while first.lstrip().startswith(b"#"):
+            first = fp.readline()
+    if len(first.split()) > 2:
+        table = loadNumberArray(path, np.float64)
+        return table[:, 0].astype(np.int64), table[:, 1].astype(np.int64), table[:, 2]
+    table = loadNumberArray(path, np.int64)
+    return table[:, 0], table[:, 1], None
+
+def saveNumberArray(path, table, line_format, header= "", chunk_rows= 1 << 18):
+    """ This function writes the rows of 'table' with 'line_format' (e.g. '%d %d\\n'), 'chunk_rows' rows at a time """
+    with openText(path, "wt") as fp:
+        fp.write(header)
+        for start in range(0, len(table), chunk_rows):
+            chunk = table[start:start + chunk_rows]
+            fp.write((line_format * len(chunk)) % tuple(chunk.ravel().tolist()))
+
+# ================================================== Spatial index ====================================================
+# A uniform grid on the vertices' positions and on the edges, used to find the objects which are visible in a
+#  rectangle without testing all of them.
+
+def gatherRanges(start, count):
+    """ It returns the concatenation of the ranges start[i] .. start[i] + count[i] - 1 """
+    total = int(count.sum())
+    return np.repeat(start - (np.cumsum(count) - count), count) + np.arange(0, total)
+
+def segmentsCrossRectangle(A, B, rect):
+    """
+    It returns a boolean array whose k-th element is True if the segment A[k]B[k] intersects the rectangle 'rect':
+    the bounding boxes must overlap and the four corners cannot lie strictly on the same side of the segment's line.
+    """
+    (x0, y0), (x1, y1) = rect
+    overlap = ((np.maximum(A[:, 0], B[:, 0]) >= x0) & (np.minimum(A[:, 0], B[:, 0]) <= x1) &
+               (np.maximum(A[:, 1], B[:, 1]) >= y0) & (np.minimum(A[:, 1], B[:, 1]) <= y1))
+    D = B - A
+    sides = [np.sign(D[:, 0] * (y - A[:, 1]) - D[:, 1] * (x - A[:, 0])) for x, y in [(x0, y0), (x0, y1), (x1, y0), (x1, y1)]]
+    same_side = ((sides[0] > 0) & (sides[1] > 0) & (sides[2] > 0) & (sides[3] > 0)) | ((sides[0] < 0) & (sides[1] < 0) & (sides[2] < 0) & (sides[3] < 0))
+    return overlap & ~same_side
+
+class SpatialIndex:
+    """
+    A SpatialIndex is a uniform grid of 'side' x 'side' cells on the bounding box of the points 'positions'.
+    It is composed by:
+        -----------
+        > positions, src and dst : numpy.ndarray
+            The points and the edges (the k-th edge is the segment from positions[src[k]] to positions[dst[k]]).
+
+        > point_order and point_start : numpy.ndarray
+            The points sorted by cell: the points of the cell c are point_order[point_start[c]:point_start[c+1]].
+
+        > edge_order, edge_start and long_edges : numpy.ndarray
+            The edges whose bounding box covers at most 2x2 cells are stored in all these cells in the same way of the
+            points; the other ones are listed in 'long_edges' and are tested at every query.
+        -----------
+    """
+    def __init__(self, positions, src= None, dst= None, side= None):
+        self.positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        self.src = np.zeros(0, dtype=np.int64) if src is None else np.asarray(src, dtype=np.int64)
+        self.dst = np.zeros(0, dtype=np.int64) if dst is None else np.asarray(dst, dtype=np.int64)
+        n = len(self.positions)
+        self.side = int(min(max(math.isqrt(max(n // 2, 1)), 1), 1024)) if side == None else side
+        if n > 0:
+            self.lo = self.positions.min(axis=0)
+            self.cell_size = max(float((self.positions.max(axis=0) - self.lo).max()), 1e-9) / self.side
+        else:
+            self.lo = np.zeros(2)
+            self.cell_size = 1.0
+
+        cells = self.cellOf(self.positions)
+        self.point_order, self.point_start = self.bucket(cells[:, 0] * self.side + cells[:, 1])
+
+        a = cells[self.src]
+        b = cells[self.dst]
+        lo = np.minimum(a, b)
+        hi = np.maximum(a, b)
+        short = ((hi - lo) <= 1).all(axis=1)
+        self.long_edges = np.nonzero(~short)[0]
+        edges = []
+        edge_cells = []
+        for dx in range(0, 2):
+            for dy in range(0, 2):
+                k = np.nonzero(short & (lo[:, 0] + dx <= hi[:, 0]) & (lo[:, 1] + dy <= hi[:, 1]))[0]
+                edges.append(k)
+                edge_cells.append((lo[k, 0] + dx) * self.side + lo[k, 1] + dy)
+        edges = np.concatenate(edges)
+        order, self.edge_start = self.bucket(np.concatenate(edge_cells))
+        self.edge_order = edges[order]
+
+    def cellOf(self, points):
+        return np.clip(((points - self.lo) / self.cell_size).astype(np.int64), 0, self.side - 1)
+
+    def bucket(self, cell_ids):
+        """ It sorts the items by cell and returns (order, start) with start[c] the first item of the cell c """
+        order = np.argsort(cell_ids, kind="stable")
+        count = np.bincount(cell_ids, minlength=self.side * self.side)
+        return order, np.concatenate(([0], np.cumsum(count)))
+
+    def candidates(self, rect, order, start):
+        """ It returns the items stored in the cells which overlap the rectangle 'rect' """
+        (x0, y0), (x1, y1) = rect
+        c0 = np.floor((np.array([x0, y0]) - self.lo) / self.cell_size).astype(np.int64)
+        c1 = np.floor((np.array([x1, y1]) - self.lo) / self.cell_size).astype(np.int64)
+        if (c1 < 0).any() or (c0 >= self.side).any():
+            return np.zeros(0, dtype=np.int64)
+        c0 = np.maximum(c0, 0)
+        c1 = np.minimum(c1, self.side - 1)
+        cx, cy = np.meshgrid(np.arange(c0[0], c1[0] + 1), np.arange(c0[1], c1[1] + 1), indexing="ij")
+        cells = (cx * self.side + cy).ravel()
+        return order[gatherRanges(start[cells], start[cells + 1] - start[cells])]
+
+    def queryPoints(self, rect):
+        """ It returns the indices of the points in the rectangle 'rect' ([[x0, y0], [x1, y1]]) """
+        (x0, y0), (x1, y1) = rect
+        k = self.candidates(rect, self.point_order, self.point_start)
+        P = self.positions[k]
+        return np.sort(k[(P[:, 0] >= x0) & (P[:, 0] <= x1) & (P[:, 1] >= y0) & (P[:, 1] <= y1)])
+
+    def queryEdges(self, rect):
+        """ It returns the indices of the edges which intersect the rectangle 'rect' """
+        k = np.unique(np.concatenate((self.candidates(rect, self.edge_order, self.edge_start), self.long_edges)))
+        return k[segmentsCrossRectangle(self.positions[self.src[k]], self.positions[self.dst[k]], rect)]
+
+# ================================================ Graphs composition =================================================
+# The ids of the vertices are always strings; a tuple id as (panel, id) is stored as the string 'panel/id', so that the
+#  composition of many graphs can give to every one its namespace without renaming the ids with suffixes.
+
+def vertexKey(n):
+    """
+    It returns the string used as key of the vertex with id 'n'; the tuple ('panel', 3) is the key 'panel/3' (the
+    nested tuples are flattened), so the parts of a tuple cannot contain '/', otherwise ('a/b', 'c') and ('a', 'b/c')
+    would be the same vertex.
+    """
+    if isinstance(n, tuple):
+        parts = []
+        for p in n:
+            if isinstance(p, tuple):
+                parts.append(vertexKey(p))
+            elif "/" in str(p):
+                print("ERROR: the part %r of the vertex id %r contains '/'" % (p, n))
+                raise ValueError()
+            else:
+                parts.append(str(p))
+        return "/".join(parts)
+    return str(n)
+
+def composeInto(O, graphs, renames):
+    """
+    This function adds to the graph 'O' a copy of every graph in 'graphs'; the vertex with key k of graphs[i] becomes
+    the vertex renames[i](k) of 'O'. The input graphs are not modified and the cost is linear in their total size.
+    """
+    for G, rename in zip(graphs, renames):
+        node_style = None if G.node_style == O.node_style else G.node_style
+        edges_style = None if G.edges_style == O.edges_style else G.edges_style
+
+        for k, v in G.vertices.items():
+            style = v.style if v.style != None else node_style
+            O.addVertex(rename(k), list(v.position), v.name, style)
+        for k, v in G.vertices.items():
+            f = rename(k)
+            for u, (w, c) in v.connectedTo.items():
+                O.addEdge(f, rename(u.getId()), w, c if c != None else edges_style)
+
+        # 'O.styles' may already be merged with the styles of 'graphs' (see '__add__'), so the list is checked
+        names = set(sty.name for sty in O.custom_tikz_styles)
+        for sty in G.custom_tikz_styles:
+            if sty.name not in names:
+                O.custom_tikz_styles.append(sty)
+                names.add(sty.name)
+            O.styles.addCustomStyle(sty)
+        for ds in G.decoration_shapes:
+            O.decoration_shapes.append(copy.deepcopy(ds))
+        O.clip_params = unionRectangle(O.clip_params, G.clip_params)
+        O.grid_params = unionRectangle(O.grid_params, G.grid_params)
+    return O
+
+def compose(graphs, namespaces= None, into= None):
+    """
+    This function returns a new LatexGraph with the union of 'graphs', built in one O(V+E) pass and without modifying
+    the inputs. The vertex with id k of the i-th graph gets the id (namespaces[i], k) (by default namespaces[i] = i);
+    e.g. 'compose([A, B], ["A", "B"]).getVertex(("B", 3))'.
+    The node and edge styles of the result are the ones of the first graph; the vertices and edges of the other graphs
+    that use their graph's default style get it explicitly; the result is directed if one of the graphs is. Custom
+    styles, decoration shapes, and clip/grid rectangles are merged. The result is written in 'into' if given (e.g. a CompactLatexGraph).
+    """
+    graphs = list(graphs)
+    if namespaces == None:
+        namespaces = range(0, len(graphs))
+    O = into if into != None else LatexGraph()
+    if len(graphs) > 0:
+        O.node_style = graphs[0].node_style
+        O.edges_style = graphs[0].edges_style
+        O.directed = combineDirected([G.directed for G in graphs])
+
+    # the keys of the graphs are already strings (possibly 'a/b'), so only the namespace is checked
+    renames = [(lambda ns: lambda k: vertexKey((ns,)) + "/" + k)(ns) for ns in namespaces]
+    return composeInto(O, graphs, renames)
+
+def combineDirected(flags):
+    """ It returns the 'directed' flag of the union of graphs: True if one of them is directed, else False if one is undirected """
+    if True in flags:
+        return True
+    if False in flags:
+        return False
+    return None
+
+def unionRectangle(r, s):
+    """ It returns the smallest rectangle [[x0,y0],[x1,y1]] that contains r and s (each of them can be None) """
+    if r == None:
+        return None if s == None else [list(s[0]), list(s[1])]
+    if s == None:
+        return r
+    return [[min(r[0][0], s[0][0]), min(r[0][1], s[0][1])], [max(r[1][0], s[1][0]), max(r[1][1], s[1][1])]]
+
 # ============================================== TikzPreview functions ================================================
 # These functions generate and compile a '.tex' file in which the LatexGraph are showed. The files are by default
 #  generated in 'tikz_preview/'. A single file could also contain more then one LatexGraph.
 #  If you are interested in printing a '.tex' article or a beamer presentation see 'LatexFigure.py'
 
-def printPreviewPackages(output):
+def iter_preview_packages():
     """
-    This function prints the packages for the TiKZ preview latex file
+    This function yields the packages for the TiKZ preview latex file
     """
-    print("""
+    yield """
 \\usepackage[graphics,tightpage,active]{preview}
 \\PreviewEnvironment{tikzpicture}
 \\newlength{\\imagewidth}
 \\newlength{\\imagescale}
 
-""", file= output)
+
+"""
+
+def printPreviewPackages(output):
+    writeTikz(iter_preview_packages(), output)
+
+# the predefined edge styles with arrow tips or decorations, which must be drawn one edge at a time
+markedTikzStyles = ["arrow", "tick", "flow", "redarrow", "redarrow2", "greenarrow", "bluearrow", "axe"]
 
 predefinedTikzStyles = ["none", "rn", "gn", "yn", "blstyle", "wstyle", "gstyle", "little", "littlered", "littlepink", "littlew", "simple", "arrow", "tick", "redstyle", "bluestyle", "greenstyle", "flow", "redarrow", "redarrow2", "greenarrow", "bluearrow", "axe", "thiny", "trat", "edgenone"]
 
-def printTikzPreambles(output, customTikzStyles=None):
+def iter_tikz_preambles(customTikzStyles=None):
     """
-    This function prints the needed TIKZ-preambles for the LaTex document.
+    This function yields the needed TIKZ-preambles for the LaTex document.
     """
-    print("""% =========================================== Tikz setting ================================================
+    yield """% =========================================== Tikz setting ================================================
 %\\usepackage[svgnames]{xcolor}
 \\usepackage{tikz}
 \\usepackage{tikzscale}
@@ -523,16 +1327,45 @@ def printTikzPreambles(output, customTikzStyles=None):
 \\tikzstyle{thiny}=[-,draw=lightgray,line width=1.000]
 \\tikzstyle{trat}=[thick,color=gray!25!white,step=1em,dashed]
 \\tikzstyle{edgenone}=[-,draw=white,line width=0.000]
-""", file= output)
+
+"""
 
     if customTikzStyles != None:
         for style in customTikzStyles:
-            print(style.printStyleCodeLine(), file= output)
+            yield style.printStyleCodeLine() + "\n"
 
-    print("% ------------------------------------------------------------------------------------------", file= output)
+    yield "% ------------------------------------------------------------------------------------------\n"
 
+def printTikzPreambles(output, customTikzStyles=None):
+    writeTikz(iter_tikz_preambles(customTikzStyles), output)
 
-def printTikzPreview(Gvec, output="tikz_preview", out_folder="tikz_preview"):
+# the hash of the predefined preambles: the cached figures are invalidated when the predefined styles change
+PREAMBLE_VERSION = hashParts("".join(iter_tikz_preambles()), "".join(iter_preview_packages()))
+
+
+def iter_tikz_preview(Gvec, custom_tikz_styles):
+    """ This function yields the whole preview document of the LatexGraphs in Gvec """
+    yield """\\documentclass{article}
+\\usepackage[utf8]{inputenc}
+
+\\title{TiKZ Preview}
+\\author{Lorenzo Pichetti}
+
+"""
+    yield from iter_tikz_preambles(custom_tikz_styles)
+    yield from iter_preview_packages()
+    yield "\\begin{document}\n"
+    for G in Gvec:
+        yield from G.iter_tikz()
+    yield "\\end{document}\n"
+
+def printTikzPreview(Gvec, output="tikz_preview", out_folder="tikz_preview", compile= False, engine= None, cache= None):
+    """
+    This function writes the preview document of the LatexGraphs in Gvec in '<out_folder>/<output>.tex'; if 'compile'
+    is True the document is also compiled with the TeX 'engine' (see 'showTikzPreview').
+    If 'cache' (a RenderCache) is given, the code and the PDF of an unchanged preview are taken from it; the returned
+    message reports the cache hits and misses.
+    """
 
     if (has_len(Gvec)):
         for G in Gvec:
@@ -544,26 +1377,58 @@ def printTikzPreview(Gvec, output="tikz_preview", out_folder="tikz_preview"):
             for sty in G.custom_tikz_styles:
                 custom_tikz_styles.append(sty)
 
-        fp = open(out_folder + "/" + output + ".tex", "w")
+        chunks = iter_tikz_preview(Gvec, custom_tikz_styles)
+        if cache != None:
+            hits, misses = cache.hits, cache.misses
+            chunks = iter_cached(cache, hashParts("preview", [G.contentHash() for G in Gvec]), "tex", chunks)
+        with open(out_folder + "/" + output + ".tex", "w") as fp:
+            writeTikz(chunks, fp)
 
-        print("""\\documentclass{article}
-\\usepackage[utf8]{inputenc}
+        if compile:
+            message = showTikzPreview(output, out_folder, engine, cache= cache).report()
+        else:
+            message = "Succesfully printed in %s" % (out_folder + '/' + output + '.tex')
+        if cache != None:
+            message += " (render cache: %d hits, %d misses)" % (cache.hits - hits, cache.misses - misses)
+        return message
 
-\\title{TiKZ Preview}
-\\author{Lorenzo Pichetti}
-""", file= fp)
-        printTikzPreambles(fp, custom_tikz_styles)
-        printPreviewPackages(fp)
-        print("\\begin{document}", file= fp)
-        for G in Gvec:
-            G.printTikz(output=fp)
-        print("\\end{document}", file= fp)
+    else:
+        return "Gvec must be a vector of LatexGraphs"
 
-        #subprocess.run(['pdflatex', '-interaction=nonstopmode', 'tikz_preview.tex'])
-        return "Succesfully printed in %s" % (out_folder + '/' + output + '.tex')
+# ================================================== Render cache =====================================================
+# The tikz code of the figures is stored in a RenderCache (see RenderCache.py) keyed by their 'contentHash', so that a
+#  document whose figures did not change is written without generating their code again.
 
+def styleNamesArray(styles, ids):
+    """
+    It returns the names of the distinct style ids in 'ids' (sorted by name) and, for every item of 'ids', the index of
+    its name: two graphs with the same styles give the same arrays, whatever the order of their StyleRegistries.
+    """
+    used, inverse = np.unique(np.asarray(ids, dtype=np.int64), return_inverse=True)
+    names = [styles.name(int(i)) for i in used]
+    order = sorted(range(0, len(names)), key=lambda k: (names[k] != None, str(names[k])))
+    rank = np.empty(len(names), dtype=np.int64)
+    rank[order] = np.arange(len(names))
+    return [names[k] for k in order], rank[inverse.reshape(-1)]
+
+def iter_cached(cache, key, kind, chunks):
+    """ It yields the text stored in 'cache' for (key, kind), or the 'chunks' (storing their text) if it is missing """
+    text = cache.getText(key, kind)
+    if text == None:
+        text = "".join(chunks)
+        cache.put(key, kind, text)
+    yield text
+
+def iter_cached_tikz(element, prefix= "", cache= None):
+    """
+    It yields the tikz code of 'element' (a LatexGraph, a LatexLattice, or any object with 'iter_tikz' and
+    'contentHash'); if 'cache' is given, the code is taken from it when the element did not change.
+    """
+    if cache == None:
+        yield from element.iter_tikz(prefix)
     else:
-        return "Gvec must be a vector of LatexGraphs"
+        yield from iter_cached(cache, hashParts("tikz", prefix, element.contentHash()), "tikz", element.iter_tikz(prefix))
+
 
 # ================================================ Predefined Graphs ==================================================
 # These functions return one of the predefined graphs (used for the tests and the testing functions)
@@ -684,12 +1549,75 @@ def vertexHighlight(G, i):
         u.color = "littlepink"
         v.connectedTo[u] = [0, 'greenstyle']
 
-import os
-def showTikzPreview(file_name = None):
+def showTikzPreview(file_name= None, out_folder= "tikz_preview", engine= None, viewer= None, timeout= 60, cache= None):
+    """
+    This function compiles '<out_folder>/<file_name>.tex' (by default the file written by 'printTikzPreview') with the
+    TeX 'engine' (see TexCompile) and opens the PDF with the program 'viewer' (if given, e.g. "okular"); it returns the
+    CompileResult and prints the errors if the compilation fails. The PDF is reused from 'cache' if possible.
+    """
     if file_name == None:
-        os.system('./tikz_preview/script.sh')
+        file_name = "tikz_preview"
+    if file_name.endswith(".tex"):
+        file_name = file_name[:-4]
+    with open(out_folder + "/" + file_name + ".tex", "r") as fp:
+        result = compileTex(fp.read(), file_name, out_folder, engine, timeout, cache= cache)
+    if not result.ok:
+        print("ERROR: " + result.report())
+    elif viewer != None:
+        subprocess.Popen([viewer, result.pdf])
+    return result
+
+
+# =============================================== Affine transformations ==============================================
+# These functions return 3x3 homogeneous matrices to be used with 'LatexGraph.transform'; they can be composed with
+#  '@' (e.g. 'affineTranslation([1,0]) @ affineRotation(math.pi/2)' rotates and then translates).
+
+def affineTranslation(vector):
+    T = np.eye(3)
+    T[0:2, 2] = vector
+    return T
+
+def affineScale(sx, sy= None):
+    if sy == None:
+        sy = sx
+    return np.diag([sx, sy, 1.0])
+
+def affineRotation(angle, center= None):
+    c = math.cos(angle)
+    s = math.sin(angle)
+    R = np.array([[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]])
+    if center is not None:
+        R = affineTranslation(center) @ R @ affineTranslation([-center[0], -center[1]])
+    return R
+
+def affineShear(kx, ky= 0):
+    return np.array([[1.0, kx, 0.0], [ky, 1.0, 0.0], [0.0, 0.0, 1.0]])
+
+def affineReflection(angle= 0):
+    c = math.cos(2*angle)
+    s = math.sin(2*angle)
+    return np.array([[c, s, 0.0], [s, -c, 0.0], [0.0, 0.0, 1.0]])
+
+def affineParts(matrix, offset= None):
+    """ It splits a 2x2 matrix (plus offset) or a 3x3 homogeneous matrix in its linear part and its offset """
+    matrix = np.asarray(matrix, dtype=float)
+    if matrix.shape == (3, 3):
+        M = matrix[0:2, 0:2]
+        t = matrix[0:2, 2].copy()
     else:
-        os.system('./tikz_preview/script.sh ' + file_name)
+        M = matrix.reshape(2, 2)
+        t = np.zeros(2)
+    if offset is not None:
+        t = t + np.asarray(offset, dtype=float)
+    return M, t
+
+def transformRectangle(rect, M, t):
+    """ It returns the bounding rectangle of the image of 'rect' ([[x0,y0],[x1,y1]] or None) under p -> M*p + t """
+    if rect is None:
+        return None
+    corners = np.array([[rect[0][0], rect[0][1]], [rect[1][0], rect[0][1]], [rect[1][0], rect[1][1]], [rect[0][0], rect[1][1]]], dtype=float)
+    corners = corners @ M.T + t
+    return [corners.min(axis=0).tolist(), corners.max(axis=0).tolist()]
 
 
 # ================================================= DecorationShapes ==================================================
@@ -781,6 +1709,26 @@ class DecorationShape:
         if not self.valid:
             print(supportedDecorationShapeString)
 
+    def transform(self, M, t):
+        """
+        This function maps the shape by p -> M*p + t. A rectangle that is not mapped in an axis-aligned rectangle
+        becomes a 'cycle'; the radius of a circle is multiplied by sqrt(|det M|) (exact for rotations and uniform
+        scaling).
+        """
+        if self.shape_type == "rectangle":
+            (x0, y0), (x1, y1) = self.coordinates
+            corners = np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], dtype=float) @ M.T + t
+            if M[0][1] == 0 and M[1][0] == 0:
+                self.coordinates = [corners.min(axis=0).tolist(), corners.max(axis=0).tolist()]
+            else:
+                self.coordinates = corners.tolist()
+                self.shape_type = "cycle"
+        elif self.shape_type == "circle":
+            centre = np.asarray(self.coordinates[0], dtype=float) @ M.T + t
+            self.coordinates = [centre.tolist(), self.coordinates[1] * math.sqrt(abs(np.linalg.det(M)))]
+        else:
+            self.coordinates = (np.asarray(self.coordinates, dtype=float) @ M.T + t).tolist()
+
     def print_shape_code_line(self):
         """
         This function prints the tikz code-lines related to a 'DecorationShape' object.
@@ -810,7 +1758,103 @@ class DecorationShape:
         return s
 
 # ==================================================== TikzStyles =====================================================
-# [ ... ]
+# A TikzStyle is a custom style that is printed in the preambles; a StyleRegistry collects the custom styles of a
+#  LatexGraph and answers in O(1) if a style name is defined.
+
+class StyleRegistry:
+    """
+    A StyleRegistry interns the names of the tikz styles in a hash table and caches which of them are defined (the
+    predefined ones and the custom TikzStyles added with 'addCustomStyle'), so that validating the style of a vertex or
+    an edge is a dictionary lookup. It is composed by:
+        -----------
+        > names and ids : [str, ...] and {str: int}
+            The style with id i is 'names[i]'; 'ids' is the inverse map. The ids are used by the CompactLatexGraph to
+            store the styles of vertices and edges as small integers.
+
+        > custom : {str: TikzStyle}
+            The custom styles registered with 'addCustomStyle'.
+
+        > defined and coalescible : {str: bool}
+            The cached results of 'isDefined' and 'isCoalescible' for every name checked so far.
+        -----------
+    """
+    def __init__ (self):
+        self.names = []
+        self.ids = {}
+        self.custom = {}
+        self.defined = dict.fromkeys(predefinedTikzStyles, True)
+        self.coalescible = dict.fromkeys(markedTikzStyles, False)
+
+    def intern(self, style):
+        """ It returns the id of 'style' (adding it if needed); 'None' is mapped to -1 """
+        if style == None:
+            return -1
+        i = self.ids.get(style)
+        if i == None:
+            i = len(self.names)
+            self.names.append(style)
+            self.ids[style] = i
+        return i
+
+    def name(self, i):
+        """ It is the inverse of 'intern' """
+        if i < 0:
+            return None
+        return self.names[i]
+
+    def addCustomStyle(self, style):
+        self.custom[style.name] = style
+        # the names with options ('foo, thick') checked before were cached as undefined
+        self.defined = {k: d for k, d in self.defined.items() if d}
+        self.defined[style.name] = True
+        self.coalescible = {k: c for k, c in self.coalescible.items() if k.split(",")[0].strip() != style.name}
+
+    def isDefined(self, style):
+        """ A style is defined if it is predefined, custom, or a defined style followed by options ('none, thick') """
+        d = self.defined.get(style)
+        if d == None:
+            d = style in self.custom or ("," in style and self.isDefined(style.split(",")[0].strip()))
+            self.defined[style] = d
+        return d
+
+    def isCoalescible(self, style):
+        """
+        It returns True if the edges with this style can be drawn as segments of the same path, i.e. if the style
+        has no arrow tips and no decorations (which TikZ would apply to the whole path).
+        """
+        c = self.coalescible.get(style)
+        if c == None:
+            options = style
+            if style in self.custom:
+                options = self.custom[style].printStyleCodeLine()
+            c = not any(mark in options for mark in [">", "<", "latex", "stealth", "decorat", "postaction", "preaction"])
+            if "," in style:
+                c = c and self.isCoalescible(style.split(",")[0].strip())
+            self.coalescible[style] = c
+        return c
+
+    def check(self, style):
+        """ It raises a ValueError if 'style' is not defined """
+        if not self.isDefined(style):
+            print("ERROR: the style %s is not defined" % style)
+            raise ValueError()
+
+    def copy(self):
+        R = StyleRegistry()
+        R.names = list(self.names)
+        R.ids = dict(self.ids)
+        R.custom = dict(self.custom)
+        R.defined = dict(self.defined)
+        R.coalescible = dict(self.coalescible)
+        return R
+
+    def merge(self, other):
+        """ It returns a new registry with the styles of 'self' and the custom styles of 'other' (both are not modified) """
+        R = self.copy()
+        if other is not self:
+            for style in other.custom.values():
+                R.addCustomStyle(style)
+        return R
 
 class TikzStyle:
 
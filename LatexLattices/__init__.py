@@ -14,6 +14,37 @@
 
 
 from LatexGraph import *
+from CompactGraph import CompactLatexGraph
+
+from fractions import Fraction
+
+
+# ---------------------------------------------- Basis reduction ---------------------------------------------------
+# A lattice has infinitely many bases: [a, b] and [a, b] @ U for every unimodular integer matrix U. The reduced bases
+#  are made of short and almost orthogonal vectors, so that the points of a window are few steps away from each
+#  other; 'gaussReduce' computes the reduced basis of a 2D lattice (its first vector is a shortest vector of the
+#  lattice).
+
+def dot(u, v):
+    return sum(x * y for x, y in zip(u, v))
+
+def gaussReduce(a, b):
+    """
+    It returns the triple (u, v, U) where [u, v] is the Gauss-reduced basis of the lattice spanned by a and b
+    (|u| <= |v| and |<u, v>| <= |u|^2 / 2) and U is the unimodular matrix such that u = U[0][0] a + U[1][0] b and
+    v = U[0][1] a + U[1][1] b (i.e. the columns of U are the coefficients of u and v).
+    """
+    u, v = list(a), list(b)
+    cu, cv = [1, 0], [0, 1]
+    while True:
+        if dot(v, v) < dot(u, u):
+            u, v, cu, cv = v, u, cv, cu
+        m = round(Fraction(dot(u, v)) / Fraction(dot(u, u)))
+        if m == 0:
+            return u, v, [[cu[0], cv[0]], [cu[1], cv[1]]]
+        v = [y - m * x for x, y in zip(u, v)]
+        cv = [y - m * x for x, y in zip(cu, cv)]
+
 
 class LatexLattice:
     """
@@ -28,7 +59,23 @@ class LatexLattice:
             
         > graph, axes, and base : LatexGraph
             These are LatexGraphs that will be combined in the final LatexGraph which will represent the entire lattice.
+            The graph of the lattice's points is a CompactLatexGraph, loaded in bulk by 'construct_lattice'.
             
+        > built : {str: tuple}
+            The parameters with which the parts "graph", "axes", "base", and "generated" (the result of
+            'generatesLatexGraph') were built: every part is built lazily, when it is needed, and built again only if
+            its parameters changed (e.g. with 'set_a' or 'set_x'), so printing the same lattice many times costs one
+            construction.
+
+        > culling : bool
+            If True, the lattice's points and edges which are not visible in the window are not printed (see
+            'LatexGraph.cullViewport').
+
+        > corners, corners_radius, and corners_style : [[int, int], ...], float, and str
+            The origins of the translated fundamental domains (see 'add_corners_parallelepid') whose corners are
+            marked by disks of radius 'corners_radius' clipped to the domain, and the style of the disks. The disks
+            are printed by 'iter_overlay' as few '\\fill' paths of at most 'overlay_chunk' pieces each.
+
         > other parameters are used for other graphic options
 
     """
@@ -38,22 +85,29 @@ class LatexLattice:
         self.x = [-5,5]
         self.y = [-5,5]
         
-        self.graph = LatexGraph()
+        self.graph = CompactLatexGraph()
         self.axes = LatexGraph()
         self.base = LatexGraph()
         
         self.graph.set_node_style("little")
         self.graph.set_edges_style("thiny")
+        self.graph.directed = False
+        self.graph.coalesce = True
         self.graph.addVertex('0', [0,0])
         self.minx = 1
         self.miny = 1
         self.overset = 0.25
         self.grid = True
+        self.culling = True
         
         self.base_on = False
         self.parallelepid_on = False
         self.corners = []
         self.corners_radius = 0;
+        self.corners_style = "lime, opacity=0.5"
+        self.overlay_chunk = 200
+        self.built = {}
+        self.generated = None
         
     # ---------- setting ----------
     def calc_min (self):
@@ -74,7 +128,20 @@ class LatexLattice:
     def set_y(self, interval):
         self.y = [interval[0] - self.overset, interval[1] + self.overset]
         
+    def isBuilt(self, part, key):
+        """ It returns True if 'part' was built with the parameters 'key' """
+        return self.built.get(part) == key
+
+    def invalidate(self):
+        """ It forces the construction of all the parts at the next printing """
+        self.built = {}
+        self.generated = None
+
     def set_axes(self):
+        key = (tuple(self.x), tuple(self.y), self.overset)
+        if self.isBuilt("axes", key):
+            return
+        self.axes.clear()
         self.axes.addVertex('-X', [self.x[0] - self.overset, 0])
         self.axes.addVertex('+X', [self.x[1] + self.overset, 0])
         self.axes.addVertex('-Y', [0, self.y[0] - self.overset])
@@ -83,8 +150,13 @@ class LatexLattice:
         self.axes.addEdge('-Y','+Y')
         self.axes.set_edges_style("axe")
         self.axes.set_node_style("none")
+        self.built["axes"] = key
         
     def set_base(self):
+        key = (tuple(self.a), tuple(self.b))
+        if self.isBuilt("base", key):
+            return
+        self.base.clear()
         self.base.addVertex(0, [0,0])
         self.base.addVertex(1, self.a)
         self.base.addVertex(3, self.b)
@@ -92,6 +164,7 @@ class LatexLattice:
         self.base.addEdge(0, 3)
         self.base.set_edges_style("bluearrow")
         self.base.set_node_style("little")
+        self.built["base"] = key
         
     def set_parallelepid(self):
         self.parallelepid_on = True
@@ -100,6 +173,36 @@ class LatexLattice:
         tx = na*(self.a[0]) + nb*(self.b[0])
         ty = na*(self.a[1]) + nb*(self.b[1])
         self.corners.append([tx,ty])
+
+    def add_all_corners_in_window(self):
+        """ It adds (as 'add_corners_parallelepid') all the translated fundamental domains which meet the window """
+        domain = np.array(self.fundamental_domain())
+        low = np.array([self.x[0], self.y[0]]) - domain.max(axis=0)
+        high = np.array([self.x[1], self.y[1]]) - domain.min(axis=0)
+        coefficients, points = self.lattice_points(low, high)
+        self.corners.extend(points.tolist())
+
+    # ---------- basis ----------
+    def reduced_basis(self):
+        """ It returns the Gauss-reduced basis (u, v, U) of the lattice (see 'gaussReduce') """
+        return gaussReduce(self.a, self.b)
+
+    def shortest_vector(self):
+        """ It returns a shortest non-zero vector of the lattice """
+        return self.reduced_basis()[0]
+
+    def determinant(self):
+        """ It returns the area of the fundamental domain (the parallelepiped spanned by a and b) """
+        return abs(self.a[0] * self.b[1] - self.a[1] * self.b[0])
+
+    def fundamental_domain(self, reduced= False):
+        """
+        It returns the four corners [0, a, a + b, b] of the parallelepiped drawn by 'set_parallelepid' (or the ones
+        of the reduced basis, if 'reduced' is True); its translations by the points of the lattice (see
+        'add_corners_parallelepid') tile the plane.
+        """
+        u, v = (self.reduced_basis()[0:2]) if reduced else (self.a, self.b)
+        return [[0, 0], [u[0], u[1]], [u[0] + v[0], u[1] + v[1]], [v[0], v[1]]]
         
     def set_corners_radius(self, r):
         self.corners_radius = r;
@@ -113,91 +216,220 @@ class LatexLattice:
             return(0)
         return(1)
     
+    def lattice_points(self, low= None, high= None):
+        """
+        It returns the pair (coefficients, points) of the lattice's points i*a + j*b which are visible (see
+        'is_visible'), or which are in the rectangle [low, high] if it is given: the k-th point is points[k] = coefficients[k][0]*a + coefficients[k][1]*b. The points are
+        enumerated in the reduced basis (see 'reduced_basis'), whose coefficients' ranges are found by writing the
+        corners of the window in it: since the reduced basis is almost orthogonal, the number of candidates is
+        proportional to the area of the window, however skewed (a, b) is.
+        """
+        if abs(np.linalg.det(np.array([self.a, self.b], dtype=float))) < 1e-12:
+            print("ERROR: the vectors a and b must be linearly independent")
+            raise ValueError()
+        u, v, U = self.reduced_basis()
+        B = np.array([u, v]).T
+        if low is None:
+            low = np.array([self.x[0] - self.minx, self.y[0] - self.miny])
+            high = np.array([self.x[1] + self.minx, self.y[1] + self.miny])
+        corners = np.array([[low[0], low[1]], [low[0], high[1]], [high[0], low[1]], [high[0], high[1]]])
+        ij = np.linalg.solve(B.astype(float), corners.T)
+        i_range = np.arange(math.floor(ij[0].min() - 1e-9), math.ceil(ij[0].max() + 1e-9) + 1)
+        j_range = np.arange(math.floor(ij[1].min() - 1e-9), math.ceil(ij[1].max() + 1e-9) + 1)
+        I, J = np.meshgrid(i_range, j_range, indexing="ij")
+        coefficients = np.stack((I.ravel(), J.ravel()), axis=1)
+        points = coefficients @ B.T
+        visible = np.all((points >= low) & (points <= high), axis=1)
+        # the coefficients in the reduced basis are mapped to the ones in the basis (a, b)
+        return coefficients[visible] @ np.array(U).T, points[visible]
+
     def construct_lattice(self):
+        """
+        It builds the lattice's graph: the visible points (see 'lattice_points'), their neighbors +-a and +-b, and the
+        edges from every visible point to its four neighbors. The origin is the vertex '0', the other vertices are
+        numbered from 1. It does nothing if the lattice was already built with the same parameters (see 'built').
+        """
         self.set_axes()
         self.set_base()
-        
-        l = ['0']
-        i = 1
-        while len(l) != 0:
-            v = self.graph.getVertex(l.pop())
-            if self.is_visible(v.position):
-                position_list = list(map(lambda x: x.position, self.graph.vertices.values()))
-                temp = []
-                temp.append([v.position[0] + self.a[0], v.position[1] + self.a[1]])
-                temp.append([v.position[0] - self.a[0], v.position[1] - self.a[1]])
-                temp.append([v.position[0] + self.b[0], v.position[1] + self.b[1]])
-                temp.append([v.position[0] - self.b[0], v.position[1] - self.b[1]])
-                
-                for t in temp:
-                    if t in position_list:
-                        u = self.graph.vertices[str(position_list.index(t))]
-                        self.graph.addEdge(v.id, u.id)
-                    else:
-                        self.graph.addVertex(str(i), t)
-                        self.graph.addEdge(v.id, str(i))
-                        l.append(i)
-                        i = i+1
-                        
-                        
+        key = (tuple(self.a), tuple(self.b), tuple(self.x), tuple(self.y), self.minx, self.miny)
+        if self.isBuilt("graph", key):
+            return
+
+        coefficients, points = self.lattice_points()
+        steps = np.array([[1, 0], [-1, 0], [0, 1], [0, -1]])
+        neighbors = (coefficients[:, None, :] + steps[None, :, :]).reshape(-1, 2)
+
+        # the coefficients (i, j) are encoded as the integers (i - i0) * width + (j - j0)
+        everything = np.concatenate(([[0, 0]], coefficients, neighbors))
+        low = everything.min(axis=0)
+        width = everything[:, 1].max() - low[1] + 1
+        def code(c):
+            return (c[:, 0] - low[0]) * width + (c[:, 1] - low[1])
+        origin = code(np.zeros((1, 2), dtype=np.int64))
+        codes = np.unique(code(everything))
+        # the origin first, as in the graph created by '__init__'
+        codes = np.concatenate((origin, codes[codes != origin[0]]))
+        vertices = np.stack((codes // width + low[0], codes % width + low[1]), axis=1)
+        order = np.argsort(codes)
+        def index(c):
+            return order[np.searchsorted(codes[order], code(c))]
+
+        B = np.array([self.a, self.b]).T
+        self.graph.clear()
+        self.graph.addVerticesFromArrays(range(0, len(vertices)), vertices @ B.T)
+        self.graph.addEdgesFromArrays(np.repeat(index(coefficients), len(steps)), index(neighbors))
+        self.built["graph"] = key
+
     # ---------- printing ----------
     
-    def printTikz(self, output= None, prefix= "", translated = False):
-        self.set_axes()
-        self.set_base()
+    def iter_tikz(self, prefix= ""):
+        self.construct_lattice()
         
+        visible_nodes = None
+        visible_edges = None
+        if self.culling:
+            visible_nodes, visible_edges = self.graph.cullViewport([[self.x[0], self.y[0]], [self.x[1], self.y[1]]])
         
-        print(prefix + "\\begin{tikzpicture}", file= output)
+        yield prefix + "\\begin{tikzpicture}\n"
+        if self.culling and sum(self.graph.culled) > 0:
+            yield prefix + "\t%% culled %d nodes and %d edges outside the clip rectangle\n" % (self.graph.culled[0], self.graph.culled[1])
         
-        print(prefix + "\t\\begin{pgfonlayer}{nodelayer}", file= output)
-        print(prefix + "\t\\clip (%f,%f) rectangle (%f,%f);" % (self.x[0], self.y[0], self.x[1], self.y[1]), file= output)
+        yield prefix + "\t\\begin{pgfonlayer}{nodelayer}\n"
+        yield prefix + "\t\\clip (%f,%f) rectangle (%f,%f);\n" % (self.x[0], self.y[0], self.x[1], self.y[1])
         
-        self.axes.nodes(output, prefix)
-        self.graph.nodes(output, prefix)
-        print(prefix + "\t\end{pgfonlayer}", file= output)
+        yield from self.axes.iter_nodes(prefix)
+        yield from self.graph.iter_nodes(prefix, visible_nodes)
+        yield prefix + "\t\\end{pgfonlayer}\n"
         
-        print(prefix + "\t\\begin{pgfonlayer}{edgelayer}", file= output)
-        print(prefix + "\t\\clip (%f,%f) rectangle (%f,%f);" % (self.x[0], self.y[0], self.x[1], self.y[1]), file= output)
+        yield prefix + "\t\\begin{pgfonlayer}{edgelayer}\n"
+        yield prefix + "\t\\clip (%f,%f) rectangle (%f,%f);\n" % (self.x[0], self.y[0], self.x[1], self.y[1])
         if self.grid:
-            print(prefix + "\t\\draw[thick,color=gray!25!white,step=1cm,dashed] (%f,%f) grid (%f,%f);" % (self.x[0], self.y[0], self.x[1], self.y[1]), file= output)
-        self.axes.edges(output, prefix)
+            yield prefix + "\t\\draw[thick,color=gray!25!white,step=1cm,dashed] (%f,%f) grid (%f,%f);\n" % (self.x[0], self.y[0], self.x[1], self.y[1])
+        yield from self.axes.iter_edges(prefix)
         
-        if translated:
-            self.graph.edges(output, prefix, [(self.a[0] + self.b[0])/2, (self.a[1] + self.b[1])/2])
-        else:
-            self.graph.edges(output, prefix)
-            
+        yield from self.graph.iter_edges(prefix, visible_edges)
         if self.base_on:
-            self.base.edges(output, prefix)
+            yield from self.base.iter_edges(prefix)
+        yield from self.iter_overlay(prefix)
+        yield prefix + "\t\\end{pgfonlayer}\n"
+        
+        yield prefix + "\\end{tikzpicture}\n"
+
+    def corner_masks(self):
+        """
+        It returns the tuple (e1, e2, points, masks) of the corners' disks. (e1, e2) is the basis (a, b) or (b, a), so
+        that e2 follows e1 counterclockwise; the disk of a lattice point p is split in the four sectors between the
+        directions e1, e2, -e1, -e2, and the k-th sector lies in the domain with origin p, p - e1, p - e1 - e2, p - e2
+        respectively. masks[i] has the bit k set if the domain of the k-th sector of points[i] is in 'corners' (the
+        repeated domains are counted once).
+        """
+        e1, e2 = np.array(self.a, dtype=float), np.array(self.b, dtype=float)
+        swapped = e1[0] * e2[1] - e1[1] * e2[0] < 0
+        if swapped:
+            e1, e2 = e2, e1
+        B = np.array([e1, e2]).T
+        origins = np.rint(np.linalg.solve(B, np.array(self.corners, dtype=float).reshape(-1, 2).T).T).astype(np.int64)
+        # the corners of the domain with origin t are t, t + e1, t + e1 + e2, t + e2: the sectors 0, 1, 2, 3
+        offsets = np.array([[0, 0], [1, 0], [1, 1], [0, 1]])
+        coefficients = (origins[:, None, :] + offsets[None, :, :]).reshape(-1, 2)
+        bits = np.tile(1 << np.arange(4), len(origins))
+
+        low = coefficients.min(axis=0) if len(coefficients) > 0 else np.zeros(2, dtype=np.int64)
+        width = coefficients[:, 1].max() - low[1] + 1 if len(coefficients) > 0 else 1
+        codes, inverse = np.unique((coefficients[:, 0] - low[0]) * width + (coefficients[:, 1] - low[1]), return_inverse=True)
+        masks = np.zeros(len(codes), dtype=np.int64)
+        np.bitwise_or.at(masks, inverse.ravel(), bits)
+        points = np.stack((codes // width + low[0], codes % width + low[1]), axis=1) @ B.T
+        return e1, e2, points, masks
+
+    def iter_overlay(self, prefix= ""):
+        """
+        This function yields the fundamental domain (if 'parallelepid_on') and the corners' disks. The disks are
+        computed at once (see 'corner_masks'): the sectors of the same lattice point which lie in consecutive domains
+        are merged in one sector (a full circle if the point is the corner of four domains), and all of them are
+        printed in few '\\fill' paths. If the radius is larger than the heights of the domain, a disk is not the union
+        of its sectors, so every domain is printed in its own clipped scope, as a single '\\fill' of its four disks.
+        """
+        a, b = self.a, self.b
         if self.parallelepid_on:
-            print(prefix + """
-            \\fill[lightgray] (0,0) -- (%d,%d) -- (%d,%d) -- (%d,%d) -- (0,0);
-            \\node[style=none] (p) at (%f,%f) {$\mathcal{P}(\mathcal{B})$};
-            """ % (self.a[0], self.a[1], self.a[0] + self.b[0], self.a[1] + self.b[1], self.b[0], self.b[1], (self.a[0] + self.b[0])/2, (self.a[1] + self.b[1])/2 ))
-            
-        for v in self.corners:
-            vx = v[0]
-            vy = v[1]
-            ax = self.a[0]
-            ay = self.a[1]
-            bx = self.b[0]
-            by = self.b[1]
-            r = self.corners_radius
-            print(prefix + "\t\t\\begin{scope}", file= output)
-            print(prefix + "\t\t\t\clip (%f,%f) -- (%f,%f) -- (%f,%f) -- (%f,%f) -- (%f,%f);" % (vx,vy,vx+ax,vy+ay,vx+ax+bx,vy+ay+by,vx+bx,vy+by,vx,vy), file= output)
-            print(prefix + "\t\t\t\\fill[lime, opacity=0.5] (%f,%f) circle (%f);" % (vx,vy, r), file= output)
-            print(prefix + "\t\t\t\\fill[lime, opacity=0.5] (%f,%f) circle (%f);" % (vx+ax,vy+ay, r), file= output)
-            print(prefix + "\t\t\t\\fill[lime, opacity=0.5] (%f,%f) circle (%f);" % (vx+ax+bx,vy+ay+by, r), file= output)
-            print(prefix + "\t\t\t\\fill[lime, opacity=0.5] (%f,%f) circle (%f);" % (vx+bx,vy+by, r), file= output)
-            print(prefix + "\t\t\end{scope}", file= output)
-        print(prefix + "\t\end{pgfonlayer}", file= output)
-        
-        print(prefix + "\end{tikzpicture}", file= output)
+            yield prefix + "\t\t\\fill[lightgray] (0,0) -- (%f,%f) -- (%f,%f) -- (%f,%f) -- cycle;\n" % (a[0], a[1], a[0] + b[0], a[1] + b[1], b[0], b[1])
+            yield prefix + "\t\t\\node[style=none] (p) at (%f,%f) {$\\mathcal{P}(\\mathcal{B})$};\n" % ((a[0] + b[0])/2, (a[1] + b[1])/2)
+        if len(self.corners) == 0:
+            return
+
+        r = self.corners_radius
+        chunk = self.overlay_chunk
+        if r > self.determinant() / max(math.hypot(*a), math.hypot(*b)):
+            tiles = np.unique(np.array(self.corners, dtype=float).reshape(-1, 2), axis=0)
+            domain = np.array(self.fundamental_domain(), dtype=float)
+            polygons = (tiles[:, None, :] + domain[None, :, :]).reshape(len(tiles), -1)
+            disks = np.column_stack((polygons[:, 0:2], [r] * len(tiles), polygons[:, 2:4], [r] * len(tiles),
+                                     polygons[:, 4:6], [r] * len(tiles), polygons[:, 6:8], [r] * len(tiles)))
+            clip = prefix + "\t\t\\begin{scope}\n" + prefix + "\t\t\t\\clip (%f,%f) -- (%f,%f) -- (%f,%f) -- (%f,%f) -- cycle;\n"
+            fill = prefix + "\t\t\t\\fill[" + self.corners_style + "] (%f,%f) circle (%f) (%f,%f) circle (%f) (%f,%f) circle (%f) (%f,%f) circle (%f);\n" + prefix + "\t\t\\end{scope}\n"
+            rows = np.column_stack((polygons, disks))
+            for start in range(0, len(rows), chunk):
+                block = rows[start:start + chunk]
+                yield ((clip + fill) * len(block)) % tuple(block.ravel().tolist())
+            return
+
+        e1, e2, points, masks = self.corner_masks()
+        theta = math.degrees(math.atan2(e1[1], e1[0]))
+        delta = (math.degrees(math.atan2(e2[1], e2[0])) - theta) % 360
+        starts = np.cumsum([theta, delta, 180 - delta, delta])
+        widths = np.array([delta, 180 - delta, delta, 180 - delta])
+
+        # the sectors are merged in the runs of consecutive bits of every mask (cyclically)
+        pieces = []
+        circles = points[masks == 15]
+        for m in range(1, 15):
+            selected = points[masks == m]
+            if len(selected) == 0:
+                continue
+            for k in range(0, 4):
+                if not (m >> k) & 1 or (m >> ((k - 1) % 4)) & 1:
+                    continue
+                length = 1
+                while (m >> ((k + length) % 4)) & 1:
+                    length += 1
+                span = widths[[(k + i) % 4 for i in range(0, length)]].sum()
+                start = starts[k]
+                pieces.append(np.column_stack((selected, [start] * len(selected), [r] * len(selected), [start] * len(selected),
+                                               [start + span] * len(selected), [r] * len(selected))))
+
+        line = prefix + "\t\t\\fill[" + self.corners_style + "] %s;\n"
+        circle = "(%f,%f) circle (%f) "
+        sector = "(%f,%f) -- ++(%f:%f) arc[start angle=%f, end angle=%f, radius=%f] -- cycle "
+        circles = np.column_stack((circles, [r] * len(circles)))
+        for start in range(0, len(circles), chunk):
+            block = circles[start:start + chunk]
+            yield line % ((circle * len(block)) % tuple(block.ravel().tolist())).rstrip()
+        sectors = np.concatenate(pieces) if len(pieces) > 0 else np.zeros((0, 7))
+        for start in range(0, len(sectors), chunk):
+            block = sectors[start:start + chunk]
+            yield line % ((sector * len(block)) % tuple(block.ravel().tolist())).rstrip()
+
+    def printTikz(self, output= None, prefix= ""):
+        writeTikz(self.iter_tikz(prefix), output)
+
+    def contentHash(self):
+        """ It returns the hash of the lattice's parameters and of its graph (see 'LatexGraph.contentHash') """
+        self.construct_lattice()
+        return hashParts(type(self).__name__, self.a, self.b, self.x, self.y, self.minx, self.miny, self.overset,
+                         self.grid, self.culling, self.base_on, self.parallelepid_on, self.corners,
+                         self.corners_radius, self.corners_style, self.overlay_chunk, self.graph.contentHash())
         
     def generatesLatexGraph(self):
+        """ It returns the LatexGraph of the whole lattice (the same object until the lattice changes) """
+        self.construct_lattice()
+        key = (self.built["graph"], self.built["axes"], self.built["base"], self.base_on, self.overset, self.graph.version, self.axes.version, self.base.version)
+        if self.isBuilt("generated", key):
+            return self.generated
         G = self.graph + self.axes
         if (self.base_on == True):
             G = G + self.base
         G.clip_params = [[self.x[0] - self.overset, self.y[0] - self.overset], [self.x[1] + self.overset, self.y[1] + self.overset]]
         G.grid_params = [[self.x[0] - self.overset, self.y[0] - self.overset], [self.x[1] + self.overset, self.y[1] + self.overset]]
+        self.generated = G
+        self.built["generated"] = key
         return (G)
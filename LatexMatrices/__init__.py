@@ -16,6 +16,40 @@ from LatexGraph import *
 
 
 class LatexMatrix(LatexGraph):
+    """
+    A LatexMatrix is a LatexGraph that represents a rows x cols matrix: the cell (i, j) is the square with bottom-left
+    corner 'getEntriesCorner(i, j, "00")'. The grid is printed as a single '\\draw ... grid' command and only the
+    non-empty entries are stored, so the size of the matrix does not change the number of Python objects. It is
+    composed by:
+        -----------
+        > rows and cols : int
+            The numbers of rows and columns.
+
+        > entries : {(int, int): [str, str or None]}
+            The text and the node style (None for the 'node_style' of the matrix) of every written cell (see
+            'writeInEntry').
+
+        > translation and unit : [float, float] and float
+            The cell (i, j) has bottom-left corner ((j + translation[0])*unit, (i + translation[1])*unit); they are
+            changed by 'translateMatrix' and 'scaleMatrix' (or by 'translate' and 'scale').
+
+        > grid_on : bool
+            If True (after 'gen_Matrix') the grid of the matrix is printed.
+
+        > lableon, LrShift, and LcShift : [bool, bool], float, and float
+            Whether the indices of the rows and of the columns are printed, and the shifts (in cells) of their
+            column and row from the matrix.
+
+        > infrows and infcols : int
+            If positive, dashed lines of this length (in cells) continue the matrix vertically or horizontally.
+
+        > cell_classes and colormap : None or numpy.ndarray and [str, ...]
+            The heatmap of the matrix (see 'setHeatmap'): the cell (i, j) is filled with the color
+            colormap[cell_classes[i][j]] (not filled if it is -1).
+        -----------
+    The other vertices, edges, and decoration shapes of the graph are printed as in a LatexGraph (e.g. the submatrices
+    added with 'addSubmatrix').
+    """
     def __init__ (self, rows, cols, fp= None):
         LatexGraph.__init__(self, fp)
         self.rows = rows
@@ -28,6 +62,29 @@ class LatexMatrix(LatexGraph):
         self.unit = 1
         self.LrShift = -0.25
         self.LcShift = -0.25
+        self.coalesce = True
+        self.entries = {}
+        self.grid_on = False
+        self.cell_classes = None
+        self.colormap = []
+
+    @classmethod
+    def from_array (cls, A, colormap= ["white", "red"], bins= 8, unit= None):
+        """
+        It returns the LatexMatrix of the heatmap of the 2D array A (see 'setHeatmap'), without grid. The side of a
+        cell is 'unit', by default such that the matrix is at most 20 units wide and high (TeX cannot draw pictures
+        larger than about 5 meters).
+        """
+        A = np.asarray(A, dtype=float)
+        if A.ndim != 2:
+            print("ERROR: the heatmap must be a 2D array")
+            raise ValueError()
+        M = cls(A.shape[0], A.shape[1])
+        if unit == None:
+            unit = min(1, 20 / max(1, A.shape[0], A.shape[1]))
+        M.unit = unit
+        M.setHeatmap(A, colormap, bins)
+        return M
 
     #def getEntriesCorner_old (self, row, col, corner):
         #if not corner in ['00', '01', '10', '11']:
@@ -85,70 +142,261 @@ class LatexMatrix(LatexGraph):
         else:
             self.decoration_shapes[0] = tmp_shape
 
+    def cellPoint (self, x, y):
+        """ It returns the position of the point (x, y) of the matrix, measured in cells from its bottom-left corner """
+        return [(x + self.translation[0])*self.unit, (y + self.translation[1])*self.unit]
+
     def gen_Matrix (self):
+        """
+        It turns on the grid of the matrix and adds the dashed lines of 'infrows' and 'infcols'; the grid, the
+        entries, and the labels are printed by 'iter_nodes' and 'iter_edges'.
+        """
         rows = self.rows
         cols = self.cols
-        for i in range(0,rows+1):
-            for j in range(0,cols+1):
-                if i<rows and j < cols:
-                    self.addVertex(i*1000 + j, [j+0.5, i+0.5])
-                    
-        for i in range(0,rows+1):
-            self.addVertex('Rlx' + str(i), [0,i])
-            self.addVertex('Rdx' + str(i), [cols,i])
-            if (i == 0) or (i==rows):
-                self.addEdge('Rlx' + str(i), 'Rdx' + str(i), c='none, line width = 1')
-            else:
-                self.addEdge('Rlx' + str(i), 'Rdx' + str(i))
-            if self.lableon[0] and (i<rows):
-                self.addVertex('Lr' + str(i), [self.LrShift,i+((0.5)*(self.unit))], i)
-
-        for j in range(0,cols+1):
-            self.addVertex('Clx' + str(j), [j,0])
-            self.addVertex('Cdx' + str(j), [j,rows])
-            if (j == 0) or (j==cols):
-                self.addEdge('Clx' + str(j), 'Cdx' + str(j), c='none, line width = 1')
-            else:
-                self.addEdge('Clx' + str(j), 'Cdx' + str(j))
-            if self.lableon[1] and (j<cols):
-                self.addVertex('Lc' + str(j), [j+((0.5)*(self.unit)), self.LcShift], j)
-            
+        self.grid_on = True
+
         if self.infrows > 0:
-            self.addVertex('A', [0, rows + self.infrows])
-            self.addVertex('B', [cols, rows + self.infrows])
-            self.addVertex('-A', [0, -self.infrows])
-            self.addVertex('-B', [cols, -self.infrows])
+            self.addVertex('A', self.cellPoint(0, rows + self.infrows))
+            self.addVertex('B', self.cellPoint(cols, rows + self.infrows))
+            self.addVertex('-A', self.cellPoint(0, -self.infrows))
+            self.addVertex('-B', self.cellPoint(cols, -self.infrows))
             self.addEdge('A', '-A', c='trat')
             self.addEdge('B', '-B', c='trat')
         
         if self.infcols > 0:
-            self.addVertex('C', [cols + self.infcols, 0])
-            self.addVertex('D', [cols + self.infcols, rows])
-            self.addVertex('-C', [-self.infcols, 0])
-            self.addVertex('-D', [-self.infcols, rows])
+            self.addVertex('C', self.cellPoint(cols + self.infcols, 0))
+            self.addVertex('D', self.cellPoint(cols + self.infcols, rows))
+            self.addVertex('-C', self.cellPoint(-self.infcols, 0))
+            self.addVertex('-D', self.cellPoint(-self.infcols, rows))
             self.addEdge('C', '-C', c='trat')
             self.addEdge('D', '-D', c='trat')
 
+    def checkEntry (self, row, col):
+        if row < 0 or row >= self.rows or col < 0 or col >= self.cols:
+            print("ERROR: the entry (%s, %s) is not in the %d x %d matrix" % (row, col, self.rows, self.cols))
+            raise ValueError()
+
     def writeInEntry (self, row, col, toWrite, toColor=None):
-        self.getVertex(row*1000 + col).name = toWrite
-        if toColor!=None:
-            self.getVertex(row*1000 + col).color = toColor
+        """ It writes 'toWrite' in the cell (row, col); 'toColor' is the style of its node (by default 'node_style') """
+        self.checkEntry(row, col)
+        if toColor != None:
+            self.styles.check(toColor)
+        entry = self.entries.setdefault((row, col), [None, None])
+        entry[0] = toWrite
+        if toColor != None:
+            entry[1] = toColor
 
+    def clearEntry (self, row, col):
+        self.entries.pop((row, col), None)
 
+    def iter_entries (self, prefix= ""):
+        """
+        This function yields the written entries grouped by style, as '\\path' commands of at most 'coalesce_chunk'
+        nodes each; an entry with the style "black" is written in white (as in 'LatexGraph.iter_nodes').
+        """
+        groups = {}
+        for (i, j), (text, style) in sorted(self.entries.items()):
+            if text == None:
+                continue
+            groups.setdefault(self.node_style if style == None else style, []).append((i, j, text))
+        for style, cells in groups.items():
+            self.styles.check(style)
+            color = "\\color{white} " if style == "black" else ""
+            yield from self.iter_node_paths(prefix, style, [(j + 0.5, i + 0.5, color + str(text)) for i, j, text in cells])
+
+    def iter_labels (self, prefix= ""):
+        """ This function yields the indices of the rows and of the columns (see 'lableon') as two '\\path' commands """
+        if self.lableon[0]:
+            yield from self.iter_node_paths(prefix, "none", [(self.LrShift, i + 0.5, i) for i in range(0, self.rows)])
+        if self.lableon[1]:
+            yield from self.iter_node_paths(prefix, "none", [(j + 0.5, self.LcShift, j) for j in range(0, self.cols)])
+
+    def iter_node_paths (self, prefix, style, nodes):
+        """ It yields the nodes [(x, y, text), ...] (in cells, see 'cellPoint') as '\\path (x,y) node {text} ...;' """
+        if len(nodes) == 0:
+            return
+        xy = np.array([[x, y] for x, y, text in nodes], dtype=float)
+        xy = (xy + np.array(self.translation, dtype=float)) * self.unit
+        texts = [text for x, y, text in nodes]
+        for start in range(0, len(nodes), self.coalesce_chunk):
+            stop = start + self.coalesce_chunk
+            items = [v for p, t in zip(xy[start:stop].tolist(), texts[start:stop]) for v in (p[0], p[1], t)]
+            yield prefix + "\t\t\\path [every node/.style={style=%s}] %s;\n" % (style, (("(%1.3f,%1.3f) node {%s} " * (len(items) // 3)) % tuple(items)).rstrip())
+
+    def setHeatmap (self, A, colormap= ["white", "red"], bins= 8):
+        """
+        It colors every cell (i, j) by the value A[i][j] (the NaNs are not colored); the values are quantized at once
+        with NumPy:
+            - if 'bins' is an int, in 'bins' intervals of the same width between the minimum and the maximum of A,
+                whose colors go linearly through the colors of 'colormap' (mixed with xcolor's 'c1!p!c0');
+            - if 'bins' is None, in len(colormap) intervals of the same width, with the colors of 'colormap';
+            - if 'bins' is a list of thresholds, as in 'np.digitize' (with len(bins) + 1 colors);
+            - if 'bins' is "labels", the integer values are the indices of the colors (modulo len(colormap)).
+        It returns the array of the classes (the index of the color of every cell, or -1).
+        """
+        A = np.asarray(A, dtype=float)
+        if A.shape != (self.rows, self.cols):
+            print("ERROR: the heatmap must be a %d x %d array" % (self.rows, self.cols))
+            raise ValueError()
+        empty = np.isnan(A)
+        values = np.where(empty, 0, A)
+        colormap = list(colormap)
+        if isinstance(bins, str) and bins == "labels":
+            classes = values.astype(np.int64) % len(colormap)
+        else:
+            if isinstance(bins, (int, np.integer)):
+                colormap = interpolateColors(colormap, bins)
+                bins = None
+            if bins is None:
+                low = values[~empty].min() if not empty.all() else 0
+                high = values[~empty].max() if not empty.all() else 0
+                bins = np.linspace(low, high, len(colormap) + 1)[1:-1]
+            if len(bins) + 1 != len(colormap):
+                print("ERROR: %d thresholds need %d colors, not %d" % (len(bins), len(bins) + 1, len(colormap)))
+                raise ValueError()
+            classes = np.digitize(values, bins)
+        classes[empty] = -1
+        self.cell_classes = classes
+        self.colormap = colormap
+        return classes
+
+    def heatRectangles (self):
+        """
+        It returns the arrays (classes, rectangles) of the heatmap's cells merged in rectangles of the same color: the
+        k-th rectangle has the color colormap[classes[k]] and covers the rows from rectangles[k][0] to
+        rectangles[k][2] - 1 and the columns from rectangles[k][1] to rectangles[k][3] - 1. Every row is split in
+        runs of equal color, and the equal runs (same columns and color) of consecutive rows are merged.
+        """
+        C = self.cell_classes
+        if C is None or C.size == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, 4), dtype=np.int64)
+        rows, cols = C.shape
+        starts = np.ones(C.shape, dtype=bool)
+        starts[:, 1:] = C[:, 1:] != C[:, :-1]
+        r, s = np.nonzero(starts)
+        flat = r * cols + s
+        e = np.minimum(np.append(flat[1:], rows * cols) - r * cols, cols)
+        c = C[r, s]
+        keep = c >= 0
+        r, s, e, c = r[keep], s[keep], e[keep], c[keep]
+        if len(r) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, 4), dtype=np.int64)
+
+        order = np.lexsort((r, c, e, s))
+        r, s, e, c = r[order], s[order], e[order], c[order]
+        new = np.ones(len(r), dtype=bool)
+        new[1:] = (s[1:] != s[:-1]) | (e[1:] != e[:-1]) | (c[1:] != c[:-1]) | (r[1:] != r[:-1] + 1)
+        first = np.flatnonzero(new)
+        last = np.append(first[1:], len(r)) - 1
+        rectangles = np.stack((r[first], s[first], r[last] + 1, e[first]), axis=1)
+        classes = c[first]
+        order = np.argsort(classes, kind="stable")
+        return classes[order], rectangles[order]
+
+    def iter_heatmap (self, prefix= ""):
+        """
+        This function yields the heatmap (see 'heatRectangles') as one '\\fill' path per color, with 'coalesce_chunk'
+        rectangles per line.
+        """
+        classes, rectangles = self.heatRectangles()
+        if len(classes) == 0:
+            return
+        corners = (rectangles[:, [1, 0, 3, 2]] + np.tile(self.translation, 2)) * self.unit
+        bounds = np.flatnonzero(np.diff(classes)) + 1
+        for group in np.split(np.arange(len(classes)), bounds):
+            yield prefix + "\t\t\\fill [fill=%s]\n" % self.colormap[classes[group[0]]]
+            for start in range(0, len(group), self.coalesce_chunk):
+                block = corners[group[start:start + self.coalesce_chunk]]
+                yield prefix + "\t\t\t" + (("(%1.3f,%1.3f) rectangle (%1.3f,%1.3f) " * len(block)) % tuple(block.ravel().tolist())).rstrip() + "\n"
+            yield prefix + "\t\t;\n"
+
+    def iter_grid (self, prefix= ""):
+        """ This function yields the grid of the matrix: one '\\draw ... grid' and the border as a rectangle """
+        if not self.grid_on:
+            return
+        x0, y0 = self.cellPoint(0, 0)
+        x1, y1 = self.cellPoint(self.cols, self.rows)
+        self.styles.check(self.edges_style)
+        # the grid's lines are at the multiples of the step, so the grid is drawn from the origin and shifted
+        yield prefix + "\t\t\\draw [style=%s, step=%f, shift={(%f,%f)}] (0,0) grid (%f,%f);\n" % (self.edges_style, self.unit, x0, y0, x1 - x0, y1 - y0)
+        yield prefix + "\t\t\\draw [style=none, line width = 1] (%f,%f) rectangle (%f,%f);\n" % (x0, y0, x1, y1)
+
+    def iter_nodes (self, prefix= "", visible= None):
+        yield from LatexGraph.iter_nodes(self, prefix, visible)
+        yield from self.iter_entries(prefix)
+        yield from self.iter_labels(prefix)
+
+    def iter_edges (self, prefix= "", visible= None):
+        yield from self.iter_heatmap(prefix)
+        yield from self.iter_grid(prefix)
+        yield from LatexGraph.iter_edges(self, prefix, visible)
+
+    def transform (self, matrix, offset= None, vertices= None):
+        """
+        As 'LatexGraph.transform'; when the whole matrix is mapped, the map must be a translation or a uniform scaling
+        (followed by a translation), so that the cells remain squares.
+        """
+        M, t = affineParts(matrix, offset)
+        if vertices is None:
+            if M[0][1] != 0 or M[1][0] != 0 or M[0][0] != M[1][1] or M[0][0] <= 0:
+                print("ERROR: a LatexMatrix can only be translated and scaled")
+                raise ValueError()
+            unit = self.unit * M[0][0]
+            self.translation = [self.translation[0] + t[0] / unit, self.translation[1] + t[1] / unit]
+            self.unit = unit
+        LatexGraph.transform(self, matrix, offset, vertices)
+
+    def contentHash(self):
+        """ It returns the hash of the matrix (see 'LatexGraph.contentHash') """
+        return hashParts(LatexGraph.contentHash(self), self.rows, self.cols, self.translation, self.unit, self.grid_on,
+                         self.lableon, self.LrShift, self.LcShift, sorted(self.entries.items()), self.cell_classes,
+                         self.colormap)
+
+    def generatesLatexGraph(self):
+        """
+        It returns a LatexGraph with the same drawing, in which every written entry is the vertex ('entry', i, j) and
+        every line of the grid is an edge (the heatmap is not included); it is useful to combine the matrix with other graphs (see '+' and
+        'compose'), but it costs O(rows + cols + entries) Python objects.
+        """
+        G = LatexGraph() + self
+        for (i, j), (text, style) in self.entries.items():
+            if text != None:
+                G.addVertex(('entry', i, j), self.cellPoint(j + 0.5, i + 0.5), text, self.node_style if style == None else style)
+        if self.lableon[0]:
+            for i in range(0, self.rows):
+                G.addVertex('Lr' + str(i), self.cellPoint(self.LrShift, i + 0.5), i)
+        if self.lableon[1]:
+            for j in range(0, self.cols):
+                G.addVertex('Lc' + str(j), self.cellPoint(j + 0.5, self.LcShift), j)
+        if self.grid_on:
+            for i in range(0, self.rows + 1):
+                G.addVertex('Rlx' + str(i), self.cellPoint(0, i))
+                G.addVertex('Rdx' + str(i), self.cellPoint(self.cols, i))
+                G.addEdge('Rlx' + str(i), 'Rdx' + str(i), c='none, line width = 1' if i == 0 or i == self.rows else self.edges_style)
+            for j in range(0, self.cols + 1):
+                G.addVertex('Clx' + str(j), self.cellPoint(j, 0))
+                G.addVertex('Cdx' + str(j), self.cellPoint(j, self.rows))
+                G.addEdge('Clx' + str(j), 'Cdx' + str(j), c='none, line width = 1' if j == 0 or j == self.cols else self.edges_style)
+        return G
 
     def translateMatrix (self, translate_vector):
         self.translate(translate_vector)
-        self.fills = []
-        self.dasheds = []
-        self.definedbackgroundcolor = False
-        self.translation[0] += translate_vector[0]
-        self.translation[1] += translate_vector[1]
 
     def scaleMatrix (self, scaleFactor):
         self.scale(scaleFactor)
-        self.fills = []
-        self.dasheds = []
-        self.unit *= scaleFactor
-
 
 
+def interpolateColors(colormap, n):
+    """
+    It returns n xcolor colors going linearly from colormap[0] to colormap[-1] through the other colors of 'colormap'
+    (e.g. interpolateColors(["white", "red"], 3) = ["red!0!white", "red!50!white", "red!100!white"]).
+    """
+    if n < 1 or len(colormap) < 1:
+        print("ERROR: the colormap and the number of colors must be non-empty")
+        raise ValueError()
+    if len(colormap) == 1 or n == 1:
+        return [colormap[0]] * n
+    t = np.linspace(0, len(colormap) - 1, n)
+    segment = np.minimum(t.astype(np.int64), len(colormap) - 2)
+    percent = np.rint((t - segment) * 100).astype(np.int64)
+    return ["%s!%d!%s" % (colormap[k + 1], p, colormap[k]) for k, p in zip(segment.tolist(), percent.tolist())]
@@ -0,0 +1,142 @@
+#  Copyright 2022 Lorenzo Pichetti lori.pichi@gmail.com
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+A content-addressed cache of the rendered artefacts (the TikZ code of the figures and the compiled PDFs). The keys are
+the hashes computed by 'hashParts' over everything that changes the output (see 'LatexGraph.contentHash'), so a
+figure is regenerated only when its content changes.
+"""
+
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+
+def hashParts(*parts):
+    """
+    It returns a deterministic hexadecimal hash of 'parts': the NumPy arrays are hashed by dtype, shape, and bytes,
+    the bytes as they are, the tuples by the hash of their items, and the other objects by their repr (so they must
+    have a deterministic one, as numbers, strings, and lists of them).
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for p in parts:
+        if isinstance(p, tuple):
+            h.update(hashParts(*p).encode())
+        elif isinstance(p, np.ndarray):
+            p = np.ascontiguousarray(p)
+            h.update(("%s%s" % (p.dtype.str, p.shape)).encode())
+            h.update(p.tobytes())
+        elif isinstance(p, bytes):
+            h.update(p)
+        else:
+            h.update(repr(p).encode())
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+class RenderCache:
+    """
+    A RenderCache stores the artefacts in the directory 'folder' as files '<key>.<kind>' (e.g. 'tikz' or 'pdf').
+    When the total size exceeds 'max_bytes' the least recently used files are removed (the use time is the
+    modification time of the file, which is updated at every hit). It is composed by:
+        -----------
+        > folder and max_bytes : str and int
+            The cache directory and its maximum size.
+
+        > hits and misses : int
+            The numbers of the successful and failed lookups ('get') since the creation of the cache.
+
+        > entries : {str: int}
+            The size of every file of the cache.
+        -----------
+    The cache can be shared by the worker threads of a TexCompilePool.
+    """
+    def __init__(self, folder= ".latexgraphs_cache", max_bytes= 256 * 2**20):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        self.entries = {f: os.path.getsize(os.path.join(folder, f)) for f in os.listdir(folder)}
+        self.size = sum(self.entries.values())
+
+    def path(self, key, kind):
+        return os.path.join(self.folder, key + "." + kind)
+
+    def get(self, key, kind):
+        """ It returns the bytes stored for (key, kind), or None """
+        with self.lock:
+            path = self.path(key, kind)
+            if key + "." + kind not in self.entries or not os.path.exists(path):
+                self.misses += 1
+                return None
+            self.hits += 1
+            os.utime(path)
+        with open(path, "rb") as fp:
+            return fp.read()
+
+    def getText(self, key, kind):
+        data = self.get(key, kind)
+        return None if data == None else data.decode("utf-8")
+
+    def put(self, key, kind, data):
+        """ It stores the bytes (or the string) 'data' for (key, kind) and evicts the least recently used files """
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        name = key + "." + kind
+        tmp = self.path(key, kind) + ".%d.tmp" % threading.get_ident()
+        with open(tmp, "wb") as fp:
+            fp.write(data)
+        with self.lock:
+            os.replace(tmp, self.path(key, kind))
+            self.size += len(data) - self.entries.get(name, 0)
+            self.entries[name] = len(data)
+            if self.size > self.max_bytes:
+                self.evict(keep= name)
+
+    def evict(self, keep= None):
+        """ It removes the least recently used files until the cache is smaller than 'max_bytes' """
+        by_age = sorted(self.entries, key=lambda f: self.mtime(f))
+        for f in by_age:
+            if self.size <= self.max_bytes:
+                break
+            if f == keep:
+                continue
+            try:
+                os.remove(os.path.join(self.folder, f))
+            except FileNotFoundError:
+                pass
+            self.size -= self.entries.pop(f)
+
+    def mtime(self, f):
+        try:
+            return os.path.getmtime(os.path.join(self.folder, f))
+        except FileNotFoundError:
+            return 0
+
+    def clear(self):
+        with self.lock:
+            for f in list(self.entries):
+                try:
+                    os.remove(os.path.join(self.folder, f))
+                except FileNotFoundError:
+                    pass
+            self.entries = {}
+            self.size = 0
+
+    def report(self):
+        return "render cache: %d hits, %d misses (%d files, %.1f MB)" % (self.hits, self.misses, len(self.entries), self.size / 2**20)
@@ -0,0 +1,305 @@
+#  Copyright 2022 Lorenzo Pichetti lori.pichi@gmail.com
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+Compilation of the generated .tex files. A TexCompilePool runs many TeX jobs in parallel: every job is written in its
+own temporary directory and compiled by a pdflatex/lualatex subprocess (supervised by a worker thread, with a timeout);
+its log is parsed and the result is returned as a CompileResult through a concurrent.futures.Future.
+
+The TeX executable is 'TEX_ENGINE' (by default "pdflatex", or the environment variable LATEXGRAPHS_TEX) and can be
+changed for every pool, e.g. to use lualatex or a stub script when TeX is not installed.
+
+If a RenderCache is given, the PDFs are stored in it keyed by the hash of the source, the engine, and the number of
+runs, and a job whose PDF is already cached is not compiled again.
+"""
+
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from RenderCache import hashParts
+
+
+TEX_ENGINE = os.environ.get("LATEXGRAPHS_TEX", "pdflatex")
+
+
+class TexError:
+    """
+    A TexError is an error found in a TeX log:
+        -----------
+        > message : str
+            The text of the '! ...' line.
+
+        > line : int or None
+            The line of the .tex file where the error happened (from the 'l.<n>' line of the log), if known.
+
+        > context : str
+            The source text shown by TeX after 'l.<n>'.
+        -----------
+    """
+    def __init__(self, message, line= None, context= ""):
+        self.message = message
+        self.line = line
+        self.context = context
+
+    def __repr__(self):
+        if self.line == None:
+            return "TexError(%r)" % self.message
+        return "TexError(%r, line %d)" % (self.message, self.line)
+
+
+class CompileResult:
+    """
+    A CompileResult is the report of a compilation job:
+        -----------
+        > name : str
+            The name of the job (the .tex and .pdf files are '<name>.tex' and '<name>.pdf').
+
+        > returncode and timed_out : int and bool
+            The exit status of the TeX engine (None if it could not be started) and whether it was killed after the
+            timeout.
+
+        > pdf : str or None
+            The path of the produced PDF (None if the compilation failed).
+
+        > log : str
+            The content of the TeX log (or the engine's output if there is no log file).
+
+        > errors and warnings : [TexError, ...] and [str, ...]
+            The errors ('! ...' lines) and the LaTeX/package warnings found in the log.
+
+        > elapsed : float
+            The wall-clock time of the compilation in seconds.
+
+        > cached : bool
+            True if the PDF was taken from a RenderCache instead of being compiled.
+        -----------
+    """
+    def __init__(self, name):
+        self.name = name
+        self.returncode = None
+        self.timed_out = False
+        self.pdf = None
+        self.log = ""
+        self.errors = []
+        self.warnings = []
+        self.elapsed = 0.0
+        self.cached = False
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and not self.timed_out and self.pdf != None and len(self.errors) == 0
+
+    def report(self):
+        """ It returns a short human-readable description of the result """
+        if self.ok and self.cached:
+            return "%s: reused from the render cache (%s)" % (self.name, self.pdf)
+        if self.ok:
+            return "%s: compiled in %.2f s (%s)" % (self.name, self.elapsed, self.pdf)
+        if self.timed_out:
+            lines = ["%s: timed out after %.2f s" % (self.name, self.elapsed)]
+        else:
+            lines = ["%s: compilation failed (exit status %s)" % (self.name, self.returncode)]
+        for e in self.errors:
+            if e.line == None:
+                lines.append("\t! %s" % e.message)
+            else:
+                lines.append("\t! %s (line %d: %s)" % (e.message, e.line, e.context))
+        return "\n".join(lines)
+
+
+def parseTexLog(log):
+    """ It returns the lists (errors, warnings) found in the text of a TeX log """
+    errors = []
+    warnings = []
+    lines = log.splitlines()
+    for i, text in enumerate(lines):
+        if text.startswith("! "):
+            error = TexError(text[2:].strip())
+            for following in lines[i + 1 : i + 20]:
+                m = re.match(r"l\.(\d+) ?(.*)", following)
+                if m:
+                    error.line = int(m.group(1))
+                    error.context = m.group(2).strip()
+                    break
+                if following.startswith("! "):
+                    break
+            errors.append(error)
+        elif re.match(r"(LaTeX|Package \S+) Warning", text):
+            warnings.append(text.strip())
+    return errors, warnings
+
+
+def texSource(source, cache= None):
+    """
+    It returns the text of 'source': a string, an iterable of chunks, or an object with 'iter_latex_file' (a LatexFile,
+    whose figures are taken from 'cache' when possible)
+    """
+    if isinstance(source, str):
+        return source
+    if hasattr(source, "iter_latex_file"):
+        source = source.iter_latex_file(cache)
+    return "".join(source)
+
+
+def cachedCompileResult(cache, key, name, output_dir):
+    """ It returns the CompileResult of a PDF stored in 'cache' (copied in 'output_dir'), or None if it is not cached """
+    pdf = cache.get(key, "pdf")
+    if pdf == None:
+        return None
+    if output_dir == None:
+        output_dir = tempfile.mkdtemp(prefix="latexgraphs_")
+    os.makedirs(output_dir, exist_ok=True)
+    result = CompileResult(name)
+    result.pdf = os.path.join(output_dir, name + ".pdf")
+    with open(result.pdf, "wb") as fp:
+        fp.write(pdf)
+    result.returncode = 0
+    result.cached = True
+    return result
+
+
+def runTexJob(source, name= "document", output_dir= None, engine= None, timeout= 60, runs= 1, cache= None):
+    """
+    This function compiles 'source' (see 'texSource') as '<name>.tex' in a new temporary directory with 'engine'
+    (by default TEX_ENGINE), running it 'runs' times (e.g. 2 for the references); the PDF and the log are copied in
+    'output_dir' (if given, otherwise the PDF is left in the temporary directory). It returns a CompileResult.
+    If 'cache' (a RenderCache) is given, the PDF of an already compiled source is taken from it.
+    """
+    engine = TEX_ENGINE if engine == None else engine
+    source = texSource(source, cache)
+    key = None
+    if cache != None:
+        key = hashParts("pdf", engine, runs, source)
+        result = cachedCompileResult(cache, key, name, output_dir)
+        if result != None:
+            return result
+
+    result = CompileResult(name)
+    workdir = tempfile.mkdtemp(prefix="latexgraphs_")
+    start = time.time()
+    try:
+        with open(os.path.join(workdir, name + ".tex"), "w") as fp:
+            fp.write(source)
+
+        output = ""
+        for r in range(0, runs):
+            try:
+                process = subprocess.run([engine, "-interaction=nonstopmode", "-halt-on-error", name + ".tex"], cwd=workdir,
+                                         stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout, stdin=subprocess.DEVNULL)
+            except subprocess.TimeoutExpired as e:
+                result.timed_out = True
+                output = e.output.decode("utf-8", "replace") if e.output else ""
+                break
+            except OSError as e:
+                result.errors.append(TexError("cannot run %s: %s" % (engine, e)))
+                break
+            result.returncode = process.returncode
+            output = process.stdout.decode("utf-8", "replace")
+            if process.returncode != 0:
+                break
+
+        log_path = os.path.join(workdir, name + ".log")
+        if os.path.exists(log_path):
+            with open(log_path, "r", errors="replace") as fp:
+                result.log = fp.read()
+        else:
+            result.log = output
+        errors, result.warnings = parseTexLog(result.log)
+        result.errors.extend(errors)
+
+        pdf_path = os.path.join(workdir, name + ".pdf")
+        if os.path.exists(pdf_path) and result.returncode == 0 and not result.timed_out:
+            result.pdf = pdf_path
+            if key != None and result.ok:
+                with open(pdf_path, "rb") as fp:
+                    cache.put(key, "pdf", fp.read())
+        if output_dir != None:
+            os.makedirs(output_dir, exist_ok=True)
+            if result.pdf != None:
+                result.pdf = shutil.copy(pdf_path, os.path.join(output_dir, name + ".pdf"))
+            if os.path.exists(log_path):
+                shutil.copy(log_path, os.path.join(output_dir, name + ".log"))
+    finally:
+        result.elapsed = time.time() - start
+        if output_dir != None:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+class TexCompilePool:
+    """
+    A TexCompilePool compiles many TeX documents in parallel; every job runs in a TeX subprocess supervised by one of
+    'workers' threads (by default the number of CPUs). It is composed by:
+        -----------
+        > engine : str
+            The TeX executable (pdflatex, lualatex, ...; by default TEX_ENGINE).
+
+        > timeout : float
+            The maximum time in seconds of every run of the engine; the slower jobs are killed.
+
+        > executor : concurrent.futures.ThreadPoolExecutor
+            The pool of the worker threads.
+
+        > cache : RenderCache or None
+            If given, the PDFs (and the figures of the LatexFiles) are reused from it (see 'runTexJob').
+        -----------
+    The pool can be used as a context manager, which waits for all the jobs when it is closed:
+
+        with TexCompilePool(engine= "lualatex") as pool:
+            futures = [pool.submitLatexFile(F) for F in files]
+            for f in futures:
+                print(f.result().report())
+    """
+    def __init__(self, workers= None, engine= None, timeout= 60, cache= None):
+        self.engine = TEX_ENGINE if engine == None else engine
+        self.timeout = timeout
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1, thread_name_prefix="tex")
+
+    def submit(self, source, name= "document", output_dir= None, runs= 1):
+        """ It schedules the compilation of 'source' (see 'runTexJob') and returns a Future of its CompileResult """
+        # the source is rendered now, so that the job does not depend on later changes of the graphs
+        return self.executor.submit(runTexJob, texSource(source, self.cache), name, output_dir, self.engine, self.timeout, runs, self.cache)
+
+    def submitLatexFile(self, F, runs= 1):
+        """ It compiles a LatexFile whose 'output' is the name of the .tex file; the PDF is written next to it """
+        path = F.output if isinstance(F.output, str) else F.output.name
+        name = os.path.splitext(os.path.basename(path))[0]
+        return self.submit(F, name, os.path.dirname(path) or ".", runs)
+
+    def map(self, sources, names= None, output_dir= None):
+        """ It submits all the 'sources' (named 'names[i]', or 'document<i>') and returns the list of the futures """
+        sources = list(sources)
+        if names == None:
+            names = ["document%d" % i for i in range(0, len(sources))]
+        return [self.submit(s, n, output_dir) for s, n in zip(sources, names)]
+
+    def shutdown(self, wait= True):
+        self.executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+
+def compileTex(source, name= "document", output_dir= None, engine= None, timeout= 60, runs= 1, cache= None):
+    """ It compiles one document in the calling thread and returns its CompileResult (see 'runTexJob') """
+    return runTexJob(source, name, output_dir, engine, timeout, runs, cache)
@@ -0,0 +1,297 @@
+#  Copyright 2022 Lorenzo Pichetti lori.pichi@gmail.com
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+Benchmarks for the LatexGraphs classes. Run them with 'python3 benchmarks.py <name> [size]' (or 'make bench' to run
+all of them with the default sizes).
+"""
+
+import io
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+from CompactGraph import *
+from Expander import vex
+from LatexLattices import LatexLattice
+from LatexMatrices import LatexMatrix
+
+
+def random_edges(n, m, seed= 0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, n, m), rng.integers(0, n, m)
+
+
+def build_graph(G, n, src, dst):
+    for i in range(0, n):
+        G.addVertex(i, [math.cos(i), math.sin(i)])
+    for f, t in zip(src.tolist(), dst.tolist()):
+        G.addEdge(f, t)
+    G.getVertices()
+    return G
+
+
+def bench_memory(m= 200000):
+    """ It compares the memory used by a LatexGraph and a CompactLatexGraph with m edges and m/4 vertices """
+    n = max(m // 4, 1)
+    src, dst = random_edges(n, m)
+    print("memory: %d vertices, %d edges" % (n, m))
+    for cls in [LatexGraph, CompactLatexGraph]:
+        tracemalloc.start()
+        t = time.time()
+        G = build_graph(cls(), n, src, dst)
+        if isinstance(G, CompactLatexGraph):
+            G.csr()
+        elapsed = time.time() - t
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print("\t%-20s %10.1f MB (peak %8.1f MB) %6.1f bytes/edge %7.2f s" % (cls.__name__, current / 2**20, peak / 2**20, current / m, elapsed))
+        del G
+
+
+def bench_edgelist(m= 1000000):
+    """ It writes and reads back a '.el'/'.lxp' pair with m edges and m/4 vertices with a CompactLatexGraph """
+    n = max(m // 4, 1)
+    src, dst = random_edges(n, m)
+    folder = tempfile.mkdtemp()
+    print("edgelist: %d vertices, %d edges" % (n, m))
+
+    G = CompactLatexGraph()
+    G.addVerticesFromArrays(range(0, n), circleLayout(n))
+    G.addEdgesFromArrays(src, dst)
+    t = time.time()
+    G.printAsEdgelistfile("bench", folder)
+    print("\t%-20s %7.2f s (%.1f MB)" % ("write", time.time() - t, os.path.getsize(folder + "/bench.el") / 2**20))
+
+    t = time.time()
+    H = CompactLatexGraph()
+    H.readEdgeList("bench", True, folder)
+    H.csr()
+    print("\t%-20s %7.2f s" % ("read + csr", time.time() - t))
+    shutil.rmtree(folder)
+
+
+def bench_nkit_import(n= 100000):
+    """ It imports an Erdos-Renyi networkit graph with n nodes and average degree 10 """
+    NKitG = generators.ErdosRenyiGenerator(n, 10 / max(n, 1)).generate()
+    print("nkit_import: %d nodes, %d edges" % (n, NKitG.numberOfEdges()))
+    for cls in [LatexGraph, CompactLatexGraph]:
+        t = time.time()
+        G = cls()
+        G.readFromNKitGraph(NKitG)
+        print("\t%-20s %7.2f s" % (cls.__name__, time.time() - t))
+
+
+def bench_layout(n= 100000):
+    """
+    It places a random geometric-like graph (networkit's Mocnik generator) with n vertices, and a random graph with n
+    vertices and 3n edges with the multilevel layout and 30 iterations (with n = 100000 it took 298 s when the
+    quadtree's far field was computed on dense grids, and about 42 s on the occupied cells).
+    """
+    NKitG = generators.MocnikGenerator(2, n, 2.6).generate()
+    print("layout: %d vertices, %d edges" % (n, NKitG.numberOfEdges()))
+    for method in ["spectral", "fr", "multilevel"]:
+        G = CompactLatexGraph()
+        G.readFromNKitGraph(NKitG)
+        t = time.time()
+        P = G.layout(method)
+        src, dst, weights = G.edgeArrays()
+        length = np.sqrt(((P[src] - P[dst])**2).sum(axis=1))
+        print("\t%-20s %7.2f s (edges' length: median %.2f, 90%% %.2f)" % (method, time.time() - t, np.median(length), np.percentile(length, 90)))
+
+    G = CompactLatexGraph()
+    G.addVerticesFromArrays(range(0, n), np.zeros((n, 2)))
+    src, dst = random_edges(n, 3 * n)
+    G.addEdgesFromArrays(src, dst)
+    t = time.time()
+    P = G.layout("multilevel", iterations= 30)
+    length = np.sqrt(((P[src] - P[dst])**2).sum(axis=1))
+    print("\t%-20s %7.2f s (edges' length: median %.2f, 90%% %.2f)" % ("random, 3n edges", time.time() - t, np.median(length), np.percentile(length, 90)))
+
+
+def bench_culling(n= 200000):
+    """ It prints a zoomed-in window (1% of the area) of a random graph with n vertices with and without culling """
+    rng = np.random.default_rng(0)
+    G = CompactLatexGraph()
+    G.addVerticesFromArrays(range(0, n), rng.uniform(0, 100, (n, 2)))
+    src, dst = random_edges(n, 2 * n)
+    G.addEdgesFromArrays(src, dst)
+    G.clip_params = [[45, 45], [55, 55]]
+    print("culling: %d vertices, %d edges" % (n, G.numEdges()))
+    for culling in [False, True]:
+        G.culling = culling
+        output = io.StringIO()
+        t = time.time()
+        G.printTikz(output)
+        print("\tculling=%-12s %7.2f s %8.1f MB (culled %d nodes, %d edges)" % (culling, time.time() - t, len(output.getvalue()) / 2**20, G.culled[0], G.culled[1]))
+
+
+def bench_coalesce(m= 20000):
+    """
+    It compares the .tex size and the pdflatex time (if pdflatex is installed) of a random graph with m edges printed
+    with one '\\draw' per edge and with the coalesced paths.
+    """
+    n = max(m // 4, 1)
+    rng = np.random.default_rng(0)
+    G = CompactLatexGraph()
+    G.addVerticesFromArrays(range(0, n), rng.uniform(0, 20, (n, 2)))
+    src, dst = random_edges(n, m)
+    G.addEdgesFromArrays(src, dst)
+    G.node_style = "little"
+    G.edges_style = "thiny"
+    folder = tempfile.mkdtemp()
+    print("coalesce: %d vertices, %d edges" % (n, G.numEdges()))
+    for coalesce in [False, True]:
+        G.coalesce = coalesce
+        path = folder + "/coalesce_%d.tex" % coalesce
+        with open(path, "w") as fp:
+            writeTikz(iter_tikz_preview([G], []), fp)
+        if shutil.which("pdflatex") != None:
+            t = time.time()
+            subprocess.run(["pdflatex", "-interaction=batchmode", "-output-directory", folder, path], stdout=subprocess.DEVNULL)
+            compile_time = "%7.2f s" % (time.time() - t)
+        else:
+            compile_time = "(pdflatex not found)"
+        print("\tcoalesce=%-10s %8.2f MB %s" % (coalesce, os.path.getsize(path) / 2**20, compile_time))
+    shutil.rmtree(folder)
+
+
+def bench_structural_hash(m= 1000000):
+    """
+    It computes the structural hash of a random graph with m edges and m/4 vertices, and finds the duplicates among
+    2000 small random graphs (relabeled copies of 200 graphs) with an exact StructuralIndex.
+    """
+    n = max(m // 4, 1)
+    src, dst = random_edges(n, m)
+    print("structural_hash: %d vertices, %d edges" % (n, m))
+    for cls in [LatexGraph, CompactLatexGraph]:
+        G = cls()
+        G.addVerticesFromArrays(range(0, n), np.zeros((n, 2)))
+        G.addEdgesFromArrays(src, dst)
+        t = time.time()
+        G.structural_hash()
+        print("\t%-20s %7.2f s" % (cls.__name__, time.time() - t))
+
+    rng = np.random.default_rng(0)
+    originals = [random_edges(30, 45, seed) for seed in range(0, 200)]
+    index = StructuralIndex(exact= True)
+    t = time.time()
+    for k in range(0, 2000):
+        src, dst = originals[k % 200]
+        perm = rng.permutation(30)
+        G = LatexGraph()
+        G.addVerticesFromArrays(range(0, 30), np.zeros((30, 2)))
+        G.addEdgesFromArrays(perm[src], perm[dst])
+        index.add(k, G)
+    groups = index.duplicates()
+    print("\tStructuralIndex      %7.2f s (2000 graphs, %d groups of duplicates)" % (time.time() - t, len(groups)))
+
+
+def bench_vex(n= 40):
+    """ It solves exactly the vertex expansion of a random 4-regular graph (union of two random cycles) with n vertices """
+    rng = np.random.default_rng(0)
+    G = LatexGraph()
+    for i in range(0, n):
+        G.addVertex(i, [0, 0])
+    for r in range(0, 2):
+        cycle = rng.permutation(n).tolist()
+        for f, t in zip(cycle, cycle[1:] + cycle[:1]):
+            G.addEdge(f, t)
+            G.addEdge(t, f)
+    print("vex: %d vertices" % n)
+    for workers in [1, None]:
+        t = time.time()
+        vex(G, workers= workers)
+        print("\tworkers=%-11s %7.2f s" % (workers, time.time() - t))
+
+
+def bench_lattice(side= 300):
+    """ It builds the lattice spanned by [2,1] and [1,3] in a side x side window and prints it """
+    L = LatexLattice()
+    L.set_x([-side / 2, side / 2])
+    L.set_y([-side / 2, side / 2])
+    t = time.time()
+    L.construct_lattice()
+    elapsed = time.time() - t
+    print("lattice: %d points" % L.graph.numVertices)
+    print("\tconstruct_lattice    %7.2f s" % elapsed)
+    t = time.time()
+    L.printTikz(io.StringIO())
+    print("\tprintTikz            %7.2f s" % (time.time() - t))
+
+
+def bench_corners(side= 100):
+    """ It tiles a side x side window with the fundamental domains of [2,1] and [1,3] and prints their corners """
+    L = LatexLattice()
+    L.set_x([-side / 2, side / 2])
+    L.set_y([-side / 2, side / 2])
+    L.set_corners_radius(0.3)
+    t = time.time()
+    L.add_all_corners_in_window()
+    print("corners: %d domains" % len(L.corners))
+    print("\tadd_all_corners      %7.2f s" % (time.time() - t))
+    out = io.StringIO()
+    t = time.time()
+    writeTikz(L.iter_overlay(), out)
+    print("\titer_overlay         %7.2f s (%.1f MB)" % (time.time() - t, len(out.getvalue()) / 2**20))
+
+
+def bench_matrix(n= 2000):
+    """ It prints a n x n LatexMatrix with labels and n written entries (its diagonal) """
+    t = time.time()
+    M = LatexMatrix(n, n)
+    M.lableon = [True, True]
+    M.gen_Matrix()
+    for i in range(0, n):
+        M.writeInEntry(i, i, i)
+    out = io.StringIO()
+    M.printTikz(out)
+    print("matrix: %d x %d" % (n, n))
+    print("\tbuild and printTikz  %7.2f s (%.1f MB)" % (time.time() - t, len(out.getvalue()) / 2**20))
+
+
+def bench_heatmap(n= 1000):
+    """ It prints the heatmap of a smooth n x n array (x^2 + y) with the default 8 colors """
+    x = np.linspace(0, 1, n)
+    t = time.time()
+    M = LatexMatrix.from_array(np.add.outer(x**2, x))
+    out = io.StringIO()
+    M.printTikz(out)
+    print("heatmap: %d x %d, %d rectangles" % (n, n, len(M.heatRectangles()[0])))
+    print("\tfrom_array and printTikz %7.2f s (%.1f MB)" % (time.time() - t, len(out.getvalue()) / 2**20))
+
+
+benchmarks = {
+    "memory": bench_memory,
+    "edgelist": bench_edgelist,
+    "nkit_import": bench_nkit_import,
+    "layout": bench_layout,
+    "culling": bench_culling,
+    "coalesce": bench_coalesce,
+    "structural_hash": bench_structural_hash,
+    "vex": bench_vex,
+    "lattice": bench_lattice,
+    "corners": bench_corners,
+    "matrix": bench_matrix,
+    "heatmap": bench_heatmap,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        args = [int(a) for a in sys.argv[2:]]
+        benchmarks[sys.argv[1]](*args)
+    else:
+        for fn in benchmarks.values():
+            fn()
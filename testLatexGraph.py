@@ -0,0 +1,703 @@
+#  Copyright 2022 Lorenzo Pichetti lori.pichi@gmail.com
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+Checks of the LatexGraph classes against simple reference implementations. Run them with 'python3 testLatexGraph.py'
+(or 'make test').
+"""
+
+import contextlib
+import io
+import itertools
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from LatexGraph import *
+from CompactGraph import CompactLatexGraph
+import Expander
+import GraphHash
+import GraphLayout
+import LatexLattices
+from LatexMatrices import LatexMatrix, interpolateColors
+
+
+def path(n, style= None):
+    G = LatexGraph()
+    for i in range(0, n):
+        G.addVertex(i, [i, 0])
+    for i in range(1, n):
+        G.addEdge(i - 1, i, c=style)
+    return G
+
+
+class TestComposition(unittest.TestCase):
+    def setUp(self):
+        self.A = path(3)
+        self.A.addCustomTikzStyle("mys", "edge", draw="red", line_width=2)
+        self.B = path(2)
+
+    def test_add_keeps_custom_styles(self):
+        self.B.addCustomTikzStyle("bstyle", "edge", draw="blue", line_width=1)
+        O = self.A + self.B
+        self.assertEqual([s.name for s in O.custom_tikz_styles], ["mys", "bstyle"])
+        self.assertFalse(self.A.isStyleDefined("bstyle"))
+        self.assertFalse(self.B.isStyleDefined("mys"))
+        self.assertEqual([s.name for s in self.A.custom_tikz_styles], ["mys"])
+        compose([self.B, self.A])
+        self.assertFalse(self.A.isStyleDefined("bstyle"))
+        self.assertFalse(self.B.isStyleDefined("mys"))
+        self.assertTrue(O.isStyleDefined("mys"))
+        preambles = "".join(iter_tikz_preambles(O.custom_tikz_styles))
+        self.assertIn("mys", preambles)
+
+    def test_add_does_not_change_the_registries(self):
+        self.B.addCustomTikzStyle("bstyle", "edge", draw="blue", line_width=1)
+        before = (dict(self.A.styles.custom), dict(self.A.styles.defined), list(self.A.styles.names))
+        O = self.A + self.B
+        self.assertIsNot(O.styles, self.A.styles)
+        self.assertEqual((dict(self.A.styles.custom), dict(self.A.styles.defined), list(self.A.styles.names)), before)
+        self.assertEqual(list(self.B.styles.custom), ["bstyle"])
+        self.assertTrue(O.isStyleDefined("bstyle"))
+
+    def test_compose_keeps_custom_styles(self):
+        O = compose([self.A, self.B, self.A], ["A", "B", "C"])
+        self.assertEqual([s.name for s in O.custom_tikz_styles], ["mys"])
+        self.assertEqual(self.A.numVertices, 3)
+        self.assertEqual(O.numVertices, 8)
+        self.assertIn(("C", 2), O)
+
+    def test_vertex_keys(self):
+        self.assertEqual(vertexKey(("panel", 3)), "panel/3")
+        self.assertEqual(vertexKey(("a", ("b", 1))), "a/b/1")
+        with self.assertRaises(ValueError):
+            vertexKey(("a/b", "c"))
+        O = compose([compose([self.A], ["A"]), self.B], ["X", "Y"])
+        self.assertIn(("X", "A", 2), O)
+
+
+class TestNetworkit(unittest.TestCase):
+    def test_vertex_added_twice(self):
+        G = path(2)
+        G.updateNetworkitGraph()
+        G.addVertex(2, [2, 0])
+        G.addVertex(2, [2, 1])
+        G.addEdge(1, 2)
+        G.updateNetworkitGraph()
+        self.assertEqual(G.nkitIds, ["0", "1", "2"])
+        self.assertEqual(G.nkitGraph.numberOfNodes(), 3)
+
+
+    def test_default_is_undirected(self):
+        G = path(3)
+        G.addEdge(1, 0)
+        G.updateNetworkitGraph()
+        self.assertFalse(G.nkitGraph.isDirected())
+        out = io.StringIO()
+        G.printTikz(out)
+        self.assertEqual(out.getvalue().count("(1.center) to (0.center)"), 1)
+        G.directed = True
+        G.updateNetworkitGraph()
+        self.assertTrue(G.nkitGraph.isDirected())
+        G.directed = False
+        out = io.StringIO()
+        G.printTikz(out)
+        self.assertNotIn("(1.center) to (0.center)", out.getvalue())
+        self.assertIn("% removed 1 duplicated undirected edges", out.getvalue())
+        self.assertNotIn("% removed", tikz(path(3)))
+        H = path(3)
+        H.directed = False
+        self.assertNotIn("% removed", tikz(H))
+        self.assertEqual(combineDirected([None, False]), False)
+        self.assertEqual((path(2) + path(2)).directed, None)
+
+    def test_highlight_bins(self):
+        G = path(4)
+        G.updateNetworkitGraph()
+        classes = G.highlightByScore([0.1, 0.5, 0.9, 0.2], ["little", "littlered"], bins=[0.4])
+        self.assertEqual(classes.tolist(), [0, 1, 1, 0])
+        with self.assertRaises(ValueError):
+            G.highlightByScore([0.1, 0.5, 0.9, 0.2], ["little", "littlered"], bins=[0.3, 0.6])
+
+
+class TestCulling(unittest.TestCase):
+    def test_culled_comment(self):
+        G = path(5)
+        G.cull_margin = 0
+        G.clip_params = [[-1, -1], [10, 1]]
+        self.assertNotIn("culled", tikz(G))
+        self.assertEqual(G.culled, [0, 0])
+        G.clip_params = [[-1, -1], [1.5, 1]]
+        self.assertIn("% culled 2 nodes and 2 edges", tikz(G))
+
+
+def randomGraph(G, n, m, seed= 0):
+    """ It fills G with n vertices and m random edges (with some names and styles), in a deterministic order """
+    rng = np.random.default_rng(seed)
+    for i in range(0, n):
+        G.addVertex(i, rng.random(2).round(3).tolist(), i if i % 3 == 0 else None, "little" if i % 4 == 0 else None)
+    for f, t in zip(rng.integers(0, n, m).tolist(), rng.integers(0, n, m).tolist()):
+        G.addEdge(f, t, c="thiny" if (f + t) % 5 == 0 else None)
+    G.node_style = "wstyle"
+    G.edges_style = "simple"
+    return G
+
+
+def tikz(G):
+    out = io.StringIO()
+    G.printTikz(out)
+    return out.getvalue()
+
+
+class TestCompactGraph(unittest.TestCase):
+    def test_same_tikz(self):
+        for coalesce in [False, True]:
+            G = randomGraph(LatexGraph(), 50, 200)
+            C = randomGraph(CompactLatexGraph(), 50, 200)
+            G.coalesce = C.coalesce = coalesce
+            self.assertEqual(tikz(C), tikz(G))
+            self.assertEqual(C.getVertices(), G.getVertices())
+            for a, b in zip(C.edgeArrays()[0:2], G.edgeArrays()[0:2]):
+                self.assertEqual(a.tolist(), b.tolist())
+
+    def test_bulk_vertices_with_repeated_keys(self):
+        C = CompactLatexGraph()
+        C.addVerticesFromArrays([0, 1], [[0, 0], [1, 1]])
+        C.addEdge(0, 1)
+        C.addVerticesFromArrays([2, 2, 3], [[2, 2], [5, 5], [3, 3]], ["a", "b", "c"])
+        self.assertEqual(C.getVertices(), ["0", "1", "2", "3"])
+        self.assertEqual(C.positionArray(["2"]).tolist(), [[5, 5]])
+        self.assertEqual(C.getVertex(2).name, "b")
+        C.addVerticesFromArrays([1, 4], [[7, 7], [4, 4]])
+        self.assertEqual(C.numVertices, 5)
+        self.assertEqual(C.positionArray(["1"]).tolist(), [[7, 7]])
+        self.assertEqual(C.numEdges(), 1)
+
+
+class TestEdgeLists(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="latexgraphs_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def write(self, name, text):
+        with open(os.path.join(self.folder, name), "w") as fp:
+            fp.write(text)
+
+    def test_round_trip(self):
+        G = randomGraph(LatexGraph(), 30, 80)
+        for compress in [False, True]:
+            G.printAsEdgelistfile("g", self.folder, compress)
+            for H in [LatexGraph(), CompactLatexGraph()]:
+                H.readEdgeList("g", True, self.folder)
+                self.assertEqual(H.numVertices, 30)
+                self.assertTrue(np.allclose(H.positionArray(), G.positionArray(), atol=1e-6))
+                for a, b in zip(H.edgeArrays()[0:2], G.edgeArrays()[0:2]):
+                    self.assertEqual(sorted(a.tolist()), sorted(b.tolist()))
+                self.assertEqual(sorted(zip(*H.edgeArrays()[0:2])), sorted(zip(*G.edgeArrays()[0:2])))
+            os.remove(os.path.join(self.folder, "g.el" + (".gz" if compress else "")))
+            os.remove(os.path.join(self.folder, "g.lxp" + (".gz" if compress else "")))
+
+    def test_weights_and_comments(self):
+        self.write("w.el", "# comment\n0 1 2.5\n\n1 2 0.5\n")
+        src, dst, weights = loadEdgeListArrays(os.path.join(self.folder, "w.el"))
+        self.assertEqual((src.tolist(), dst.tolist(), weights.tolist()), ([0, 1], [1, 2], [2.5, 0.5]))
+
+    def test_small_chunks(self):
+        edges = [(i, (i * 7) % 100) for i in range(0, 500)]
+        self.write("c.el", "".join("%d %d\n" % e for e in edges))
+        table = loadNumberArray(os.path.join(self.folder, "c.el"), np.int64, chunk_size=64)
+        self.assertEqual([tuple(r) for r in table.tolist()], edges)
+
+    def test_malformed(self):
+        for text in ["0 1\n2\n3 4\n", "0 1\n2 x\n", "0 1\n" * 100 + "1 2 3\n"]:
+            self.write("bad.el", text)
+            with self.assertRaises(ValueError):
+                loadNumberArray(os.path.join(self.folder, "bad.el"), np.int64, chunk_size=64)
+
+
+def edgeSet(src, dst, directed, perm= None):
+    perm = np.arange(0, max(list(src) + list(dst) + [-1]) + 1) if perm is None else np.asarray(perm)
+    pairs = zip(perm[np.asarray(src, dtype=np.int64)].tolist(), perm[np.asarray(dst, dtype=np.int64)].tolist())
+    return {(f, t) if directed else (min(f, t), max(f, t)) for f, t in pairs}
+
+
+class TestStructuralHash(unittest.TestCase):
+    def test_relabeled_graphs(self):
+        rng = np.random.default_rng(2)
+        for directed in [False, True]:
+            for trial in range(0, 20):
+                n = int(rng.integers(5, 40))
+                src, dst = rng.integers(0, n, 2 * n), rng.integers(0, n, 2 * n)
+                perm = rng.permutation(n)
+                order = rng.permutation(len(src))
+                src2, dst2 = perm[src][order], perm[dst][order]
+                self.assertEqual(GraphHash.structuralHash(n, src, dst, directed), GraphHash.structuralHash(n, src2, dst2, directed))
+                mapping = GraphHash.isomorphism(n, src, dst, n, src2, dst2, directed)
+                self.assertIsNotNone(mapping)
+                self.assertEqual(sorted(mapping.tolist()), list(range(0, n)))
+                self.assertEqual(edgeSet(src, dst, directed, mapping), edgeSet(src2, dst2, directed))
+
+    def test_brute_force(self):
+        rng = np.random.default_rng(3)
+        for trial in range(0, 60):
+            # a relabeled copy of a random graph with 5 vertices, with an edge moved in half of the trials
+            n = 5
+            src1, dst1 = rng.integers(0, n, 5), rng.integers(0, n, 5)
+            perm = rng.permutation(n)
+            src2, dst2 = perm[src1], perm[dst1]
+            if trial % 4 < 2:
+                src2[0], dst2[0] = rng.integers(0, n, 2)
+            directed = trial % 2 == 1
+            E1, E2 = edgeSet(src1, dst1, directed), edgeSet(src2, dst2, directed)
+            expected = any(edgeSet(src1, dst1, directed, perm) == E2 for perm in itertools.permutations(range(0, n)))
+            mapping = GraphHash.isomorphism(n, src1, dst1, n, src2, dst2, directed)
+            self.assertEqual(mapping is not None, expected)
+            if expected:
+                self.assertEqual(edgeSet(src1, dst1, directed, mapping), E2)
+                self.assertEqual(GraphHash.structuralHash(n, src1, dst1, directed), GraphHash.structuralHash(n, src2, dst2, directed))
+
+    def test_regular_graphs(self):
+        # K3,3 and the triangular prism are 3-regular with 6 vertices: same WL hash, but not isomorphic
+        src1, dst1 = [0, 0, 0, 1, 1, 1, 2, 2, 2], [3, 4, 5, 3, 4, 5, 3, 4, 5]
+        src2, dst2 = [0, 1, 2, 3, 4, 5, 0, 1, 2], [1, 2, 0, 4, 5, 3, 3, 4, 5]
+        self.assertEqual(GraphHash.structuralHash(6, src1, dst1), GraphHash.structuralHash(6, src2, dst2))
+        self.assertIsNone(GraphHash.isomorphism(6, src1, dst1, 6, src2, dst2))
+
+    def test_latex_graphs(self):
+        G = randomGraph(LatexGraph(), 30, 60)
+        H = LatexGraph()
+        rng = np.random.default_rng(4)
+        perm = rng.permutation(30)
+        for i in rng.permutation(30).tolist():
+            H.addVertex("v%d" % perm[i], [0, 0])
+        for f, t in zip(*G.edgeArrays()[0:2]):
+            H.addEdge("v%d" % perm[f], "v%d" % perm[t])
+        self.assertEqual(G.structural_hash(), H.structural_hash())
+        mapping = G.isomorphism(H)
+        self.assertEqual(len(mapping), 30)
+        ids = G.getVertices()
+        for f, t in zip(*G.edgeArrays()[0:2]):
+            self.assertIn(H.getVertex(mapping[ids[t]]), H.getVertex(mapping[ids[f]]).connectedTo)
+        index = StructuralIndex(exact= True)
+        self.assertEqual(index.add("G", G), "G")
+        self.assertEqual(index.add("H", H), "G")
+        self.assertEqual(index.add("P", path(30)), "P")
+        self.assertEqual(index.duplicates(), [["G", "H"]])
+
+
+def arrayGraph(n, src, dst):
+    G = LatexGraph()
+    for i in range(0, n):
+        G.addVertex(i, [i, 0])
+    for f, t in zip(src, dst):
+        G.addEdge(int(f), int(t))
+    return G
+
+
+def bruteExpansions(n, src, dst, max_size= None):
+    """ The pairs (|N(U) minus U|, U) of all the sets U with 1 <= |U| <= max_size (by default floor(n/2) - 1) """
+    out = [set() for i in range(0, n)]
+    for f, t in zip(src, dst):
+        out[int(f)].add(int(t))
+    max_size = n // 2 - 1 if max_size == None else max_size
+    for size in range(1, max_size + 1):
+        for U in itertools.combinations(range(0, n), size):
+            yield len(set().union(*[out[u] for u in U]) - set(U)), set(U)
+
+
+def quiet(f, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return f(*args, **kwargs)
+
+
+class TestExpansion(unittest.TestCase):
+    def randomGraphs(self, count, seed):
+        rng = np.random.default_rng(seed)
+        for trial in range(0, count):
+            n = int(rng.integers(4, 11))
+            m = int(rng.integers(n, 3 * n))
+            src, dst = rng.integers(0, n, m), rng.integers(0, n, m)
+            if trial % 2 == 0:
+                src, dst = np.concatenate((src, dst)), np.concatenate((dst, src))
+            yield n, src, dst
+
+    def test_vex(self):
+        for n, src, dst in self.randomGraphs(40, 5):
+            G = arrayGraph(n, src, dst)
+            positive = [t for t, U in bruteExpansions(n, src, dst) if t > 0]
+            U = quiet(Expander.vex, G, workers=1)
+            if len(positive) == 0:
+                self.assertIsNone(U)
+                continue
+            self.assertTrue(1 <= len(U) <= n // 2 - 1)
+            self.assertEqual(Expander.vertex_expansion(G, set(U), out=False), min(positive))
+
+    def test_batch(self):
+        for n, src, dst in self.randomGraphs(10, 7):
+            G = arrayGraph(n, src, dst)
+            expected, subsets = zip(*bruteExpansions(n, src, dst, n - 1))
+            ids = G.getVertices()
+            X = Expander.membershipMatrix(G, [[ids[u] for u in U] for U in subsets])
+            for chunk in [1, 7, 1024]:
+                self.assertEqual(Expander.vertex_expansion_batch(G, X, chunk).tolist(), list(expected))
+                self.assertEqual(Expander.vertex_expansion_batch(G, X.toarray(), chunk).tolist(), list(expected))
+            self.assertEqual([Expander.vertex_expansion(G, set(ids[u] for u in U), out=False) for U in subsets[0:20]], list(expected[0:20]))
+        # repeated ids count once, and a matrix with the wrong number of rows is an error
+        G = path(4)
+        self.assertEqual(Expander.vertex_expansion_batch(G, Expander.membershipMatrix(G, [[1, 1], [0, 3]])).tolist(), [1, 1])
+        with self.assertRaises(ValueError):
+            Expander.vertex_expansion_batch(G, np.ones((3, 1)))
+
+    def test_estimate_bounds(self):
+        for n, src, dst in self.randomGraphs(20, 8):
+            G = arrayGraph(n, src, dst)
+            positive = [t for t, U in bruteExpansions(n, src, dst) if t > 0]
+            U, lower, upper = Expander.expansion_estimate(G, time_limit=0.05)
+            if len(positive) == 0 or U == None:
+                continue
+            self.assertTrue(1 <= len(U) <= n // 2 - 1)
+            self.assertEqual(Expander.vertex_expansion(G, U, out=False), upper)
+            self.assertLessEqual(lower, min(positive))
+            self.assertLessEqual(min(positive), upper)
+
+    def test_spectral_gap_and_sweep(self):
+        n = 30
+        cycle = arrayGraph(n, list(range(0, n)) + [(i + 1) % n for i in range(0, n)], [(i + 1) % n for i in range(0, n)] + list(range(0, n)))
+        lambda2, residual, fiedler = Expander.spectral_gap(cycle, tol=1e-10, maxiter=5000)
+        self.assertAlmostEqual(lambda2, 2 - 2 * math.cos(2 * math.pi / n), places=6)
+        self.assertLess(residual, 1e-6)
+
+        for n, src, dst in self.randomGraphs(10, 9):
+            G = arrayGraph(n, src, dst)
+            fiedler = np.random.default_rng(n).standard_normal(n)
+            value, U = Expander.fiedler_sweep(G, fiedler)
+            if U is None:
+                continue
+            # the expansions of all the prefixes of the two orders
+            prefixes = [order[:k] for order in [np.argsort(fiedler, kind="stable"), np.argsort(-fiedler, kind="stable")] for k in range(1, n // 2)]
+            expansions = Expander.vertex_expansion_batch(G, Expander.membershipMatrix(G, prefixes))
+            self.assertEqual(value, expansions[expansions > 0].min())
+            self.assertEqual(Expander.vertex_expansion_batch(G, U[:, None])[0], value)
+            value, V = Expander.expansion_local_search(G, U, time_limit=0.02)
+            self.assertTrue(1 <= V.sum() <= n // 2 - 1)
+            self.assertEqual(Expander.vertex_expansion_batch(G, V[:, None])[0], value)
+
+    def test_vex_workers(self):
+        rng = np.random.default_rng(6)
+        n = 26
+        src = np.concatenate([p for p in [rng.permutation(n), rng.permutation(n)]])
+        dst = np.concatenate([np.roll(src[0:n], 1), np.roll(src[n:], 1)])
+        G = arrayGraph(n, np.concatenate((src, dst)), np.concatenate((dst, src)))
+        self.assertEqual(quiet(Expander.vex, G, workers=2), quiet(Expander.vex, G, workers=1))
+
+
+def brutePoints(a, b, low, high):
+    """ The set of the coefficients (i, j) such that i*a + j*b is in the rectangle [low, high] """
+    B = np.array([a, b], dtype=float).T
+    corners = np.array([[low[0], low[1]], [low[0], high[1]], [high[0], low[1]], [high[0], high[1]]], dtype=float)
+    ij = np.linalg.solve(B, corners.T)
+    found = set()
+    for i in range(math.floor(ij[0].min()) - 1, math.ceil(ij[0].max()) + 2):
+        for j in range(math.floor(ij[1].min()) - 1, math.ceil(ij[1].max()) + 2):
+            p = [i * a[0] + j * b[0], i * a[1] + j * b[1]]
+            if low[0] <= p[0] <= high[0] and low[1] <= p[1] <= high[1]:
+                found.add((i, j))
+    return found
+
+
+class TestLattices(unittest.TestCase):
+    bases = [([2, 1], [1, 3]), ([1, 0], [0, 1]), ([1, 0], [57, 1]), ([5, 8], [8, 13]), ([3, -1], [-2, 4]), ([0, 2], [3, 0])]
+
+    def test_lattice_points(self):
+        for a, b in self.bases:
+            L = LatexLattices.LatexLattice()
+            L.set_a(a)
+            L.set_b(b)
+            L.set_x([-7, 4])
+            L.set_y([-3, 6])
+            for low, high in [(None, None), ([-7.5, -3], [4, 6.25]), ([0, 0], [0, 0]), ([10, 10], [10.5, 10.5])]:
+                coefficients, points = L.lattice_points(np.array(low) if low != None else None, np.array(high) if high != None else None)
+                if low == None:
+                    # the visible points (see 'is_visible')
+                    low = [L.x[0] - L.minx, L.y[0] - L.miny]
+                    high = [L.x[1] + L.minx, L.y[1] + L.miny]
+                    self.assertTrue(all(L.is_visible(p) for p in points.tolist()))
+                expected = brutePoints(a, b, low, high)
+                self.assertEqual(sorted(map(tuple, coefficients.tolist())), sorted(expected))
+                self.assertEqual(points.tolist(), (coefficients @ np.array([a, b])).tolist())
+
+            # the graph has the visible points, their neighbors, and one edge from every visible point to each neighbor
+            L.construct_lattice()
+            coefficients, points = L.lattice_points()
+            positions = set(map(tuple, L.graph.positionArray().tolist()))
+            self.assertTrue(set(map(tuple, points.tolist())) <= positions)
+            self.assertIn((0.0, 0.0), positions)
+            self.assertEqual(L.graph.numEdges(), 4 * len(points))
+
+        L = LatexLattices.LatexLattice()
+        L.set_b([4, 2])
+        with self.assertRaises(ValueError):
+            L.lattice_points()
+
+
+    def test_memoized_parts(self):
+        L = LatexLattices.LatexLattice()
+        first = tikz(L)
+        versions = (L.graph.version, L.axes.version, L.base.version)
+        built = dict(L.built)
+        self.assertEqual(tikz(L), first)
+        self.assertEqual((L.graph.version, L.axes.version, L.base.version), versions)
+        G = L.generatesLatexGraph()
+        self.assertIs(L.generatesLatexGraph(), G)
+        self.assertEqual(L.contentHash(), L.contentHash())
+
+        # a new basis rebuilds the graph and the base, but not the axes
+        L.set_a([3, 1])
+        self.assertNotEqual(tikz(L), first)
+        self.assertNotEqual(L.built["graph"], built["graph"])
+        self.assertNotEqual(L.built["base"], built["base"])
+        self.assertEqual(L.built["axes"], built["axes"])
+        self.assertEqual(L.axes.version, versions[1])
+        self.assertIsNot(L.generatesLatexGraph(), G)
+        M = LatexLattices.LatexLattice()
+        M.set_a([3, 1])
+        self.assertEqual(tikz(M), tikz(L))
+        self.assertEqual(M.contentHash(), L.contentHash())
+
+        L.set_a([2, 1])
+        self.assertEqual(tikz(L), first)
+        L.set_x([-3, 3])
+        window = tikz(L)
+        self.assertNotEqual(window, first)
+        self.assertNotEqual(L.built["axes"], built["axes"])
+        L.invalidate()
+        self.assertEqual(L.built, {})
+        self.assertEqual(tikz(L), window)
+
+    def test_gauss_reduction(self):
+        rng = np.random.default_rng(10)
+        bases = self.bases + [(rng.integers(-30, 31, 2).tolist(), rng.integers(-30, 31, 2).tolist()) for i in range(0, 30)]
+        for a, b in bases:
+            if a[0] * b[1] - a[1] * b[0] == 0:
+                continue
+            u, v, U = LatexLattices.gaussReduce(a, b)
+            dot = lambda x, y: x[0] * y[0] + x[1] * y[1]
+            self.assertLessEqual(dot(u, u), dot(v, v))
+            self.assertLessEqual(2 * abs(dot(u, v)), dot(u, u))
+            self.assertEqual(abs(U[0][0] * U[1][1] - U[0][1] * U[1][0]), 1)
+            self.assertEqual(list(u), [U[0][0] * a[0] + U[1][0] * b[0], U[0][0] * a[1] + U[1][0] * b[1]])
+            self.assertEqual(list(v), [U[0][1] * a[0] + U[1][1] * b[0], U[0][1] * a[1] + U[1][1] * b[1]])
+            # u is a shortest vector: no point of the lattice but the origin is in the square of side 2|u|
+            r = math.sqrt(dot(u, u))
+            lengths = [dot(p, p) for p in ([i * a[0] + j * b[0], i * a[1] + j * b[1]] for i, j in brutePoints(a, b, [-r, -r], [r, r])) if p != [0, 0]]
+            self.assertEqual(min(lengths), dot(u, u))
+            L = LatexLattices.LatexLattice()
+            L.set_a(a)
+            L.set_b(b)
+            self.assertEqual(L.shortest_vector(), u)
+            self.assertEqual(L.determinant(), abs(u[0] * v[1] - u[1] * v[0]))
+
+    def overlayCoverage(self, out, P, r):
+        """ The points of P covered by the '\\fill' paths of 'iter_overlay' (sectors, circles, or clipped scopes) """
+        number = r"(-?[\d.]+)"
+        covered = np.zeros(len(P), dtype=bool)
+        for scope in re.findall(r"\\begin\{scope\}(.*?)\\end\{scope\}", out, re.S):
+            clip = np.array(re.findall(r"\(%s,%s\) --" % (number, number), scope), dtype=float)
+            c = (P - clip[0]) @ np.linalg.inv(np.array([clip[1] - clip[0], clip[3] - clip[0]]).T).T
+            inside = np.all((c >= 0) & (c <= 1), axis=1)
+            for x, y in re.findall(r"\(%s,%s\) circle" % (number, number), scope):
+                covered |= inside & (np.hypot(P[:, 0] - float(x), P[:, 1] - float(y)) <= r)
+        out = re.sub(r"\\begin\{scope\}.*?\\end\{scope\}", "", out, flags=re.S)
+        for x, y in re.findall(r"\(%s,%s\) circle" % (number, number), out):
+            covered |= np.hypot(P[:, 0] - float(x), P[:, 1] - float(y)) <= r
+        sector = r"\(%s,%s\) -- \+\+\(%s:%s\) arc\[start angle=%s, end angle=%s" % ((number,) * 6)
+        for x, y, a, radius, start, end in re.findall(sector, out):
+            d = P - [float(x), float(y)]
+            angle = (np.degrees(np.arctan2(d[:, 1], d[:, 0])) - float(start)) % 360
+            covered |= (np.hypot(d[:, 0], d[:, 1]) <= r) & (angle <= float(end) - float(start) + 1e-9)
+        return covered
+
+    def test_corners_overlay(self):
+        rng = np.random.default_rng(11)
+        P = rng.uniform(-6, 6, (6000, 2))
+        for a, b, r in [([2, 1], [1, 3], 0.4), ([1, 3], [2, 1], 0.4), ([3, 0], [1, 2], 0.5), ([2, 1], [1, 3], 2.0)]:
+            L = LatexLattices.LatexLattice()
+            L.set_a(a)
+            L.set_b(b)
+            L.set_corners_radius(r)
+            L.overlay_chunk = 7
+            L.add_all_corners_in_window()
+            L.add_corners_parallelepid(0, 0)
+            L.add_corners_parallelepid(5, 5)
+            out = "".join(L.iter_overlay())
+            # the reference: the disks of the corners of every domain, clipped to the domain
+            expected = np.zeros(len(P), dtype=bool)
+            inverse = np.linalg.inv(np.array([a, b], dtype=float).T)
+            for t in np.unique(np.array(L.corners, dtype=float), axis=0):
+                c = (P - t) @ inverse.T
+                inside = np.all((c >= 0) & (c <= 1), axis=1)
+                for corner in [[0, 0], a, [a[0] + b[0], a[1] + b[1]], b]:
+                    expected |= inside & (np.hypot(P[:, 0] - t[0] - corner[0], P[:, 1] - t[1] - corner[1]) <= r)
+            self.assertGreater(expected.sum(), 100)
+            self.assertEqual((self.overlayCoverage(out, P, r) != expected).sum(), 0)
+            self.assertTrue(all(line.count(" circle ") + line.count(" arc[") <= 7 * 4 for line in out.splitlines()))
+
+def matrixNodes(text):
+    """ The set of the (x, y, text, style) of the nodes printed as '\\path' commands (LatexMatrix) or as '\\node' lines """
+    nodes = set()
+    number = r"(-?[\d.]+)"
+    for style, path in re.findall(r"\\path \[every node/\.style=\{style=([^}]*)\}\] (.*);", text):
+        for x, y, label in re.findall(r"\(%s,%s\) node \{([^}]*)\}" % (number, number), path):
+            nodes.add((float(x), float(y), label, style))
+    for style, x, y, label in re.findall(r"\\node \[style=([^\]]*)\] \([^)]*\) at \(%s,%s\) \{([^}]*)\}" % (number, number), text):
+        if label != "":
+            nodes.add((float(x), float(y), label, style))
+    return nodes
+
+
+class TestMatrices(unittest.TestCase):
+    def writtenMatrix(self):
+        M = LatexMatrix(5, 7)
+        M.gen_Matrix()
+        M.lableon = [True, True]
+        rng = np.random.default_rng(12)
+        for k in range(0, 20):
+            i, j = int(rng.integers(0, 5)), int(rng.integers(0, 7))
+            M.writeInEntry(i, j, "e%d" % k, ["little", "littlered", None][k % 3])
+        return M
+
+    def test_same_drawing_as_the_graph(self):
+        for unit, shift in [(1, [0, 0]), (0.5, [2, -1]), (1.5, [0.25, 3])]:
+            M = self.writtenMatrix()
+            M.coalesce_chunk = 3
+            M.scale(unit)
+            M.translate(shift)
+            out = tikz(M)
+            self.assertEqual(matrixNodes(out), matrixNodes(tikz(M.generatesLatexGraph())))
+            self.assertTrue(all(line.count(" node ") <= 3 for line in out.splitlines()))
+
+            # the lines of the grid command are the edges of the graph
+            step, x0, y0, w, h = map(float, re.search(r"step=([\d.]+), shift=\{\((-?[\d.]+),(-?[\d.]+)\)\}\] \(0,0\) grid \(([\d.]+),([\d.]+)\)", out).groups())
+            G = M.generatesLatexGraph()
+            rows = sorted(G.positionArray(["Rlx%d" % i for i in range(0, M.rows + 1)])[:, 1].round(6).tolist())
+            cols = sorted(G.positionArray(["Clx%d" % j for j in range(0, M.cols + 1)])[:, 0].round(6).tolist())
+            self.assertEqual([round(y0 + k * step, 6) for k in range(0, round(h / step) + 1)], rows)
+            self.assertEqual([round(x0 + k * step, 6) for k in range(0, round(w / step) + 1)], cols)
+
+    def test_entries(self):
+        M = self.writtenMatrix()
+        M.writeInEntry(4, 6, "last")
+        M.writeInEntry(4, 6, "again", "littlered")
+        self.assertEqual(M.entries[(4, 6)], ["again", "littlered"])
+        M.clearEntry(4, 6)
+        self.assertNotIn("again", tikz(M))
+        for i, j in [(5, 0), (0, 7), (-1, 2)]:
+            with self.assertRaises(ValueError):
+                M.writeInEntry(i, j, "out")
+        with self.assertRaises(ValueError):
+            M.writeInEntry(0, 0, "x", "undefinedstyle")
+        with self.assertRaises(ValueError):
+            M.rotate(30)
+        M.lableon = [False, False]
+        self.assertEqual(len([n for n in matrixNodes(tikz(M)) if n[3] == "none" and n[2].isdigit()]), 0)
+
+    def test_heat_rectangles(self):
+        rng = np.random.default_rng(13)
+        for shape, colors in [((1, 1), 1), ((6, 9), 2), ((20, 15), 3), ((30, 1), 4), ((1, 30), 4)]:
+            A = rng.integers(-1, colors, shape).astype(float)
+            A[A < 0] = np.nan
+            # a few big blocks of the same color, as in the smooth heatmaps
+            A[0:shape[0] // 2, 0:shape[1] // 2] = 0
+            M = LatexMatrix(*shape)
+            classes = M.setHeatmap(A, ["c%d" % k for k in range(0, colors)], "labels")
+            colors, rectangles = M.heatRectangles()
+            cover = np.full(shape, -1)
+            count = np.zeros(shape, dtype=np.int64)
+            for c, (r0, c0, r1, c1) in zip(colors.tolist(), rectangles.tolist()):
+                self.assertTrue(0 <= r0 < r1 <= shape[0] and 0 <= c0 < c1 <= shape[1])
+                cover[r0:r1, c0:c1] = c
+                count[r0:r1, c0:c1] += 1
+            self.assertEqual(cover.tolist(), classes.tolist())
+            self.assertEqual(count.tolist(), (classes >= 0).astype(np.int64).tolist())
+            runs = sum(1 for row in classes.tolist() for k, c in enumerate(row) if c >= 0 and (k == 0 or row[k - 1] != c))
+            self.assertLessEqual(len(colors), runs)
+
+            # the printed rectangles cover the same cells with their colors
+            M.unit = 0.5
+            M.translation = [1, 2]
+            printed = np.full(shape, -1)
+            for color, block in re.findall(r"\\fill \[fill=([^\]]*)\]\n(.*?)\n\t\t;", "".join(M.iter_heatmap()), re.S):
+                for x0, y0, x1, y1 in re.findall(r"\((-?[\d.]+),(-?[\d.]+)\) rectangle \((-?[\d.]+),(-?[\d.]+)\)", block):
+                    c0, r0, c1, r1 = [round(float(v) / 0.5) - t for v, t in zip([x0, y0, x1, y1], [1, 2, 1, 2])]
+                    printed[r0:r1, c0:c1] = int(color[1:])
+            self.assertEqual(printed.tolist(), classes.tolist())
+
+    def test_quantization(self):
+        A = np.array([[0.0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, np.nan]])
+        M = LatexMatrix(3, 4)
+        classes = M.setHeatmap(A, ["white", "red"], 4)
+        self.assertEqual(classes.tolist(), [[0, 0, 0, 1], [1, 2, 2, 2], [3, 3, 3, -1]])
+        self.assertEqual(M.colormap, interpolateColors(["white", "red"], 4))
+        self.assertEqual(interpolateColors(["white", "red"], 3), ["red!0!white", "red!50!white", "red!100!white"])
+        self.assertEqual(interpolateColors(["a", "b", "c"], 5), ["b!0!a", "b!50!a", "c!0!b", "c!50!b", "c!100!b"])
+        classes = M.setHeatmap(A, ["a", "b"], None)
+        self.assertEqual(classes.tolist(), [[0, 0, 0, 0], [0, 1, 1, 1], [1, 1, 1, -1]])
+        classes = M.setHeatmap(A, ["a", "b", "c"], [2, 7.5])
+        self.assertEqual(classes.tolist(), np.where(np.isnan(A), -1, np.digitize(np.nan_to_num(A), [2, 7.5])).tolist())
+        classes = M.setHeatmap(A, ["a", "b", "c"], "labels")
+        self.assertEqual(classes.tolist(), [[0, 1, 2, 0], [1, 2, 0, 1], [2, 0, 1, -1]])
+        with self.assertRaises(ValueError):
+            M.setHeatmap(A, ["a", "b"], [2, 7.5])
+        with self.assertRaises(ValueError):
+            M.setHeatmap(A[0:2], ["a", "b"])
+        M = LatexMatrix.from_array(np.full((100, 40), np.nan))
+        self.assertEqual(M.unit, 0.2)
+        self.assertEqual("".join(M.iter_heatmap()), "")
+
+class TestLayout(unittest.TestCase):
+    def test_barnes_hut_forces(self):
+        rng = np.random.default_rng(1)
+        core = rng.uniform(0, 30, (1500, 2))
+        for P in [core, np.concatenate((core, [[1000, 1000], [-800, 50]]))]:
+            mass = rng.uniform(1, 2, len(P))
+            exact = GraphLayout.exactRepulsiveForces(P, mass, 1.5)
+            depth = GraphLayout.quadtreeDepth(P)
+            for d in range(depth, min(depth + 2, 10) + 1):
+                F = GraphLayout.repulsiveForces(P, mass, 1.5, d)
+                self.assertLess(np.linalg.norm(F - exact) / np.linalg.norm(exact), 0.02)
+
+    def test_grid_layout(self):
+        side = 20
+        src = [i for i in range(0, side * side) if i % side < side - 1] + list(range(0, side * (side - 1)))
+        dst = [i + 1 for i in range(0, side * side) if i % side < side - 1] + list(range(side, side * side))
+        for method in ["circle", "spectral", "fr", "multilevel"]:
+            P = GraphLayout.computeLayout(side * side, src, dst, method, iterations=30, seed=3)
+            self.assertEqual(P.shape, (side * side, 2))
+            self.assertTrue(np.isfinite(P).all())
+            self.assertTrue(np.array_equal(P, GraphLayout.computeLayout(side * side, src, dst, method, iterations=30, seed=3)))
+            if method in ["fr", "multilevel"]:
+                # the neighbours are much closer than two random vertices
+                length = np.linalg.norm(P[src] - P[dst], axis=1)
+                far = np.linalg.norm(P[0:200] - P[200:400], axis=1)
+                self.assertLess(np.median(length) * 4, np.median(far))
+        with self.assertRaises(ValueError):
+            GraphLayout.computeLayout(3, [0], [1], "unknown")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+#  Copyright 2022 Lorenzo Pichetti lori.pichi@gmail.com
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+Checks of TexCompile against a stub TeX engine (a Python script written in a temporary directory), so that they run
+also when TeX is not installed. Run them with 'python3 testTexCompile.py' (or 'make test').
+
+The stub reads '<name>.tex' and, as a TeX engine would:
+    - with '\\error' in the source writes an error and its 'l.<n>' line in the log and exits with status 1;
+    - with '\\sleep' in the source sleeps (to test the timeout);
+    - otherwise writes '<name>.pdf' and a log with a LaTeX warning, and exits with status 0.
+"""
+
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from RenderCache import RenderCache
+from TexCompile import *
+
+
+STUB = """#!%s
+import sys, time
+name = sys.argv[-1][:-4]
+source = open(name + ".tex").read()
+with open(name + ".log", "w") as log:
+    log.write("This is the stub TeX engine\\n")
+    if "\\\\error" in source:
+        line = source[:source.index("\\\\error")].count("\\n") + 1
+        log.write("! Undefined control sequence.\\nl.%%d \\\\error\\n" %% line)
+        sys.exit(1)
+    if "\\\\sleep" in source:
+        log.flush()
+        time.sleep(30)
+    log.write("LaTeX Warning: Reference `x' on page 1 undefined on input line 2.\\n")
+with open(name + ".pdf", "w") as pdf:
+    pdf.write("%%PDF-1.4 stub " + str(len(source)) + "\\n")
+"""
+
+GOOD = "\\documentclass{article}\n\\begin{document}\nok\n\\end{document}\n"
+BAD = "\\documentclass{article}\n\\begin{document}\n\\error\n\\end{document}\n"
+SLOW = "\\documentclass{article}\n\\begin{document}\n\\sleep\n\\end{document}\n"
+
+
+class TestTexCompile(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp(prefix="latexgraphs_test_")
+        cls.engine = os.path.join(cls.folder, "stubtex")
+        with open(cls.engine, "w") as fp:
+            fp.write(STUB % sys.executable)
+        os.chmod(cls.engine, os.stat(cls.engine).st_mode | stat.S_IXUSR)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder, ignore_errors=True)
+
+    def test_success(self):
+        output = os.path.join(self.folder, "good")
+        result = runTexJob(GOOD, "good", output, engine=self.engine)
+        self.assertTrue(result.ok, result.report())
+        self.assertFalse(result.cached)
+        self.assertEqual(result.pdf, os.path.join(output, "good.pdf"))
+        self.assertTrue(os.path.exists(result.pdf))
+        self.assertEqual(len(result.warnings), 1)
+        self.assertIn("compiled in", result.report())
+
+    def test_error(self):
+        result = runTexJob(BAD, "bad", engine=self.engine)
+        self.assertFalse(result.ok)
+        self.assertEqual(result.returncode, 1)
+        self.assertIsNone(result.pdf)
+        self.assertEqual(len(result.errors), 1)
+        self.assertEqual(result.errors[0].message, "Undefined control sequence.")
+        self.assertEqual(result.errors[0].line, 3)
+        self.assertEqual(result.errors[0].context, "\\error")
+        self.assertIn("line 3", result.report())
+
+    def test_parse_log(self):
+        errors, warnings = parseTexLog("! Missing $ inserted.\n<inserted text>\nl.12 x^\n\nPackage tikz Warning: w\n")
+        self.assertEqual([(e.message, e.line, e.context) for e in errors], [("Missing $ inserted.", 12, "x^")])
+        self.assertEqual(warnings, ["Package tikz Warning: w"])
+
+    def test_timeout(self):
+        result = runTexJob(SLOW, "slow", engine=self.engine, timeout=0.5)
+        self.assertTrue(result.timed_out)
+        self.assertFalse(result.ok)
+        self.assertIn("timed out", result.report())
+
+    def test_missing_engine(self):
+        result = runTexJob(GOOD, "missing", engine=os.path.join(self.folder, "no_such_tex"))
+        self.assertFalse(result.ok)
+        self.assertIsNone(result.returncode)
+        self.assertIn("cannot run", result.errors[0].message)
+
+    def test_pool(self):
+        with TexCompilePool(workers=2, engine=self.engine) as pool:
+            future = pool.submit(GOOD, "single", os.path.join(self.folder, "pool"))
+            futures = pool.map([GOOD, BAD, GOOD], output_dir=os.path.join(self.folder, "pool"))
+            self.assertTrue(future.result().ok)
+            results = [f.result() for f in futures]
+        self.assertEqual([r.name for r in results], ["document0", "document1", "document2"])
+        self.assertEqual([r.ok for r in results], [True, False, True])
+        self.assertTrue(os.path.exists(os.path.join(self.folder, "pool", "document2.pdf")))
+
+    def test_cache(self):
+        cache = RenderCache(os.path.join(self.folder, "cache"))
+        first = compileTex(GOOD, "first", os.path.join(self.folder, "cache_out"), engine=self.engine, cache=cache)
+        self.assertTrue(first.ok and not first.cached)
+        with TexCompilePool(workers=1, engine=self.engine, cache=cache) as pool:
+            second = pool.submit(GOOD, "second", os.path.join(self.folder, "cache_out")).result()
+        self.assertTrue(second.ok and second.cached)
+        self.assertIn("render cache", second.report())
+        with open(first.pdf, "rb") as a, open(second.pdf, "rb") as b:
+            self.assertEqual(a.read(), b.read())
+        # the failed jobs are not cached
+        compileTex(BAD, "bad", engine=self.engine, cache=cache)
+        self.assertFalse(compileTex(BAD, "bad", engine=self.engine, cache=cache).cached)
+
+    def test_environment_engine(self):
+        env = dict(os.environ, LATEXGRAPHS_TEX=self.engine)
+        code = "import TexCompile; print(TexCompile.TEX_ENGINE); print(TexCompile.compileTex(%r).ok)" % GOOD
+        output = subprocess.run([sys.executable, "-c", code], env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                stdout=subprocess.PIPE, check=True).stdout.decode().split()
+        self.assertEqual(output, [self.engine, "True"])
+
+
+if __name__ == "__main__":
+    unittest.main()